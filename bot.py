@@ -7,7 +7,15 @@ import discord
 from discord.ext import commands
 
 import config
-from db.database import init_db
+from db.database import close_db, init_db
+from db.users import get_discord_ids_by_plex_username
+from plex import aioplex, http
+from plex.cache import registered_caches
+from plex.events import AlertEventSource, EventDispatcher, WebhookEventSource
+from plex.refresher import IndexRefresher
+from recommender.cowatch import CoWatchTrainer
+from utils import workers
+from utils.workers import LoopLagMonitor
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,16 +30,57 @@ class PlexBot(commands.Bot):
         if config.DISCORD_MEMBERS_INTENT:
             intents.members = True
         super().__init__(command_prefix="!", intents=intents)
+        self.index_refresher: IndexRefresher | None = None
+        self.event_dispatcher: EventDispatcher | None = None
+        self.cowatch_trainer: CoWatchTrainer | None = None
+        self.lag_monitor: LoopLagMonitor | None = None
 
     async def setup_hook(self) -> None:
+        workers.install_io_executor(asyncio.get_running_loop())
+        if config.LOOP_LAG_REPORT_INTERVAL:
+            self.lag_monitor = LoopLagMonitor(report_every=config.LOOP_LAG_REPORT_INTERVAL)
+            self.lag_monitor.start()
+
         await init_db()
         log.info("Database initialized.")
 
         await self.load_extension("cogs.auth")
         await self.load_extension("cogs.recommend")
         await self.load_extension("cogs.series")
+        await self.load_extension("cogs.digest")
         log.info("Cogs loaded.")
 
+        self.index_refresher = IndexRefresher(
+            registered_caches(),
+            concurrency=config.INDEX_REFRESH_CONCURRENCY,
+            idle_timeout=config.INDEX_IDLE_TIMEOUT,
+        )
+        self.index_refresher.start()
+        log.info("Index refresher started.")
+
+        if config.COWATCH_WEIGHT:
+            self.cowatch_trainer = CoWatchTrainer(
+                registered_caches(),
+                interval=config.COWATCH_TRAIN_INTERVAL,
+                k=config.COWATCH_K,
+            )
+            self.cowatch_trainer.start()
+            log.info("Co-watch trainer started.")
+
+        sources = []
+        if config.PLEX_WEBHOOK_PORT:
+            sources.append(WebhookEventSource(
+                config.PLEX_WEBHOOK_HOST, config.PLEX_WEBHOOK_PORT, secret=config.PLEX_WEBHOOK_SECRET
+            ))
+        if config.PLEX_TOKEN:
+            sources.append(AlertEventSource(config.PLEX_URL, config.PLEX_TOKEN))
+        if sources:
+            self.event_dispatcher = EventDispatcher(
+                registered_caches(), get_discord_ids_by_plex_username
+            )
+            await self.event_dispatcher.start(sources)
+            log.info("Plex event dispatcher started.")
+
         if config.DISCORD_GUILD_ID:
             guild = discord.Object(id=config.DISCORD_GUILD_ID)
             # Copy global commands into guild namespace, then sync to guild
@@ -46,6 +95,21 @@ class PlexBot(commands.Bot):
             await self.tree.sync()
             log.info("Slash commands synced globally (may take up to 1 hour to appear).")
 
+    async def close(self) -> None:
+        if self.event_dispatcher is not None:
+            await self.event_dispatcher.stop()
+        if self.index_refresher is not None:
+            await self.index_refresher.stop()
+        if self.cowatch_trainer is not None:
+            await self.cowatch_trainer.stop()
+        if self.lag_monitor is not None:
+            await self.lag_monitor.stop()
+        workers.shutdown()
+        await super().close()
+        await close_db()
+        await aioplex.close()
+        http.close()
+
     async def on_ready(self) -> None:
         log.info("Logged in as %s (ID: %s)", self.user, self.user.id)
         await self.change_presence(
@@ -7,10 +7,10 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-from plexapi.myplex import MyPlexAccount
-
 from db.users import delete_user, get_user, save_user
-from plex.auth import poll_for_token, start_pin_login
+from plex.aioplex import get_username
+from plex.auth import pin_poller, poll_for_token, start_pin_login
+from plex.cache import registered_caches
 from plex.client import invalidate_cache
 
 
@@ -20,6 +20,9 @@ class AuthCog(commands.Cog):
         # Track in-progress logins to prevent duplicates
         self._pending: set[int] = set()
 
+    async def cog_unload(self) -> None:
+        await pin_poller.stop()
+
     @app_commands.command(name="plex-login", description="Link your Plex account to get recommendations")
     async def plex_login(self, interaction: discord.Interaction) -> None:
         discord_id = str(interaction.user.id)
@@ -76,12 +79,8 @@ class AuthCog(commands.Cog):
                 return
 
             # Resolve username from the token
-            loop = asyncio.get_running_loop()
             try:
-                account = await loop.run_in_executor(
-                    None, lambda: MyPlexAccount(token=token)
-                )
-                username = account.username
+                username = await get_username(token)
             except Exception:
                 username = None
 
@@ -105,6 +104,8 @@ class AuthCog(commands.Cog):
         discord_id = str(interaction.user.id)
         deleted = await delete_user(discord_id)
         invalidate_cache(discord_id)
+        for cache in registered_caches():
+            cache.invalidate(discord_id)
 
         if deleted:
             await interaction.response.send_message(
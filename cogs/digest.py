@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+
+import config
+from db.digests import (
+    get_due_digests,
+    mark_digests_failed,
+    mark_digests_sent,
+    subscribe_digest,
+    unsubscribe_digest,
+)
+from db.users import get_user, get_users
+from plex.cache import IndexCache, registered_caches
+from recommender.batch import recommend_users
+from utils.embeds import build_movie_embed
+
+log = logging.getLogger(__name__)
+
+
+def _movie_cache() -> Optional[IndexCache]:
+    return next((c for c in registered_caches() if c.library_name == config.PLEX_LIBRARY), None)
+
+
+class DigestCog(commands.Cog):
+    """Opt-in recommendation digest sent by DM every DIGEST_INTERVAL_DAYS."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self) -> None:
+        self.send_due_digests.start()
+
+    async def cog_unload(self) -> None:
+        self.send_due_digests.cancel()
+
+    @app_commands.command(
+        name="recommend-digest",
+        description=f"Get movie recommendations by DM every {config.DIGEST_INTERVAL_DAYS} days",
+    )
+    @app_commands.describe(enabled="Turn the digest on or off")
+    async def recommend_digest(self, interaction: discord.Interaction, enabled: bool) -> None:
+        discord_id = str(interaction.user.id)
+        if enabled:
+            if not await get_user(discord_id):
+                await interaction.response.send_message(
+                    "You haven't linked your Plex account yet. Use `/plex-login` to get started.",
+                    ephemeral=True,
+                )
+                return
+            await subscribe_digest(discord_id)
+            message = (
+                "Digest enabled. Your first one arrives by DM within the hour, "
+                f"then every {config.DIGEST_INTERVAL_DAYS} days."
+            )
+        elif await unsubscribe_digest(discord_id):
+            message = "Digest disabled."
+        else:
+            message = "You weren't subscribed to the digest."
+        await interaction.response.send_message(message, ephemeral=True)
+
+    @tasks.loop(hours=1)
+    async def send_due_digests(self) -> None:
+        # An exception would stop the loop for good
+        try:
+            await self._send_due_digests()
+        except Exception:
+            log.exception("Digest run failed.")
+
+    async def _send_due_digests(self) -> None:
+        cache = _movie_cache()
+        due = await get_due_digests(config.DIGEST_INTERVAL_DAYS)
+        if cache is None or not due:
+            return
+        users = await get_users(due)
+        results = await recommend_users(cache, users, n=config.DIGEST_SIZE)
+
+        sent, failed = [], []
+        for discord_id, recs in results.items():
+            if not recs:
+                continue
+            try:
+                user = await self.bot.fetch_user(int(discord_id))
+                # Discord allows at most 10 embeds per message
+                embeds = [build_movie_embed(rec, i + 1) for i, rec in enumerate(recs[:10])]
+                await user.send(content="**Your latest movie picks**", embeds=embeds)
+            except discord.HTTPException:
+                # DMs closed or user gone: skip this round rather than retry every hour
+                log.warning("Could not send digest to %s.", discord_id, exc_info=True)
+                failed.append(discord_id)
+            else:
+                sent.append(discord_id)
+        await mark_digests_sent(sent)
+        await mark_digests_failed(failed)
+        log.info("Sent %d digest(s); %d could not be delivered.", len(sent), len(failed))
+
+    @send_due_digests.before_loop
+    async def _wait_until_ready(self) -> None:
+        await self.bot.wait_until_ready()
+
+
+async def setup(bot: commands.Bot) -> None:
+    await bot.add_cog(DigestCog(bot))
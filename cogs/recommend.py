@@ -1,8 +1,6 @@
 from __future__ import annotations
 
-import asyncio
-import time
-from typing import Dict, Optional, Tuple
+from typing import List, Optional, Tuple
 
 import discord
 from discord import app_commands
@@ -10,35 +8,58 @@ from discord.ext import commands
 
 import config
 from db.users import get_user
-from plex.client import get_server
-from plex.index import MovieIndex, build_index
-from recommender.engine import Recommender
+from plex.cache import IndexCache
+from plex.index import (
+    MovieIndex,
+    build_catalog,
+    build_watch_overlay,
+    refresh_catalog,
+    refresh_watch_overlay,
+)
+from recommender.engine import Recommender, warm_indexes
+from recommender.filters import Filters, parse_decades, split_genres
+from utils.autocomplete import genre_choices, title_choices
 from utils.embeds import build_movie_embed
+from utils.workers import run_cpu
 
-# Per-user index cache: discord_id → (MovieIndex, timestamp)
-_index_cache: Dict[str, Tuple[MovieIndex, float]] = {}
-_INDEX_TTL = 300  # 5 minutes
+# Shared movie catalog plus per-user watch overlays
+_index_cache = IndexCache(
+    config.PLEX_LIBRARY,
+    build_catalog=build_catalog,
+    refresh_catalog=refresh_catalog,
+    build_overlay=build_watch_overlay,
+    refresh_overlay=refresh_watch_overlay,
+    on_catalog_change=warm_indexes,
+)
 
 
-def _get_cached_index(discord_id: str) -> Optional[MovieIndex]:
-    entry = _index_cache.get(discord_id)
-    if entry and (time.monotonic() - entry[1]) < _INDEX_TTL:
-        return entry[0]
-    return None
-
-
-def _set_cached_index(discord_id: str, index: MovieIndex) -> None:
-    _index_cache[discord_id] = (index, time.monotonic())
+async def _get_index(discord_id: str, plex_token: str) -> MovieIndex:
+    return await _index_cache.get_index(discord_id, plex_token)
 
 
-async def _get_index(discord_id: str, plex_token: str) -> MovieIndex:
-    cached = _get_cached_index(discord_id)
-    if cached:
-        return cached
-    server = await get_server(discord_id, plex_token)
-    index = await build_index(server, config.PLEX_LIBRARY)
-    _set_cached_index(discord_id, index)
-    return index
+async def _parse_filters(
+    interaction: discord.Interaction,
+    genres: Optional[str] = None,
+    exclude: Optional[str] = None,
+    decade: Optional[str] = None,
+    min_rating: Optional[int] = None,
+) -> Optional[Filters]:
+    """Build Filters from command options, or send an ephemeral error and return None."""
+    decades: Tuple[int, ...] = ()
+    if decade:
+        decades = parse_decades(decade)
+        if decades is None:
+            await interaction.followup.send(
+                f"Couldn't read decade **{decade}**. Try something like `1990s`, `90s` or `1980s, 1990s`.",
+                ephemeral=True,
+            )
+            return None
+    return Filters(
+        genres=split_genres(genres),
+        exclude_genres=split_genres(exclude),
+        decades=decades,
+        min_rating=min_rating,
+    )
 
 
 async def _require_auth(interaction: discord.Interaction):
@@ -53,6 +74,22 @@ async def _require_auth(interaction: discord.Interaction):
     return user
 
 
+async def _genre_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[str]]:
+    # Autocomplete must answer within 3 seconds: never build, only peek
+    return genre_choices(_index_cache.peek_catalog(), current)
+
+
+async def _title_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[str]]:
+    overlay = _index_cache.peek_overlay(str(interaction.user.id))
+    return title_choices(
+        _index_cache.peek_catalog(), current, overlay.visible if overlay else None
+    )
+
+
 class RecommendCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -61,13 +98,31 @@ class RecommendCog(commands.Cog):
         name="recommend",
         description="Get 5 movie recommendations based on your recently watched movies",
     )
-    async def recommend(self, interaction: discord.Interaction) -> None:
+    @app_commands.describe(
+        genres="Only these genres, comma-separated (e.g. comedy, romance)",
+        exclude="Leave out these genres, comma-separated",
+        decade="Only these decades (e.g. 1990s or 80s, 90s)",
+        min_rating="Minimum rating out of 10",
+    )
+    @app_commands.autocomplete(genres=_genre_autocomplete, exclude=_genre_autocomplete)
+    async def recommend(
+        self,
+        interaction: discord.Interaction,
+        genres: Optional[str] = None,
+        exclude: Optional[str] = None,
+        decade: Optional[str] = None,
+        min_rating: Optional[app_commands.Range[int, 1, 10]] = None,
+    ) -> None:
         await interaction.response.defer(ephemeral=True, thinking=True)
 
         user = await _require_auth(interaction)
         if not user:
             return
 
+        filters = await _parse_filters(interaction, genres, exclude, decade, min_rating)
+        if filters is None:
+            return
+
         try:
             index = await _get_index(str(interaction.user.id), user["plex_token"])
         except Exception as exc:
@@ -77,34 +132,115 @@ class RecommendCog(commands.Cog):
             return
 
         recommender = Recommender(index)
-        recs = recommender.recommend_from_history(n=5, seed_count=5)
+        recs = await run_cpu(
+            recommender.recommend_from_history, n=5, seed_count=5, filters=filters
+        )
 
         if not recs:
-            await interaction.followup.send(
-                "No recommendations found. Your library may be empty.", ephemeral=True
+            message = (
+                f"No unwatched movies match **{filters.describe()}**."
+                if filters
+                else "No recommendations found. Your library may be empty."
             )
+            await interaction.followup.send(message, ephemeral=True)
             return
 
         embeds = [build_movie_embed(rec, i + 1) for i, rec in enumerate(recs)]
-        watched_count = sum(1 for r in index.records.values() if r.watched)
+        watched_count = index.watched_count
         header = (
             f"**Recommendations for {interaction.user.display_name}** "
             f"(based on {min(watched_count, 5)} recently watched)"
         )
+        if filters:
+            header += f" — {filters.describe()}"
         await interaction.followup.send(content=header, embeds=embeds)
 
     @app_commands.command(
         name="recommend-genre",
         description="Get 5 movie recommendations in a specific genre",
     )
-    @app_commands.describe(genre="The genre to filter by (e.g. thriller, comedy, sci-fi)")
-    async def recommend_genre(self, interaction: discord.Interaction, genre: str) -> None:
+    @app_commands.describe(
+        genre="The genre to filter by (e.g. thriller, comedy, sci-fi); comma-separate to combine",
+        exclude="Leave out these genres, comma-separated",
+        decade="Only these decades (e.g. 1990s or 80s, 90s)",
+        min_rating="Minimum rating out of 10",
+    )
+    @app_commands.autocomplete(genre=_genre_autocomplete, exclude=_genre_autocomplete)
+    async def recommend_genre(
+        self,
+        interaction: discord.Interaction,
+        genre: str,
+        exclude: Optional[str] = None,
+        decade: Optional[str] = None,
+        min_rating: Optional[app_commands.Range[int, 1, 10]] = None,
+    ) -> None:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        user = await _require_auth(interaction)
+        if not user:
+            return
+
+        genre, *also = split_genres(genre) or (genre,)
+        filters = await _parse_filters(interaction, ",".join(also), exclude, decade, min_rating)
+        if filters is None:
+            return
+
+        try:
+            index = await _get_index(str(interaction.user.id), user["plex_token"])
+        except Exception as exc:
+            await interaction.followup.send(
+                f"Failed to connect to Plex: {exc}", ephemeral=True
+            )
+            return
+
+        recommender = Recommender(index)
+        recs = await run_cpu(recommender.recommend_by_genre, genre, n=5, filters=filters)
+
+        if not recs:
+            if filters:
+                message = f"No unwatched **{genre}** movies match **{filters.describe()}**."
+            else:
+                available = ", ".join(sorted(index.genre_index.keys())[:20])
+                message = (
+                    f"No movies found for genre **{genre}**.\n"
+                    f"Available genres include: {available}"
+                )
+            await interaction.followup.send(message, ephemeral=True)
+            return
+
+        embeds = [build_movie_embed(rec, i + 1) for i, rec in enumerate(recs)]
+        title = f"{genre.title()} recommendations for {interaction.user.display_name}"
+        if filters:
+            title += f" — {filters.describe()}"
+        await interaction.followup.send(content=f"**{title}**", embeds=embeds)
+
+    @app_commands.command(
+        name="recommend-like",
+        description="Get 5 movies similar to a specific title",
+    )
+    @app_commands.describe(
+        title="The movie to find similar titles for",
+        decade="Only these decades (e.g. 1990s or 80s, 90s)",
+        min_rating="Minimum rating out of 10",
+    )
+    @app_commands.autocomplete(title=_title_autocomplete)
+    async def recommend_like(
+        self,
+        interaction: discord.Interaction,
+        title: str,
+        decade: Optional[str] = None,
+        min_rating: Optional[app_commands.Range[int, 1, 10]] = None,
+    ) -> None:
         await interaction.response.defer(ephemeral=True, thinking=True)
 
         user = await _require_auth(interaction)
         if not user:
             return
 
+        filters = await _parse_filters(interaction, decade=decade, min_rating=min_rating)
+        if filters is None:
+            return
+
         try:
             index = await _get_index(str(interaction.user.id), user["plex_token"])
         except Exception as exc:
@@ -114,22 +250,26 @@ class RecommendCog(commands.Cog):
             return
 
         recommender = Recommender(index)
-        recs = recommender.recommend_by_genre(genre, n=5)
+        movie = await run_cpu(recommender.find_title, title)
+        if movie is None:
+            await interaction.followup.send(
+                f"No movie found matching **{title}**.", ephemeral=True
+            )
+            return
 
+        recs = await run_cpu(recommender.recommend_like, movie, n=5, filters=filters)
         if not recs:
-            available = ", ".join(sorted(index.genre_index.keys())[:20])
             await interaction.followup.send(
-                f"No movies found for genre **{genre}**.\n"
-                f"Available genres include: {available}",
-                ephemeral=True,
+                f"No unwatched movies found similar to **{movie.title}**.", ephemeral=True
             )
             return
 
         embeds = [build_movie_embed(rec, i + 1) for i, rec in enumerate(recs)]
-        await interaction.followup.send(
-            content=f"**{genre.title()} recommendations for {interaction.user.display_name}**",
-            embeds=embeds,
-        )
+        label = f"{movie.title} ({movie.year})" if movie.year else movie.title
+        header = f"**Movies like {label} for {interaction.user.display_name}**"
+        if filters:
+            header += f" — {filters.describe()}"
+        await interaction.followup.send(content=header, embeds=embeds)
 
 
 async def setup(bot: commands.Bot) -> None:
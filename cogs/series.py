@@ -1,8 +1,6 @@
 from __future__ import annotations
 
-import asyncio
-import time
-from typing import Dict, Optional, Tuple
+from typing import List
 
 import discord
 from discord import app_commands
@@ -10,36 +8,32 @@ from discord.ext import commands
 
 import config
 from db.users import get_user
-from plex.client import get_server
+from plex.cache import IndexCache
 from plex.index import MovieIndex
-from plex.series_index import build_series_index
-from recommender.engine import Recommender
+from plex.series_index import (
+    build_series_catalog,
+    build_series_watch_overlay,
+    refresh_series_catalog,
+    refresh_series_watch_overlay,
+)
+from recommender.engine import Recommender, warm_indexes
+from utils.autocomplete import genre_choices
 from utils.embeds import build_series_embed
+from utils.workers import run_cpu
 
-# Per-user index cache: discord_id → (MovieIndex, timestamp)
-_index_cache: Dict[str, Tuple[MovieIndex, float]] = {}
-_INDEX_TTL = 300  # 5 minutes
-
-
-def _get_cached_index(discord_id: str) -> Optional[MovieIndex]:
-    entry = _index_cache.get(discord_id)
-    if entry and (time.monotonic() - entry[1]) < _INDEX_TTL:
-        return entry[0]
-    return None
-
-
-def _set_cached_index(discord_id: str, index: MovieIndex) -> None:
-    _index_cache[discord_id] = (index, time.monotonic())
+# Shared series catalog plus per-user watch overlays
+_index_cache = IndexCache(
+    config.PLEX_SERIES_LIBRARY,
+    build_catalog=build_series_catalog,
+    refresh_catalog=refresh_series_catalog,
+    build_overlay=build_series_watch_overlay,
+    refresh_overlay=refresh_series_watch_overlay,
+    on_catalog_change=warm_indexes,
+)
 
 
 async def _get_index(discord_id: str, plex_token: str) -> MovieIndex:
-    cached = _get_cached_index(discord_id)
-    if cached:
-        return cached
-    server = await get_server(discord_id, plex_token)
-    index = await build_series_index(server, config.PLEX_SERIES_LIBRARY)
-    _set_cached_index(discord_id, index)
-    return index
+    return await _index_cache.get_index(discord_id, plex_token)
 
 
 async def _require_auth(interaction: discord.Interaction):
@@ -53,6 +47,13 @@ async def _require_auth(interaction: discord.Interaction):
     return user
 
 
+async def _genre_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> List[app_commands.Choice[str]]:
+    # Autocomplete must answer within 3 seconds: never build, only peek
+    return genre_choices(_index_cache.peek_catalog(), current)
+
+
 class SeriesCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -77,7 +78,7 @@ class SeriesCog(commands.Cog):
             return
 
         recommender = Recommender(index)
-        recs = recommender.recommend_from_history(n=5, seed_count=5)
+        recs = await run_cpu(recommender.recommend_from_history, n=5, seed_count=5)
 
         if not recs:
             await interaction.followup.send(
@@ -87,7 +88,7 @@ class SeriesCog(commands.Cog):
             return
 
         embeds = [build_series_embed(rec, i + 1) for i, rec in enumerate(recs)]
-        watched_count = sum(1 for r in index.records.values() if r.watched)
+        watched_count = index.watched_count
         header = (
             f"**Series recommendations for {interaction.user.display_name}** "
             f"(based on {min(watched_count, 5)} recently watched)"
@@ -99,6 +100,7 @@ class SeriesCog(commands.Cog):
         description="Get 5 series recommendations in a specific genre",
     )
     @app_commands.describe(genre="The genre to filter by (e.g. drama, comedy, sci-fi)")
+    @app_commands.autocomplete(genre=_genre_autocomplete)
     async def recommend_series_genre(self, interaction: discord.Interaction, genre: str) -> None:
         await interaction.response.defer(ephemeral=True, thinking=True)
 
@@ -115,7 +117,7 @@ class SeriesCog(commands.Cog):
             return
 
         recommender = Recommender(index)
-        recs = recommender.recommend_by_genre(genre, n=5)
+        recs = await run_cpu(recommender.recommend_by_genre, genre, n=5)
 
         if not recs:
             available = ", ".join(sorted(index.genre_index.keys())[:20])
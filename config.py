@@ -24,3 +24,37 @@ PLEX_URL: str = _require("PLEX_URL")
 PLEX_PUBLIC_URL: str = _get("PLEX_PUBLIC_URL", PLEX_URL).rstrip("/")
 PLEX_LIBRARY: str = _get("PLEX_LIBRARY", "Movies")
 PLEX_SERIES_LIBRARY: str = _get("PLEX_SERIES_LIBRARY", "TV Shows")
+PLEX_WATCHED_SOURCE: str = _get("PLEX_WATCHED_SOURCE", "listing").lower()  # listing | history
+
+RECOMMENDER_ENGINE: str = _get("RECOMMENDER_ENGINE", "auto").lower()  # auto | numpy | python
+RECOMMEND_HISTORY_MODE: str = _get("RECOMMEND_HISTORY_MODE", "profile").lower()  # profile | neighbours
+NEIGHBOURS_K: int = int(_get("NEIGHBOURS_K", "20"))  # precomputed similar titles per title
+SUMMARY_WEIGHT: float = float(_get("SUMMARY_WEIGHT", "0"))  # TF-IDF plot similarity; needs numpy/scipy
+COWATCH_WEIGHT: float = float(_get("COWATCH_WEIGHT", "0"))  # similarity from other users' watches
+COWATCH_K: int = int(_get("COWATCH_K", "20"))  # co-watched titles kept per title
+COWATCH_TRAIN_INTERVAL: int = int(_get("COWATCH_TRAIN_INTERVAL", "3600"))  # seconds between training passes
+
+# Worker pools that keep CPU-bound work off the event loop (utils/workers.py)
+CPU_WORKERS: int = int(_get("CPU_WORKERS", "2"))  # threads: ranking, catalog patches, title/neighbour indexes
+PROCESS_WORKERS: int = int(_get("PROCESS_WORKERS", "1"))  # processes: TF-IDF summary index, co-watch training
+IO_WORKERS: int = int(_get("IO_WORKERS", "16"))  # threads for blocking Plex requests
+LOOP_LAG_REPORT_INTERVAL: int = int(_get("LOOP_LAG_REPORT_INTERVAL", "300"))  # seconds; 0 = off
+
+# Shared HTTP connection pool for Plex and plex.tv (plex/http.py, plex/aioplex.py)
+PLEX_TRANSPORT: str = _get("PLEX_TRANSPORT", "plexapi").lower()  # plexapi (threads) | aiohttp (native asyncio)
+PLEX_HTTP_POOL_SIZE: int = int(_get("PLEX_HTTP_POOL_SIZE", "16"))  # connections kept per host
+PLEX_HTTP_TIMEOUT: float = float(_get("PLEX_HTTP_TIMEOUT", "30"))  # seconds
+
+INDEX_REFRESH_CONCURRENCY: int = int(_get("INDEX_REFRESH_CONCURRENCY", "4"))
+INDEX_IDLE_TIMEOUT: int = int(_get("INDEX_IDLE_TIMEOUT", "3600"))  # seconds
+INDEX_TTL: int = int(_get("INDEX_TTL", "60"))  # seconds between delta checks
+
+# Optional push notifications; with either enabled INDEX_TTL can be raised
+PLEX_TOKEN: str | None = _get("PLEX_TOKEN")  # admin token: reads shared catalogs, subscribes to the alert websocket
+PLEX_WEBHOOK_PORT: int | None = int(port) if (port := _get("PLEX_WEBHOOK_PORT")) else None
+PLEX_WEBHOOK_HOST: str = _get("PLEX_WEBHOOK_HOST", "127.0.0.1")  # interface the webhook listener binds to
+PLEX_WEBHOOK_SECRET: str | None = _get("PLEX_WEBHOOK_SECRET") or None  # required path suffix: /plex-webhook/<secret>
+
+# Opt-in recommendation digest by DM (/recommend-digest)
+DIGEST_INTERVAL_DAYS: int = int(_get("DIGEST_INTERVAL_DAYS", "7"))
+DIGEST_SIZE: int = int(_get("DIGEST_SIZE", "5"))  # movies per digest (max 10)
@@ -1,7 +1,25 @@
+"""SQLite schema and the bot's long-lived connections.
+
+init_db() opens two connections for the life of the process, in WAL mode so
+reads never wait for a write: reader() for queries, and writer() for
+transactions, which it serializes and commits (or rolls back) as a unit.
+sqlite3 caches each connection's prepared statements by SQL text, so the
+db modules' fixed queries are only compiled once.
+"""
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
 import aiosqlite
 
 DB_PATH = "recommender.db"
 
+_reader: Optional[aiosqlite.Connection] = None
+_writer: Optional[aiosqlite.Connection] = None
+_write_lock = asyncio.Lock()
+
 CREATE_USERS_TABLE = """
 CREATE TABLE IF NOT EXISTS users (
     discord_id TEXT PRIMARY KEY,
@@ -11,8 +29,109 @@ CREATE TABLE IF NOT EXISTS users (
 );
 """
 
+CREATE_CATALOG_SNAPSHOTS_TABLE = """
+CREATE TABLE IF NOT EXISTS catalog_snapshots (
+    library_name TEXT PRIMARY KEY,
+    machine_id TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    saved_at TEXT DEFAULT (datetime('now'))
+);
+"""
+
+CREATE_OVERLAY_SNAPSHOTS_TABLE = """
+CREATE TABLE IF NOT EXISTS overlay_snapshots (
+    discord_id TEXT NOT NULL,
+    library_name TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    saved_at TEXT DEFAULT (datetime('now')),
+    PRIMARY KEY (discord_id, library_name)
+);
+"""
+
+CREATE_DIGEST_SUBSCRIPTIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    discord_id TEXT PRIMARY KEY,
+    last_sent_at TEXT,      -- last digest delivered
+    last_attempt_at TEXT    -- last digest tried, delivered or not
+);
+"""
+
+# Each user's resolved connection to the configured server, so plex.tv is
+# only asked again when it stops working. A NULL server_token records that
+# the user's account has no access to the server.
+CREATE_SERVER_CONNECTIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS server_connections (
+    discord_id TEXT PRIMARY KEY,
+    machine_id TEXT NOT NULL,
+    server_token TEXT,
+    uri TEXT,
+    resolved_at TEXT DEFAULT (datetime('now'))
+);
+"""
+
+
+async def _add_column(db: aiosqlite.Connection, table: str, column: str, decl: str) -> None:
+    """Add a column that databases created by older versions lack."""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = {row["name"] for row in await cursor.fetchall()}
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+async def _connect() -> aiosqlite.Connection:
+    db = await aiosqlite.connect(DB_PATH)
+    db.row_factory = aiosqlite.Row
+    await db.execute("PRAGMA journal_mode = WAL")
+    await db.execute("PRAGMA synchronous = NORMAL")  # durable enough under WAL, far fewer fsyncs
+    await db.execute("PRAGMA busy_timeout = 5000")
+    return db
+
 
 async def init_db() -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Create the schema and open the shared connections."""
+    global _reader, _writer
+    await close_db()
+    _writer = await _connect()
+    async with writer() as db:
         await db.execute(CREATE_USERS_TABLE)
-        await db.commit()
+        await db.execute(CREATE_CATALOG_SNAPSHOTS_TABLE)
+        await db.execute(CREATE_OVERLAY_SNAPSHOTS_TABLE)
+        await db.execute(CREATE_DIGEST_SUBSCRIPTIONS_TABLE)
+        await _add_column(db, "digest_subscriptions", "last_attempt_at", "TEXT")
+        # Written by older versions but never read
+        await db.execute("DROP TABLE IF EXISTS recommendation_cache")
+        await db.execute(CREATE_SERVER_CONNECTIONS_TABLE)
+    _reader = await _connect()
+
+
+async def close_db() -> None:
+    global _reader, _writer
+    for db in (_reader, _writer):
+        if db is not None:
+            await db.close()
+    _reader = _writer = None
+
+
+def reader() -> aiosqlite.Connection:
+    """The shared connection for queries."""
+    if _reader is None:
+        raise RuntimeError("init_db() has not been called.")
+    return _reader
+
+
+@asynccontextmanager
+async def writer() -> AsyncIterator[aiosqlite.Connection]:
+    """The shared write connection, held for one transaction.
+
+    Commits when the block exits, or rolls back if it raises; other writers
+    wait, so transactions never interleave on the connection.
+    """
+    if _writer is None:
+        raise RuntimeError("init_db() has not been called.")
+    async with _write_lock:
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
+        await _writer.commit()
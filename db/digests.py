@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import Iterable, List
+
+from db.database import reader, writer
+
+
+async def subscribe_digest(discord_id: str) -> None:
+    async with writer() as db:
+        await db.execute(
+            "INSERT OR IGNORE INTO digest_subscriptions (discord_id) VALUES (?)",
+            (discord_id,),
+        )
+
+
+async def unsubscribe_digest(discord_id: str) -> bool:
+    async with writer() as db:
+        cursor = await db.execute(
+            "DELETE FROM digest_subscriptions WHERE discord_id = ?", (discord_id,)
+        )
+    return cursor.rowcount > 0
+
+
+async def get_due_digests(interval_days: int) -> List[str]:
+    """Subscribers never tried, or last tried `interval_days` or more ago.
+
+    A digest that could not be delivered waits the full interval too, so
+    closed DMs are not retried every hour.
+    """
+    async with reader().execute(
+        """
+        SELECT discord_id FROM digest_subscriptions
+        WHERE COALESCE(last_attempt_at, last_sent_at) IS NULL
+           OR COALESCE(last_attempt_at, last_sent_at) <= datetime('now', ?)
+        """,
+        (f"-{interval_days} days",),
+    ) as cursor:
+        return [row[0] for row in await cursor.fetchall()]
+
+
+async def mark_digests_sent(discord_ids: Iterable[str]) -> None:
+    async with writer() as db:
+        await db.executemany(
+            """
+            UPDATE digest_subscriptions
+            SET last_sent_at = datetime('now'), last_attempt_at = datetime('now')
+            WHERE discord_id = ?
+            """,
+            ((discord_id,) for discord_id in discord_ids),
+        )
+
+
+async def mark_digests_failed(discord_ids: Iterable[str]) -> None:
+    """Record digests that could not be delivered; they are tried again next interval."""
+    async with writer() as db:
+        await db.executemany(
+            "UPDATE digest_subscriptions SET last_attempt_at = datetime('now') WHERE discord_id = ?",
+            ((discord_id,) for discord_id in discord_ids),
+        )
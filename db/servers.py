@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+from db.database import reader, writer
+
+
+async def load_server_connection(
+    discord_id: str, machine_id: str
+) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+    """(server_token, uri, age in seconds) resolved for the user on this server, if any.
+
+    server_token and uri are None if the user was found to have no access.
+    """
+    async with reader().execute(
+        """
+        SELECT server_token, uri, (julianday('now') - julianday(resolved_at)) * 86400
+        FROM server_connections WHERE discord_id = ? AND machine_id = ?
+        """,
+        (discord_id, machine_id),
+    ) as cursor:
+        row = await cursor.fetchone()
+        return (row[0], row[1], row[2]) if row else None
+
+
+async def save_server_connection(
+    discord_id: str, machine_id: str, server_token: Optional[str], uri: Optional[str]
+) -> None:
+    """Store a resolved connection; None token and uri record that the user has no access."""
+    async with writer() as db:
+        await db.execute(
+            """
+            INSERT INTO server_connections (discord_id, machine_id, server_token, uri)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(discord_id) DO UPDATE SET
+                machine_id = excluded.machine_id,
+                server_token = excluded.server_token,
+                uri = excluded.uri,
+                resolved_at = datetime('now')
+            """,
+            (discord_id, machine_id, server_token, uri),
+        )
+
+
+async def delete_server_connection(discord_id: str) -> None:
+    async with writer() as db:
+        await db.execute(
+            "DELETE FROM server_connections WHERE discord_id = ?", (discord_id,)
+        )
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+from db.database import reader, writer
+
+
+async def load_catalog_snapshot(library_name: str, machine_id: str) -> Optional[bytes]:
+    async with reader().execute(
+        "SELECT payload FROM catalog_snapshots WHERE library_name = ? AND machine_id = ?",
+        (library_name, machine_id),
+    ) as cursor:
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+
+async def save_catalog_snapshot(library_name: str, machine_id: str, payload: bytes) -> None:
+    async with writer() as db:
+        await db.execute(
+            """
+            INSERT INTO catalog_snapshots (library_name, machine_id, payload)
+            VALUES (?, ?, ?)
+            ON CONFLICT(library_name) DO UPDATE SET
+                machine_id = excluded.machine_id,
+                payload = excluded.payload,
+                saved_at = datetime('now')
+            """,
+            (library_name, machine_id, payload),
+        )
+
+
+async def load_overlay_snapshot(discord_id: str, library_name: str) -> Optional[bytes]:
+    async with reader().execute(
+        "SELECT payload FROM overlay_snapshots WHERE discord_id = ? AND library_name = ?",
+        (discord_id, library_name),
+    ) as cursor:
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+
+async def save_overlay_snapshot(discord_id: str, library_name: str, payload: bytes) -> None:
+    async with writer() as db:
+        await db.execute(
+            """
+            INSERT INTO overlay_snapshots (discord_id, library_name, payload)
+            VALUES (?, ?, ?)
+            ON CONFLICT(discord_id, library_name) DO UPDATE SET
+                payload = excluded.payload,
+                saved_at = datetime('now')
+            """,
+            (discord_id, library_name, payload),
+        )
+
+
+async def load_overlay_snapshots(
+    library_name: str, since: str = ""
+) -> List[Tuple[str, bytes, str]]:
+    """(discord_id, payload, saved_at) for the library's overlay snapshots saved at or after `since`."""
+    async with reader().execute(
+        """
+        SELECT discord_id, payload, saved_at FROM overlay_snapshots
+        WHERE library_name = ? AND saved_at >= ?
+        """,
+        (library_name, since),
+    ) as cursor:
+        return [(row[0], row[1], row[2]) for row in await cursor.fetchall()]
+
+
+async def get_overlay_snapshot_ids(library_name: str) -> List[str]:
+    """discord_ids with an overlay snapshot for the library."""
+    async with reader().execute(
+        "SELECT discord_id FROM overlay_snapshots WHERE library_name = ?",
+        (library_name,),
+    ) as cursor:
+        return [row[0] for row in await cursor.fetchall()]
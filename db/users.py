@@ -1,24 +1,53 @@
+"""Linked users, with a write-through in-memory copy of the users table.
+
+The table is read once, on first use after init_db(); every save and delete goes to both
+the database and the copy, so lookups (one per slash command) never touch
+SQLite. The bot is the table's only writer.
+"""
 from __future__ import annotations
 
-from typing import Optional
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
 import aiosqlite
 
-from db.database import DB_PATH
+from db.database import reader, writer
+
+_users: Dict[str, dict] = {}  # discord_id → row
+_loaded_from: Optional[aiosqlite.Connection] = None
+_loading = asyncio.Lock()
+
+
+async def _all_users() -> Dict[str, dict]:
+    global _users, _loaded_from
+    db = reader()
+    if _loaded_from is not db:  # first use, or init_db() opened the database again
+        async with _loading:
+            if _loaded_from is not db:
+                async with db.execute(
+                    "SELECT discord_id, plex_token, plex_username FROM users"
+                ) as cursor:
+                    _users = {row["discord_id"]: dict(row) for row in await cursor.fetchall()}
+                _loaded_from = db
+    return _users
 
 
 async def get_user(discord_id: str) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT discord_id, plex_token, plex_username FROM users WHERE discord_id = ?",
-            (discord_id,),
-        ) as cursor:
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+    user = (await _all_users()).get(discord_id)
+    return dict(user) if user else None
+
+
+async def get_users(discord_ids: Optional[Iterable[str]] = None) -> List[dict]:
+    """All linked users, or just those in `discord_ids` (unknown ids are skipped)."""
+    users = await _all_users()
+    if discord_ids is None:
+        return [dict(user) for user in users.values()]
+    return [dict(users[d]) for d in dict.fromkeys(discord_ids) if d in users]
 
 
 async def save_user(discord_id: str, plex_token: str, plex_username: Optional[str]) -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
+    users = await _all_users()
+    async with writer() as db:
         await db.execute(
             """
             INSERT INTO users (discord_id, plex_token, plex_username)
@@ -30,13 +59,45 @@ async def save_user(discord_id: str, plex_token: str, plex_username: Optional[st
             """,
             (discord_id, plex_token, plex_username),
         )
-        await db.commit()
+        # Resolved with the old token
+        await db.execute(
+            "DELETE FROM server_connections WHERE discord_id = ?", (discord_id,)
+        )
+    users[discord_id] = {
+        "discord_id": discord_id, "plex_token": plex_token, "plex_username": plex_username,
+    }
 
 
 async def delete_user(discord_id: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    users = await _all_users()
+    async with writer() as db:
         cursor = await db.execute(
             "DELETE FROM users WHERE discord_id = ?", (discord_id,)
         )
-        await db.commit()
-        return cursor.rowcount > 0
+        await db.execute(
+            "DELETE FROM overlay_snapshots WHERE discord_id = ?", (discord_id,)
+        )
+        await db.execute(
+            "DELETE FROM digest_subscriptions WHERE discord_id = ?", (discord_id,)
+        )
+        await db.execute(
+            "DELETE FROM server_connections WHERE discord_id = ?", (discord_id,)
+        )
+    users.pop(discord_id, None)
+    return cursor.rowcount > 0
+
+
+def _nocase(text: str) -> str:
+    # SQLite's NOCASE: only ASCII letters fold
+    return text.translate(_ASCII_LOWER)
+
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+async def get_discord_ids_by_plex_username(plex_username: str) -> List[str]:
+    wanted = _nocase(plex_username)
+    return [
+        user["discord_id"] for user in (await _all_users()).values()
+        if user["plex_username"] is not None and _nocase(user["plex_username"]) == wanted
+    ]
@@ -0,0 +1,170 @@
+"""asyncio-native Plex transport over aiohttp (PLEX_TRANSPORT=aiohttp).
+
+Covers only the requests the bot makes: the server's /identity, streamed
+containers (section list, listings, bulk metadata, watch history) and the
+plex.tv PIN login and account lookup. The plex.tv calls are used with either
+transport. Requests wait on the event loop instead of holding an executor
+thread each, and share one pooled aiohttp session with at most
+PLEX_HTTP_POOL_SIZE connections per host.
+
+Errors match the plexapi path: Unauthorized / NotFound for 401 / 404, and
+aiohttp.ClientError or asyncio.TimeoutError for transport failures (see
+plex.stream.TRANSPORT_ERRORS).
+"""
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import urlencode
+from xml.etree.ElementTree import Element, fromstring
+
+import aiohttp
+import plexapi
+from plexapi.exceptions import NotFound, Unauthorized
+
+import config
+from plex import http
+from plex.stream import Converter, parse_container
+from utils.workers import run_cpu
+
+T = TypeVar("T")
+
+_PINS = "https://plex.tv/api/v2/pins"
+_USER = "https://plex.tv/api/v2/user"
+_INLINE_PARSE = 64 * 1024  # bodies up to this size are parsed on the loop, larger on the CPU pool
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def session() -> aiohttp.ClientSession:
+    """The shared aiohttp session; created on first use inside the running loop."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=config.PLEX_HTTP_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=http.TIMEOUT),
+        )
+    return _session
+
+
+async def close() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def _headers(token: Optional[str] = None) -> Dict[str, str]:
+    # Same client identity as plexapi, so both transports look like one device to Plex
+    headers = dict(plexapi.BASE_HEADERS)
+    if token:
+        headers["X-Plex-Token"] = token
+    return headers
+
+
+def _check(resp: aiohttp.ClientResponse) -> None:
+    if resp.status == 401:
+        raise Unauthorized(f"({resp.status}) unauthorized; {resp.url}")
+    if resp.status == 404:
+        raise NotFound(f"({resp.status}) not_found; {resp.url}")
+    resp.raise_for_status()
+
+
+async def _get_xml(url: str, token: Optional[str] = None, method: str = "GET", **kwargs) -> Element:
+    async with session().request(method, url, headers=_headers(token), **kwargs) as resp:
+        _check(resp)
+        return fromstring(await resp.read())
+
+
+class AioPlexServer:
+    """A user's connection to the Plex server: its base URL and server token.
+
+    Exposes `_baseurl` and `_token` under the same names as plexapi's
+    PlexServer, so code that only needs those works with either.
+    """
+
+    def __init__(self, baseurl: str, token: str):
+        self._baseurl = baseurl.rstrip("/")
+        self._token = token
+
+    @classmethod
+    async def connect(cls, baseurl: str, token: str) -> "AioPlexServer":
+        """Connect, checking the token like PlexServer() does (Unauthorized if rejected)."""
+        server = cls(baseurl, token)
+        await _get_xml(server.url("/"), token)
+        return server
+
+    def url(self, path: str) -> str:
+        return f"{self._baseurl}{path}"
+
+    async def fetch_container(
+        self, path: str, params: Dict[str, object], convert: Converter
+    ) -> Tuple[List[T], int]:
+        """(converted items, container totalSize) of one container request."""
+        query = {key: str(value) for key, value in params.items()}
+        async with session().get(self.url(path), params=query, headers=_headers(self._token)) as resp:
+            _check(resp)
+            body = await resp.read()
+        if len(body) <= _INLINE_PARSE:
+            return parse_container(io.BytesIO(body), convert)
+        return await run_cpu(parse_container, io.BytesIO(body), convert)
+
+
+async def get_machine_identifier(baseurl: str) -> str:
+    """The server's machineIdentifier from /identity (no auth required)."""
+    root = await _get_xml(f"{baseurl.rstrip('/')}/identity")
+    return root.attrib["machineIdentifier"]
+
+
+@dataclass
+class PinLogin:
+    """A pending plex.tv OAuth PIN login (the aiohttp counterpart of MyPlexPinLogin)."""
+    id: str
+    code: str
+    token: Optional[str] = None
+    expired: bool = False
+
+    def oauth_url(self, forward_url: Optional[str] = None) -> str:
+        headers = _headers()
+        params = {
+            "clientID": headers["X-Plex-Client-Identifier"],
+            "context[device][product]": headers["X-Plex-Product"],
+            "context[device][version]": headers["X-Plex-Version"],
+            "context[device][platform]": headers["X-Plex-Platform"],
+            "context[device][platformVersion]": headers["X-Plex-Platform-Version"],
+            "context[device][device]": headers["X-Plex-Device"],
+            "context[device][deviceName]": headers["X-Plex-Device-Name"],
+            "code": self.code,
+        }
+        if forward_url:
+            params["forwardUrl"] = forward_url
+        return f"https://app.plex.tv/auth/#!?{urlencode(params)}"
+
+
+async def create_pin() -> PinLogin:
+    root = await _get_xml(_PINS, method="POST", params={"strong": "true"})
+    return PinLogin(id=root.attrib["id"], code=root.attrib["code"])
+
+
+async def check_pin(pin: PinLogin) -> bool:
+    """True once the user has approved the login; pin.token is then set.
+
+    A PIN plex.tv no longer knows (404) is marked expired. Transport errors
+    are raised, so the caller can retry them.
+    """
+    if pin.token:
+        return True
+    try:
+        root = await _get_xml(f"{_PINS}/{pin.id}")
+    except NotFound:
+        pin.expired = True
+        return False
+    pin.token = root.attrib.get("authToken") or None
+    return pin.token is not None
+
+
+async def get_username(token: str) -> Optional[str]:
+    """The plex.tv username of the account `token` belongs to (MyPlexAccount.username)."""
+    root = await _get_xml(_USER, token)
+    return root.attrib.get("username") or None
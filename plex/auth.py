@@ -1,46 +1,174 @@
+"""Plex OAuth PIN login.
+
+Every pending login is polled by one PinPoller task instead of a loop per
+login. Each PIN is checked every POLL_INTERVAL seconds for its first
+FAST_POLL_PERIOD seconds (when most users approve), then less often, up to
+MAX_POLL_INTERVAL. At most POLL_CONCURRENCY checks are in flight at once,
+and each waiter is resolved as soon as its token arrives.
+
+The requests only go to plex.tv, so they use the aiohttp client
+(plex/aioplex.py) whatever PLEX_TRANSPORT is.
+"""
 from __future__ import annotations
 
 import asyncio
-from typing import Optional, Tuple
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
 
-from plexapi.myplex import MyPlexPinLogin
+from plex import aioplex
+from plex.aioplex import PinLogin
+from plex.stream import TRANSPORT_ERRORS
 
+log = logging.getLogger(__name__)
 
-POLL_INTERVAL = 3       # seconds between checkLogin polls
+POLL_INTERVAL = 3       # seconds between checks of a new login
+FAST_POLL_PERIOD = 60   # seconds a login is checked every POLL_INTERVAL
+MAX_POLL_INTERVAL = 15  # seconds between checks once backed off
+POLL_CONCURRENCY = 8    # PIN checks in flight at once
 LOGIN_TIMEOUT = 300     # 5 minutes
 
 
-async def start_pin_login() -> Tuple[MyPlexPinLogin, str]:
+async def start_pin_login() -> Tuple[PinLogin, str]:
     """Create a PIN login session and return (pinlogin, oauth_url)."""
-    loop = asyncio.get_running_loop()
-    pinlogin: MyPlexPinLogin = await loop.run_in_executor(
-        None, lambda: MyPlexPinLogin(oauth=True)
-    )
-    oauth_url: str = pinlogin.oauthUrl(forwardUrl=None)
-    return pinlogin, oauth_url
-
-
-async def poll_for_token(
-    pinlogin: MyPlexPinLogin,
-    timeout: int = LOGIN_TIMEOUT,
-) -> Optional[str]:
-    """
-    Poll checkLogin() every POLL_INTERVAL seconds until the user authenticates
-    or timeout is reached.
+    pin = await aioplex.create_pin()
+    return pin, pin.oauth_url()
 
-    Returns the auth token string on success, or None on timeout.
+
+@dataclass(eq=False)
+class _Pending:
+    pin: PinLogin
+    waiter: asyncio.Future
+    started: float
+    next_check: float
+    interval: float = POLL_INTERVAL
+
+
+class PinPoller:
+    """Background task that checks every pending PIN login.
+
+    wait_for_token() registers a PIN and waits for its token. The task runs
+    while logins are pending; each PIN is checked when it is due, with at
+    most `concurrency` checks in flight. A PIN is checked every `interval`
+    seconds for `fast_period` seconds, then increasingly rarely, up to every
+    `max_interval` seconds. Checks that fail to reach plex.tv back off the
+    same way.
     """
-    loop = asyncio.get_running_loop()
-    elapsed = 0
 
-    while elapsed < timeout:
-        await asyncio.sleep(POLL_INTERVAL)
-        elapsed += POLL_INTERVAL
+    def __init__(
+        self,
+        *,
+        interval: float = POLL_INTERVAL,
+        fast_period: float = FAST_POLL_PERIOD,
+        max_interval: float = MAX_POLL_INTERVAL,
+        concurrency: int = POLL_CONCURRENCY,
+    ):
+        self._interval = interval
+        self._fast_period = fast_period
+        self._max_interval = max_interval
+        self._concurrency = concurrency
+        self._pending: Dict[str, _Pending] = {}
+        self._checking: Set[str] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def wait_for_token(self, pin: PinLogin, timeout: float = LOGIN_TIMEOUT) -> Optional[str]:
+        """The auth token once the user approves `pin`; None on timeout or expiry."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        entry = _Pending(pin, loop.create_future(), now, now + self._interval, self._interval)
+        self._pending[pin.id] = entry
+        self._start()
+        try:
+            return await asyncio.wait_for(entry.waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if self._pending.get(pin.id) is entry:
+                del self._pending[pin.id]
+
+    async def stop(self) -> None:
+        """Cancel the poller; pending waiters get None."""
+        for entry in self._pending.values():
+            if not entry.waiter.done():
+                entry.waiter.set_result(None)
+        self._pending.clear()
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
 
-        success: bool = await loop.run_in_executor(
-            None, pinlogin.checkLogin
-        )
-        if success:
-            return pinlogin.token
+    def _start(self) -> None:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="pin_poller")
 
-    return None
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self._concurrency)
+        checks: Set[asyncio.Task] = set()
+        try:
+            while self._pending:
+                self._wake.clear()
+                now = loop.time()
+                for entry in list(self._pending.values()):
+                    if entry.pin.id in self._checking or entry.next_check > now:
+                        continue
+                    self._checking.add(entry.pin.id)
+                    task = asyncio.create_task(self._check(entry, semaphore))
+                    checks.add(task)
+                    task.add_done_callback(checks.discard)
+                idle = [e.next_check for e in self._pending.values() if e.pin.id not in self._checking]
+                delay = max(0.0, min(idle) - now) if idle else None
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in checks:
+                task.cancel()
+
+    async def _check(self, entry: _Pending, semaphore: asyncio.Semaphore) -> None:
+        try:
+            async with semaphore:
+                approved = await aioplex.check_pin(entry.pin)
+        except TRANSPORT_ERRORS:
+            # plex.tv unreachable; retry this PIN after a longer wait
+            log.debug("PIN %s check failed; retrying.", entry.pin.id, exc_info=True)
+            entry.interval = min(entry.interval * 2, self._max_interval)
+            approved = False
+        except Exception as exc:
+            if not entry.waiter.done():
+                entry.waiter.set_exception(exc)
+            return
+        finally:
+            self._checking.discard(entry.pin.id)
+            self._wake.set()
+
+        if approved or entry.pin.expired:
+            if not entry.waiter.done():
+                entry.waiter.set_result(entry.pin.token)
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if now - entry.started >= self._fast_period:
+            entry.interval = min(entry.interval * 1.5, self._max_interval)
+        entry.next_check = now + entry.interval
+
+
+pin_poller = PinPoller()
+
+
+async def poll_for_token(pinlogin: PinLogin, timeout: int = LOGIN_TIMEOUT) -> Optional[str]:
+    """
+    Wait until the user authenticates `pinlogin` or timeout is reached.
+
+    Returns the auth token string on success, or None on timeout.
+    """
+    return await pin_poller.wait_for_token(pinlogin, timeout)
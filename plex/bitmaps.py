@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Set-bit offsets for every byte value, lowest first
+_BYTE_BITS = [[bit for bit in range(8) if value >> bit & 1] for value in range(256)]
+
+RATING_BUCKETS = 11  # whole points 0..10
+
+
+def mask_bits(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits in mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def bitmap(positions: Iterable[int]) -> int:
+    """A Python int with the given bit positions set."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    buf = bytearray((max(positions) >> 3) + 1)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _to_bytes(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) >> 3, "little")
+
+
+class Bitset:
+    """A frozen bitmap with O(1) membership tests and ordered iteration.
+
+    Combining bitmaps is cheapest on plain ints (&, |, & ~); testing single
+    bits is not, since every shift copies the int. Bitset takes the combined
+    result and answers `pos in bitset` from its bytes instead.
+    """
+    __slots__ = ("bits", "_buf")
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self._buf = _to_bytes(bits)
+
+    def __contains__(self, pos: int) -> bool:
+        i = pos >> 3
+        return i < len(self._buf) and bool(self._buf[i] >> (pos & 7) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        """Set positions, lowest first."""
+        for i, byte in enumerate(self._buf):
+            if byte:
+                base = i << 3
+                for bit in _BYTE_BITS[byte]:
+                    yield base + bit
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def to_bytes(self) -> bytes:
+        """Little-endian bytes: bit p is byte p // 8, bit p % 8."""
+        return self._buf
+
+
+class BitmapIndex:
+    """Bitmaps over record seq positions, for filtering by bitwise ops.
+
+    Built in one pass over a catalog's records (see Catalog.bitmaps()); every
+    field is a plain int, so filters combine with &, | and & ~.
+    """
+
+    def __init__(self, records: Iterable, genre_names: List[str]):
+        genres: Dict[int, List[int]] = {}
+        decades: Dict[int, List[int]] = {}
+        ratings: List[List[int]] = [[] for _ in range(RATING_BUCKETS)]
+        self.keys: Dict[int, str] = {}  # seq → rating_key
+        for record in records:
+            seq = record.seq
+            self.keys[seq] = record.rating_key
+            for genre_id in mask_bits(record.genre_mask):
+                genres.setdefault(genre_id, []).append(seq)
+            if record.decade is not None:
+                decades.setdefault(record.decade, []).append(seq)
+            rating = record.audience_rating or record.rating or 0.0
+            ratings[min(max(int(rating), 0), RATING_BUCKETS - 1)].append(seq)
+
+        self.all = bitmap(self.keys)
+        self.genres: Dict[str, int] = {genre_names[i]: bitmap(s) for i, s in genres.items()}
+        self.decades: Dict[int, int] = {d: bitmap(s) for d, s in decades.items()}
+        self.ratings: List[int] = [bitmap(s) for s in ratings]
+
+    def genre(self, name: str) -> int:
+        return self.genres.get(name, 0)
+
+    def decade(self, decade: int) -> int:
+        return self.decades.get(decade, 0)
+
+    def min_rating(self, rating: int) -> int:
+        """Records rated at least `rating` (whole points, audience else critic)."""
+        bits = 0
+        for bucket in self.ratings[max(rating, 0):]:
+            bits |= bucket
+        return bits
+
+    def rating_keys(self, bits: int, limit: Optional[int] = None) -> List[str]:
+        """rating_keys for the set positions of `bits`, in catalog order."""
+        keys: List[str] = []
+        for pos in Bitset(bits):
+            keys.append(self.keys[pos])
+            if limit is not None and len(keys) >= limit:
+                break
+        return keys
@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from plexapi.exceptions import Unauthorized
+
+import config
+from db.snapshots import (
+    load_catalog_snapshot,
+    load_overlay_snapshot,
+    save_catalog_snapshot,
+    save_overlay_snapshot,
+)
+from plex.client import forget_server, get_admin_server, get_machine_id, get_server
+from plex.index import Catalog, MovieIndex, WatchOverlay, library_stamp, visible_keys
+from plex.snapshot import decode_catalog, decode_overlay, encode_catalog, encode_overlay
+from plex.stream import PlexConnection
+from utils.singleflight import SingleFlight
+from utils.workers import run_cpu
+
+log = logging.getLogger(__name__)
+
+CatalogBuilder = Callable[[PlexConnection, str], Awaitable[Catalog]]
+CatalogRefresher = Callable[[PlexConnection, Catalog, str, bool], Awaitable[Optional[Catalog]]]
+OverlayBuilder = Callable[[PlexConnection, str], Awaitable[WatchOverlay]]
+OverlayRefresher = Callable[[PlexConnection, WatchOverlay, str], Awaitable[bool]]
+
+_INDEX_TTL = config.INDEX_TTL            # how often to ask Plex for deltas
+_FULL_REBUILD_TTL = 3600                  # deltas miss unwatches and in-place edits; rebuild hourly
+_MAX_STALE = max(900, 2 * _INDEX_TTL)     # older than this, block on a refresh instead of serving stale
+_SNAPSHOT_DELAY = 300                     # patched catalogs are snapshotted at most this often
+_CHANGE_QUIET = 5                         # library events coalesce until none came for this long
+_CHANGE_MAX_DELAY = 60                    # ...or this long after the first, during a long scan
+
+# Every IndexCache, for the background refresher
+_registry: List["IndexCache"] = []
+
+
+def registered_caches() -> List["IndexCache"]:
+    return list(_registry)
+
+
+@dataclass
+class _Entry:
+    built: float
+    checked: float
+    stale: bool = field(default=False, kw_only=True)  # a Plex event says Plex has news
+
+    def needs_rebuild(self) -> bool:
+        return (time.monotonic() - self.built) >= _FULL_REBUILD_TTL
+
+    def needs_check(self, within: float = 0.0) -> bool:
+        """True if flagged stale, or the TTL has lapsed or will in the next `within` seconds."""
+        return self.stale or (time.monotonic() - self.checked) >= _INDEX_TTL - within
+
+    def mark_checked(self, now: float) -> None:
+        self.checked = now
+        self.stale = False
+
+    def servable(self) -> bool:
+        return (time.monotonic() - self.checked) < _MAX_STALE
+
+
+@dataclass
+class _CatalogEntry(_Entry):
+    catalog: Catalog
+
+
+@dataclass
+class _OverlayEntry(_Entry):
+    overlay: WatchOverlay
+    token: str  # user-scoped token, for thumbs
+
+
+class IndexCache:
+    """One shared Catalog per library plus a thin WatchOverlay per user.
+
+    The catalog is read through the admin connection (PLEX_TOKEN) when one is
+    configured, and otherwise through whichever user's connection first needs
+    it; either way it is reused by everyone. Per user, only the watch history
+    is fetched, plus which titles their account can open when sharing
+    restrictions hide some of the catalog from them. Without an admin token
+    a restricted user's connection may build the catalog, and titles only
+    hidden from them are then missing for everyone. Once the TTL lapses,
+    both are patched from Plex deltas rather than rebuilt: overlays in place,
+    the catalog by swapping in a patched copy (see Catalog.patched), so
+    rankings still running on the old one need no lock.
+
+    Every build and overlay patch is snapshotted to the database in the
+    background (catalog patches at most once per _SNAPSHOT_DELAY), and the
+    first lookup after a restart restores from that snapshot instead of
+    rescanning the library.
+
+    Lookups are stale-while-revalidate: an expired (but not too old) index is
+    returned immediately while a refresh runs in the background, and the
+    IndexRefresher keeps recently active users fresh before they expire.
+
+    Plex events (see plex.events) are applied through the apply_* methods, so
+    watches and deletions show up without waiting for the next TTL check.
+    Additions and updates arrive in bursts during a library scan and are
+    coalesced into one delta.
+    """
+
+    def __init__(
+        self,
+        library_name: str,
+        *,
+        build_catalog: CatalogBuilder,
+        refresh_catalog: CatalogRefresher,
+        build_overlay: OverlayBuilder,
+        refresh_overlay: OverlayRefresher,
+        on_catalog_change: Optional[Callable[[Catalog], Awaitable[None]]] = None,
+    ):
+        self.library_name = library_name
+        self._build_catalog = build_catalog
+        self._refresh_catalog = refresh_catalog
+        self._build_overlay = build_overlay
+        self._refresh_overlay = refresh_overlay
+        self._on_catalog_change = on_catalog_change
+        self._catalog: Optional[_CatalogEntry] = None
+        self._overlays: Dict[str, _OverlayEntry] = {}
+        self._restored: Set[str] = set()  # discord_ids already tried from snapshot
+        self._tasks: Set[asyncio.Task] = set()
+        # Concurrent builds/refreshes for the same catalog or user share one task
+        self._flights = SingleFlight()
+        # Serializes catalog builds and patches, so a delete event is never
+        # applied to a catalog that a refresh is about to replace
+        self._catalog_lock = asyncio.Lock()
+        # Newest library change event, and whether a delta is already scheduled for it
+        self._last_change = float("-inf")
+        self._settling = False
+        self._save_pending = False  # a patched catalog's snapshot is scheduled
+        # Deletions reported by Plex, not yet applied to the catalog
+        self._deleted: Set[str] = set()
+        # discord_id → (plex_token, last lookup), for background refreshes
+        self._active: Dict[str, Tuple[str, float]] = {}
+        _registry.append(self)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _restore_catalog(self, server: PlexConnection) -> Optional[_CatalogEntry]:
+        machine_id = get_machine_id()
+        if machine_id is None:
+            return None
+        blob = await load_catalog_snapshot(self.library_name, machine_id)
+        if blob is None:
+            return None
+        catalog = await run_cpu(decode_catalog, blob)
+        if catalog is None:
+            return None
+        section_key, library_updated_at = await library_stamp(server, self.library_name)
+        if section_key != catalog.section_key:
+            return None
+        now = time.monotonic()
+        # Unchanged section timestamp: the snapshot is current. Otherwise keep
+        # it, but force a delta refresh before it is served.
+        checked = now if library_updated_at == catalog.library_updated_at else float("-inf")
+        log.info("Restored %s catalog snapshot (%d items).", self.library_name, len(catalog.records))
+        return _CatalogEntry(built=now, checked=checked, catalog=catalog)
+
+    async def _save_catalog(self, catalog: Catalog) -> None:
+        machine_id = get_machine_id()
+        if machine_id is None:
+            return
+        try:
+            # Patches never touch a shared catalog, so it is safe to encode off-loop
+            blob = await run_cpu(encode_catalog, catalog)
+            await save_catalog_snapshot(self.library_name, machine_id, blob)
+        except Exception:
+            log.warning("Failed to save %s catalog snapshot.", self.library_name, exc_info=True)
+
+    async def _save_overlay(self, discord_id: str, overlay: WatchOverlay) -> None:
+        try:
+            await save_overlay_snapshot(discord_id, self.library_name, encode_overlay(overlay))
+        except Exception:
+            log.warning("Failed to save overlay snapshot for %s.", discord_id, exc_info=True)
+
+    async def _index_titles(self, catalog: Catalog) -> None:
+        """Build the autocomplete TitleIndex for the catalog's current version off-loop."""
+        version = catalog.version
+        # A thread rather than a process: unpickling the many small objects of
+        # a TitleIndex would block the loop longer than the build does
+        titles = await run_cpu(catalog.build_titles)
+        catalog.install_titles(titles, version)
+
+    def _catalog_changed(self, catalog: Catalog) -> None:
+        """Rebuild derived indexes in the background after a build, restore or patch."""
+        self._spawn(self._index_titles(catalog))
+        if self._on_catalog_change is not None:
+            self._spawn(self._on_catalog_change(catalog))
+
+    async def _sync_catalog(
+        self, server: PlexConnection, within: float = 0.0, full_view: bool = False
+    ) -> Catalog:
+        """Build, restore or patch the catalog through `server`.
+
+        `full_view` says the connection sees the whole library (the admin's),
+        so items missing from its listing can be taken as deleted.
+        """
+        async with self._catalog_lock:
+            return await self._sync_catalog_locked(server, within, full_view)
+
+    async def _sync_catalog_locked(
+        self, server: PlexConnection, within: float, full_view: bool
+    ) -> Catalog:
+        entry = self._catalog
+        if entry is None:
+            entry = self._catalog = await self._restore_catalog(server)
+            if entry is not None:
+                self._catalog_changed(entry.catalog)
+        now = time.monotonic()
+        if entry is None or entry.needs_rebuild():
+            catalog = await self._build_catalog(server, self.library_name)
+            self._catalog = _CatalogEntry(built=now, checked=now, catalog=catalog)
+            self._spawn(self._save_catalog(catalog))
+            self._catalog_changed(catalog)
+            return catalog
+        if entry.needs_check(within):
+            patched = await self._refresh_catalog(
+                server, entry.catalog, self.library_name, full_view
+            )
+            if patched is not None:
+                self._swap_catalog(entry, patched)
+            entry.mark_checked(now)
+        return entry.catalog
+
+    def _swap_catalog(self, entry: _CatalogEntry, catalog: Catalog) -> None:
+        """Serve a patched copy from now on; lookups already running keep the old one."""
+        entry.catalog = catalog
+        if not self._save_pending:
+            self._save_pending = True
+            self._spawn(self._save_patched_catalog())
+        self._catalog_changed(catalog)
+
+    async def _save_patched_catalog(self) -> None:
+        """Snapshot the newest catalog _SNAPSHOT_DELAY seconds after the first patch.
+
+        Every snapshot re-encodes the whole catalog, so patches share one. A
+        restart before it is written restores an older snapshot, which the
+        next delta brings up to date.
+        """
+        await asyncio.sleep(_SNAPSHOT_DELAY)
+        self._save_pending = False
+        if self._catalog is not None:
+            await self._save_catalog(self._catalog.catalog)
+
+    async def _restore_overlay(self, discord_id: str, token: str) -> Optional[_OverlayEntry]:
+        if discord_id in self._restored:
+            return None
+        self._restored.add(discord_id)
+        blob = await load_overlay_snapshot(discord_id, self.library_name)
+        overlay = decode_overlay(blob) if blob is not None else None
+        if overlay is None:
+            return None
+        # Always apply a history delta before serving a restored overlay
+        now = time.monotonic()
+        return _OverlayEntry(built=now, checked=float("-inf"), overlay=overlay, token=token)
+
+    async def _sync_overlay(
+        self, discord_id: str, server: PlexConnection, catalog: Catalog, within: float = 0.0
+    ) -> WatchOverlay:
+        section_key = catalog.section_key
+        entry = self._overlays.get(discord_id)
+        if entry is None:
+            entry = await self._restore_overlay(discord_id, server._token)
+            if entry is not None:
+                self._overlays[discord_id] = entry
+        now = time.monotonic()
+        if entry is None or entry.needs_rebuild():
+            overlay = await self._build_overlay(server, section_key)
+            # Re-read hourly with the overlay; titles added in between stay hidden until then
+            overlay.visible = await visible_keys(server, catalog)
+            self._overlays[discord_id] = _OverlayEntry(
+                built=now, checked=now, overlay=overlay, token=server._token
+            )
+            self._spawn(self._save_overlay(discord_id, overlay))
+            return overlay
+        if entry.needs_check(within):
+            if await self._refresh_overlay(server, entry.overlay, section_key):
+                self._spawn(self._save_overlay(discord_id, entry.overlay))
+            entry.mark_checked(now)
+        return entry.overlay
+
+    async def _get_catalog(self, server: PlexConnection, within: float = 0.0) -> Catalog:
+        """The catalog, synced through the admin connection if there is one, else through `server`.
+
+        A user's connection only sees what their share allows; the admin's
+        sees everything. If Plex rejects PLEX_TOKEN, the user's connection is
+        used instead, so the failure is never blamed on the user's token.
+        """
+        admin = await get_admin_server()
+        if admin is not None:
+            try:
+                return await self._flights.do(
+                    ("catalog", "admin"), lambda: self._sync_catalog(admin, within, True)
+                )
+            except Unauthorized:
+                log.warning("Plex rejected PLEX_TOKEN; syncing the %s catalog as the user.",
+                            self.library_name)
+        return await self._flights.do("catalog", lambda: self._sync_catalog(server, within))
+
+    async def _get_overlay(
+        self, discord_id: str, server: PlexConnection, catalog: Catalog, within: float = 0.0
+    ) -> WatchOverlay:
+        return await self._flights.do(
+            ("overlay", discord_id),
+            lambda: self._sync_overlay(discord_id, server, catalog, within),
+        )
+
+    async def _sync_through(
+        self, discord_id: str, server: PlexConnection, within: float
+    ) -> Tuple[Catalog, WatchOverlay]:
+        catalog = await self._get_catalog(server, within)
+        overlay = await self._get_overlay(discord_id, server, catalog, within)
+        return catalog, overlay
+
+    async def _sync(
+        self, discord_id: str, plex_token: str, within: float = 0.0
+    ) -> Tuple[PlexConnection, Catalog, WatchOverlay]:
+        """The catalog and the user's overlay, synced through the user's server.
+
+        If Plex rejects the user's server token (access revoked or re-issued),
+        the saved connection is dropped and resolved again once. A rejected
+        PLEX_TOKEN is handled by _get_catalog() and never gets here.
+        """
+        server = await get_server(discord_id, plex_token)
+        try:
+            return (server, *await self._sync_through(discord_id, server, within))
+        except Unauthorized:
+            log.info("Plex rejected the server token for %s; resolving again.", discord_id)
+            await forget_server(discord_id)
+        server = await get_server(discord_id, plex_token)
+        return (server, *await self._sync_through(discord_id, server, within))
+
+    async def refresh(self, discord_id: str, within: float = 0.0) -> None:
+        """Bring the catalog and this user's overlay up to date if they expire within `within` seconds."""
+        active = self._active.get(discord_id)
+        if active is None:
+            return
+        await self._sync(discord_id, active[0], within)
+
+    async def _revalidate(self, discord_id: str) -> None:
+        try:
+            await self.refresh(discord_id)
+        except Exception:
+            log.warning("Background refresh of %s index for %s failed.",
+                        self.library_name, discord_id, exc_info=True)
+
+    async def get_index(
+        self, discord_id: str, plex_token: str, *, background: bool = False
+    ) -> MovieIndex:
+        """The user's index, loaded or refreshed as needed.
+
+        `background` lookups (batch jobs) don't count as activity, so they
+        don't keep an otherwise idle user's index warm.
+        """
+        last = self._active[discord_id][1] if discord_id in self._active else float("-inf")
+        self._active[discord_id] = (plex_token, last if background else time.monotonic())
+        catalog_entry = self._catalog
+        overlay_entry = self._overlays.get(discord_id)
+        if (
+            catalog_entry and catalog_entry.servable()
+            and overlay_entry and overlay_entry.servable()
+        ):
+            if catalog_entry.needs_check() or overlay_entry.needs_check():
+                self._spawn(self._revalidate(discord_id))
+            return MovieIndex(
+                catalog=catalog_entry.catalog,
+                overlay=overlay_entry.overlay,
+                token=overlay_entry.token,
+            )
+
+        server, catalog, overlay = await self._sync(discord_id, plex_token)
+        return MovieIndex(catalog=catalog, overlay=overlay, token=server._token)
+
+    def peek_catalog(self) -> Optional[Catalog]:
+        """The cached catalog as-is, without building, restoring or refreshing it.
+
+        For latency-bound callers such as autocomplete; None until some user's
+        lookup has loaded the catalog.
+        """
+        return self._catalog.catalog if self._catalog else None
+
+    def peek_overlay(self, discord_id: str) -> Optional[WatchOverlay]:
+        """The user's cached overlay as-is, like peek_catalog(); None if not loaded."""
+        entry = self._overlays.get(discord_id)
+        return entry.overlay if entry else None
+
+    def due(self, within: float) -> List[str]:
+        """Active users whose catalog or overlay expires within `within` seconds."""
+        catalog_due = self._catalog is not None and self._catalog.needs_check(within)
+        return [
+            discord_id for discord_id in self._active
+            if catalog_due
+            or (entry := self._overlays.get(discord_id)) is None
+            or entry.needs_check(within)
+        ]
+
+    def evict_idle(self, idle_timeout: float) -> int:
+        """Forget users with no lookup in `idle_timeout` seconds; returns how many."""
+        cutoff = time.monotonic() - idle_timeout
+        idle = [d for d, (_, seen) in self._active.items() if seen < cutoff]
+        for discord_id in idle:
+            del self._active[discord_id]
+            self._overlays.pop(discord_id, None)
+            self._restored.discard(discord_id)
+        return len(idle)
+
+    def invalidate(self, discord_id: str) -> None:
+        self._overlays.pop(discord_id, None)
+        self._active.pop(discord_id, None)
+
+    @property
+    def section_key(self) -> Optional[str]:
+        """The cached catalog's section key, or None before the first build."""
+        return self._catalog.catalog.section_key if self._catalog else None
+
+    def apply_watched(self, discord_id: str, rating_key: str) -> None:
+        """Record a watch reported by Plex without a round trip."""
+        entry = self._overlays.get(discord_id)
+        if entry is None or entry.overlay.watched_order[:1] == [rating_key]:
+            return
+        # last_viewed_at is left alone so the next delta still re-reads this watch
+        entry.overlay.prepend([rating_key])
+        self._spawn(self._save_overlay(discord_id, entry.overlay))
+
+    async def apply_deleted(self, rating_key: str) -> None:
+        """Drop an item Plex reports as deleted from the shared catalog.
+
+        Deletions that arrive while a patch is running are applied together
+        by the next one, so a burst costs one copy rather than one each.
+        """
+        self._deleted.add(rating_key)
+        async with self._catalog_lock:
+            deleted, self._deleted = self._deleted, set()
+            entry = self._catalog
+            if entry is None:
+                return
+            removed = [key for key in deleted if key in entry.catalog.records]
+            if not removed:
+                return
+            patched = await run_cpu(entry.catalog.patched, removed=removed)
+            self._swap_catalog(entry, patched)
+
+    def apply_changed(self) -> None:
+        """Plex reports added or updated items: fetch one delta once the burst settles.
+
+        A library scan reports every item it touches, so the events are
+        coalesced rather than each starting a refresh.
+        """
+        if self._catalog is None:
+            return
+        self._last_change = time.monotonic()
+        if not self._settling:
+            self._settling = True
+            self._spawn(self._settle_changes())
+
+    async def _settle_changes(self) -> None:
+        first = time.monotonic()
+        try:
+            while True:
+                deadline = min(self._last_change + _CHANGE_QUIET, first + _CHANGE_MAX_DELAY)
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            self._settling = False
+        if self._catalog is None:
+            return
+        self._catalog.stale = True
+        # The catalog is shared, so one user's refresh fetches the delta for everyone
+        discord_id = next(iter(self._active), None)
+        if discord_id is not None:
+            await self._revalidate(discord_id)
@@ -1,22 +1,44 @@
 from __future__ import annotations
 
 import asyncio
+import logging
 import time
 from typing import Dict, Tuple
 from xml.etree.ElementTree import fromstring
 
-import requests
+from plexapi.exceptions import Unauthorized
 from plexapi.myplex import MyPlexAccount
 from plexapi.server import PlexServer
 
 import config
+from db.servers import delete_server_connection, load_server_connection, save_server_connection
+from plex import aioplex, http
+from plex.aioplex import AioPlexServer
+from plex.stream import TRANSPORT_ERRORS, PlexConnection
+from utils.singleflight import SingleFlight
 
-# Cache: discord_id → (PlexServer, timestamp)
-_server_cache: Dict[str, Tuple[PlexServer, float]] = {}
+log = logging.getLogger(__name__)
+
+# Cache: discord_id → (server connection, timestamp)
+_server_cache: Dict[str, Tuple[PlexConnection, float]] = {}
 _CACHE_TTL = 300  # 5 minutes
+_DENIED_TTL = 600  # seconds before plex.tv is asked again for a user without access
+
+_NO_ACCESS = (
+    "Your Plex account does not have access to the configured server. "
+    "Make sure you've been invited to the server."
+)
 
 # Resolved once on first use
 _machine_id: str | None = None
+_admin_server: PlexConnection | None = None
+
+# Concurrent connects for the same user share one MyPlexAccount round trip
+_connect_flights = SingleFlight()
+
+
+class NoServerAccess(RuntimeError):
+    """The user's Plex account cannot see the configured server."""
 
 
 def _is_fresh(ts: float) -> bool:
@@ -25,45 +47,112 @@ def _is_fresh(ts: float) -> bool:
 
 def _get_machine_id() -> str:
     """Get the machine identifier from the /identity endpoint (no auth required)."""
-    resp = requests.get(f"{config.PLEX_URL.rstrip('/')}/identity", timeout=10)
+    resp = http.session().get(f"{config.PLEX_URL.rstrip('/')}/identity", timeout=10)
     resp.raise_for_status()
     return fromstring(resp.content).attrib["machineIdentifier"]
 
 
-def _connect_via_account(plex_token: str) -> PlexServer:
+async def _resolve_machine_id() -> str:
+    global _machine_id
+    if _machine_id is None:
+        if config.PLEX_TRANSPORT == "aiohttp":
+            _machine_id = await aioplex.get_machine_identifier(config.PLEX_URL)
+        else:
+            loop = asyncio.get_running_loop()
+            _machine_id = await loop.run_in_executor(None, _get_machine_id)
+    return _machine_id
+
+
+def _connect_via_account(plex_token: str, machine_id: str) -> PlexServer:
     """Connect to the configured Plex server via MyPlexAccount.
 
     Matches the server by machine identifier so it works regardless of
     whether PLEX_URL is localhost, a LAN IP, or a public address.
     Gives shared/friend users a properly scoped access token.
     """
-    global _machine_id
-    if _machine_id is None:
-        _machine_id = _get_machine_id()
-
-    account = MyPlexAccount(token=plex_token)
+    account = MyPlexAccount(token=plex_token, session=http.session(), timeout=http.TIMEOUT)
     for resource in account.resources():
-        if resource.product == "Plex Media Server" and resource.clientIdentifier == _machine_id:
-            return resource.connect()
-    raise RuntimeError(
-        "Your Plex account does not have access to the configured server. "
-        "Make sure you've been invited to the server."
+        if resource.product == "Plex Media Server" and resource.clientIdentifier == machine_id:
+            # The server shares the account's session, so http.session() too
+            return resource.connect(timeout=http.TIMEOUT)
+    raise NoServerAccess(_NO_ACCESS)
+
+
+async def _connect_direct(uri: str, server_token: str) -> PlexConnection:
+    """Connect with a previously resolved URI and server token; no plex.tv round trip."""
+    if config.PLEX_TRANSPORT == "aiohttp":
+        return await AioPlexServer.connect(uri, server_token)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, lambda: PlexServer(uri, server_token, session=http.session(), timeout=http.TIMEOUT)
     )
 
 
-async def get_server(discord_id: str, plex_token: str) -> PlexServer:
-    """Return a (possibly cached) PlexServer for this user's token."""
+async def _connect(discord_id: str, plex_token: str) -> PlexConnection:
+    loop = asyncio.get_running_loop()
+    machine_id = await _resolve_machine_id()
+
+    saved = await load_server_connection(discord_id, machine_id)
+    if saved is not None:
+        server_token, uri, age = saved
+        if server_token is None:
+            if age < _DENIED_TTL:
+                raise NoServerAccess(_NO_ACCESS)
+        else:
+            try:
+                return await _connect_direct(uri, server_token)
+            except (Unauthorized, *TRANSPORT_ERRORS) as exc:
+                # Token revoked or the address changed: ask plex.tv again
+                log.info("Saved Plex connection for %s failed (%s); resolving again.",
+                         discord_id, type(exc).__name__)
+
+    try:
+        server: PlexServer = await loop.run_in_executor(
+            None, _connect_via_account, plex_token, machine_id
+        )
+    except NoServerAccess:
+        await save_server_connection(discord_id, machine_id, None, None)
+        raise
+    await save_server_connection(discord_id, machine_id, server._token, server._baseurl)
+    if config.PLEX_TRANSPORT == "aiohttp":
+        # plex.tv resources are only reachable through plexapi; requests from here on are native
+        return AioPlexServer(server._baseurl, server._token)
+    return server
+
+
+async def get_server(discord_id: str, plex_token: str) -> PlexConnection:
+    """Return a (possibly cached) server connection for this user's token.
+
+    Uses the server token and address saved by an earlier resolution when
+    they still work; plex.tv is only consulted when they don't, and users
+    without access are remembered for _DENIED_TTL seconds.
+    """
     cached = _server_cache.get(discord_id)
     if cached and _is_fresh(cached[1]):
         return cached[0]
 
-    loop = asyncio.get_running_loop()
-    server: PlexServer = await loop.run_in_executor(
-        None,
-        lambda: _connect_via_account(plex_token),
-    )
-    _server_cache[discord_id] = (server, time.monotonic())
-    return server
+    async def connect() -> PlexConnection:
+        server = await _connect(discord_id, plex_token)
+        _server_cache[discord_id] = (server, time.monotonic())
+        return server
+
+    return await _connect_flights.do(discord_id, connect)
+
+
+async def get_admin_server() -> PlexConnection | None:
+    """The connection made with the admin PLEX_TOKEN, or None when it is not set.
+
+    It sees every item in every library, whatever the sharing restrictions
+    on a friend's account, so the shared catalogs are read through it.
+    """
+    global _admin_server
+    if not config.PLEX_TOKEN:
+        return None
+    if _admin_server is None:
+        _admin_server = await _connect_flights.do(
+            ("admin",), lambda: _connect_direct(config.PLEX_URL, config.PLEX_TOKEN)
+        )
+    return _admin_server
 
 
 def get_machine_id() -> str | None:
@@ -73,3 +162,9 @@ def get_machine_id() -> str | None:
 
 def invalidate_cache(discord_id: str) -> None:
     _server_cache.pop(discord_id, None)
+
+
+async def forget_server(discord_id: str) -> None:
+    """Drop the user's resolved connection after Plex rejected its token."""
+    invalidate_cache(discord_id)
+    await delete_server_connection(discord_id)
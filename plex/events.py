@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from aiohttp import web
+from plexapi.server import PlexServer
+
+from plex import http
+from plex.cache import IndexCache
+
+log = logging.getLogger(__name__)
+
+WATCHED = "watched"   # playback finished (scrobbled) by a user
+CHANGED = "changed"   # item added to, or updated in, a library section
+DELETED = "deleted"   # item removed from a library section
+
+# Plex timeline entry states (alert websocket)
+_TIMELINE_DONE = 5
+_TIMELINE_DELETED = 9
+_TIMELINE_TYPES = {1, 2, 4}  # movie, show, episode
+
+Emit = Callable[["PlexEvent"], None]
+UserResolver = Callable[[str], Awaitable[List[str]]]
+
+
+@dataclass(frozen=True)
+class PlexEvent:
+    kind: str                               # WATCHED / CHANGED / DELETED
+    rating_key: str                         # movie or show ratingKey
+    section_key: Optional[str] = None
+    plex_username: Optional[str] = None     # WATCHED only
+
+
+def parse_webhook(payload: dict) -> Optional[PlexEvent]:
+    """Map a Plex webhook payload to a PlexEvent, or None if it is irrelevant."""
+    meta = payload.get("Metadata") or {}
+    # Episodes count towards their show, which is what the series index holds
+    key = meta.get("grandparentRatingKey") if meta.get("type") == "episode" else meta.get("ratingKey")
+    if not key:
+        return None
+    section = meta.get("librarySectionID")
+    section = str(section) if section is not None else None
+    event = payload.get("event")
+    if event == "media.scrobble":
+        username = (payload.get("Account") or {}).get("title")
+        return PlexEvent(WATCHED, str(key), section, username) if username else None
+    if event == "library.new":
+        return PlexEvent(CHANGED, str(key), section)
+    return None
+
+
+def parse_timeline(entry: dict) -> Optional[PlexEvent]:
+    """Map an alert-websocket TimelineEntry to a PlexEvent, or None."""
+    if entry.get("type") not in _TIMELINE_TYPES or "itemID" not in entry:
+        return None
+    section = str(entry["sectionID"]) if entry.get("sectionID") not in (None, -1, "-1") else None
+    state = entry.get("state")
+    if state == _TIMELINE_DELETED:
+        return PlexEvent(DELETED, str(entry["itemID"]), section)
+    if state == _TIMELINE_DONE:
+        return PlexEvent(CHANGED, str(entry["itemID"]), section)
+    return None
+
+
+class LocalEventSource:
+    """In-process event source; push() events from tests or other components."""
+
+    def __init__(self) -> None:
+        self._emit: Optional[Emit] = None
+
+    async def start(self, emit: Emit) -> None:
+        self._emit = emit
+
+    async def stop(self) -> None:
+        self._emit = None
+
+    def push(self, event: PlexEvent) -> None:
+        if self._emit is not None:
+            self._emit(event)
+
+
+class WebhookEventSource:
+    """Listens for Plex webhooks (Settings → Webhooks, Plex Pass) over HTTP.
+
+    Anyone who can reach the listener can post events, so it binds to
+    localhost unless told otherwise. With a `secret`, only posts to
+    <path>/<secret> are accepted; Plex cannot send headers, so the secret
+    has to be part of the URL.
+    """
+
+    def __init__(self, host: str, port: int, path: str = "/plex-webhook", secret: Optional[str] = None):
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret = secret
+        self._runner: Optional[web.AppRunner] = None
+        self._emit: Optional[Emit] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self._secret is not None and not hmac.compare_digest(
+            request.match_info.get("secret", ""), self._secret
+        ):
+            return web.Response(status=404)
+        form = await request.post()
+        try:
+            payload = json.loads(form.get("payload", "{}"))
+        except (TypeError, ValueError):
+            return web.Response(status=400)
+        event = parse_webhook(payload)
+        if event is not None and self._emit is not None:
+            self._emit(event)
+        return web.Response(status=204)
+
+    async def start(self, emit: Emit) -> None:
+        self._emit = emit
+        app = web.Application()
+        route = self._path if self._secret is None else f"{self._path}/{{secret}}"
+        app.router.add_post(route, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        log.info("Listening for Plex webhooks on %s:%s%s%s.", self._host, self._port, self._path,
+                 "/<secret>" if self._secret is not None else "")
+        if self._secret is None and self._host not in ("127.0.0.1", "localhost", "::1"):
+            log.warning("The Plex webhook listener on %s has no PLEX_WEBHOOK_SECRET; "
+                        "anyone who can reach it can post watch events.", self._host)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class AlertEventSource:
+    """Subscribes to the server's alert websocket (needs an admin token and websocket-client)."""
+
+    def __init__(self, baseurl: str, token: str):
+        self._baseurl = baseurl
+        self._token = token
+        self._listener = None
+
+    async def start(self, emit: Emit) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_alert(data: dict) -> None:
+            # Runs on the listener thread
+            if data.get("type") != "timeline":
+                return
+            for entry in data.get("TimelineEntry", []):
+                event = parse_timeline(entry)
+                if event is not None:
+                    loop.call_soon_threadsafe(emit, event)
+
+        server = await loop.run_in_executor(
+            None, lambda: PlexServer(self._baseurl, self._token, session=http.session())
+        )
+        self._listener = server.startAlertListener(callback=on_alert)
+        log.info("Subscribed to Plex alert notifications.")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+class EventDispatcher:
+    """Applies Plex events from any number of sources to the index caches."""
+
+    def __init__(self, caches: List[IndexCache], resolve_user: UserResolver):
+        self._caches = caches
+        self._resolve_user = resolve_user
+        self._queue: asyncio.Queue[PlexEvent] = asyncio.Queue()
+        self._sources: list = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, sources: list) -> None:
+        for source in sources:
+            try:
+                await source.start(self._queue.put_nowait)
+                self._sources.append(source)
+            except Exception:
+                log.warning("Could not start event source %s.", type(source).__name__, exc_info=True)
+        self._task = asyncio.create_task(self._run(), name="plex_events")
+
+    async def stop(self) -> None:
+        for source in self._sources:
+            await source.stop()
+        self._sources.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            event = await self._queue.get()
+            try:
+                await self.apply(event)
+            except Exception:
+                log.warning("Failed to apply Plex event %s.", event, exc_info=True)
+
+    async def apply(self, event: PlexEvent) -> None:
+        caches = [
+            c for c in self._caches
+            if event.section_key is None or c.section_key in (None, event.section_key)
+        ]
+        if event.kind == WATCHED:
+            for discord_id in await self._resolve_user(event.plex_username):
+                for cache in caches:
+                    cache.apply_watched(discord_id, event.rating_key)
+        elif event.kind == DELETED:
+            for cache in caches:
+                await cache.apply_deleted(event.rating_key)
+        elif event.kind == CHANGED:
+            for cache in caches:
+                cache.apply_changed()
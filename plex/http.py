@@ -0,0 +1,96 @@
+"""The one HTTP transport all Plex and plex.tv requests go through.
+
+Every PlexServer, MyPlexAccount and PIN login gets session(), so all users'
+requests share keep-alive connections (and TLS sessions) per host instead of
+each connection opening its own. At most PLEX_HTTP_POOL_SIZE connections are
+kept per host; further requests to that host wait for a free one. Requests
+made without a timeout get PLEX_HTTP_TIMEOUT.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import config
+
+log = logging.getLogger(__name__)
+
+TIMEOUT: float = config.PLEX_HTTP_TIMEOUT
+
+_HOST_POOLS = 16  # hosts whose connection pools are kept (Plex server URIs, plex.tv)
+
+_lock = threading.Lock()
+_counts: Dict[str, int] = {"requests": 0, "opened": 0}
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counts[name] += 1
+
+
+class _CountingPool:
+    def _new_conn(self):
+        _count("opened")
+        return super()._new_conn()
+
+
+class _CountingHTTPPool(_CountingPool, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSPool(_CountingPool, HTTPSConnectionPool):
+    pass
+
+
+class _PlexAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPPool,
+            "https": _CountingHTTPSPool,
+        }
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = TIMEOUT
+        _count("requests")
+        return super().send(request, **kwargs)
+
+
+def _new_session() -> requests.Session:
+    s = requests.Session()
+    adapter = _PlexAdapter(
+        pool_connections=_HOST_POOLS, pool_maxsize=config.PLEX_HTTP_POOL_SIZE, pool_block=True
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+_session = _new_session()
+
+
+def session() -> requests.Session:
+    """The shared session; safe to use from any thread."""
+    return _session
+
+
+def stats() -> Dict[str, int]:
+    """Requests sent, connections opened, and requests that reused a connection."""
+    with _lock:
+        counts = dict(_counts)
+    counts["reused"] = max(0, counts["requests"] - counts["opened"])
+    return counts
+
+
+def close() -> None:
+    """Close every pooled connection and log the counters."""
+    counts = stats()
+    log.info("Plex HTTP: %d request(s), %d connection(s) opened, %d reused.",
+             counts["requests"], counts["opened"], counts["reused"])
+    _session.close()
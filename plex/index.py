@@ -1,110 +1,807 @@
 from __future__ import annotations
 
-import asyncio
+import logging
+import weakref
+from array import array
 from dataclasses import dataclass, field
-from typing import Dict, FrozenSet, List, Optional
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+from xml.etree.ElementTree import Element
 
-from plexapi.server import PlexServer
+from plexapi import utils as plexutils
+from plexapi.exceptions import NotFound
 
 import config
+from plex.bitmaps import BitmapIndex, bitmap, mask_bits
+from plex.search import TitleIndex
+from plex.stream import (
+    TRANSPORT_ERRORS,
+    PlexConnection,
+    element_rating_key,
+    fetch_container,
+    iter_metadata,
+    iter_pages,
+    section_path,
+)
+from utils.workers import run_cpu
 
+log = logging.getLogger(__name__)
 
-def _thumb_url(movie, token: str) -> Optional[str]:
-    thumb = getattr(movie, "thumb", None)
+
+def _thumb_url(thumb: Optional[str], token: str) -> Optional[str]:
     if not thumb:
         return None
     return f"{config.PLEX_PUBLIC_URL}{thumb}?X-Plex-Token={token}"
 
 
-@dataclass
+class Vocabulary:
+    """Interns feature names (genres, directors, actors) to dense integer ids."""
+    __slots__ = ("ids", "names")
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        fid = self.ids.get(name)
+        if fid is None:
+            fid = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return fid
+
+    def get(self, name: str) -> Optional[int]:
+        return self.ids.get(name)
+
+    def copy(self) -> "Vocabulary":
+        vocab = Vocabulary()
+        vocab.ids = dict(self.ids)
+        vocab.names = list(self.names)
+        return vocab
+
+
+class RawRecord(NamedTuple):
+    """A record as parsed from Plex, before its names are interned."""
+    rating_key: str
+    title: str
+    year: Optional[int]
+    genres: Tuple[str, ...]       # lower-cased
+    directors: Tuple[str, ...]
+    actors: Tuple[str, ...]       # billing order, capped at 10
+    rating: Optional[float]
+    audience_rating: Optional[float]
+    summary: str = ""
+    thumb: Optional[str] = None   # server-relative path, no token
+
+
+@dataclass(slots=True)
 class MovieRecord:
     rating_key: str
     title: str
     year: Optional[int]
     decade: Optional[int]
-    genres: FrozenSet[str]
-    directors: FrozenSet[str]
-    actors: FrozenSet[str]        # capped at 10
+    genre_mask: int               # bit i set ⇔ genre id i (catalog.genre_vocab)
+    directors: array              # director ids (catalog.director_vocab)
+    actors: array                 # actor ids in billing order, capped at 10
     rating: Optional[float]
     audience_rating: Optional[float]
-    watched: bool
     summary: str = ""
-    thumb_url: Optional[str] = None
+    thumb: Optional[str] = None   # server-relative path, no token
+    seq: int = 0                  # insertion order in the catalog (ties break on it)
+
+
+def _own_lists(index: Dict, features: Iterable) -> Dict:
+    """A copy of `index` with fresh lists for `features`; every other list stays shared."""
+    index = dict(index)
+    for feature in features:
+        keys = index.get(feature)
+        if keys is not None:
+            index[feature] = list(keys)
+    return index
+
+
+def _known_ids(vocab: Vocabulary, names: Iterable[str]) -> List[int]:
+    return [fid for fid in map(vocab.get, names) if fid is not None]
+
+
+def _vocab_for(vocab: Vocabulary, names: Iterable[str]) -> Vocabulary:
+    """`vocab` itself if it already holds every name, else a copy to intern them into."""
+    return vocab if all(name in vocab.ids for name in names) else vocab.copy()
+
+
+def _unindex(index: Dict, features: Iterable, rating_key: str) -> None:
+    for feature in features:
+        keys = index.get(feature)
+        if keys is None:
+            continue
+        keys.remove(rating_key)
+        if not keys:
+            del index[feature]
 
 
 @dataclass
-class MovieIndex:
+class Catalog:
+    """Library metadata shared by every user of the server.
+
+    Genre, director and actor names are interned once per catalog; records
+    hold only their integer ids (genres as a bitmask), so repeated names cost
+    nothing per title and the scorer can intersect ids directly.
+
+    Once shared, a catalog's records and indexes never change: refreshes
+    and deletions build a patched() copy off the loop and swap it in (see
+    plex.cache), so rankings on worker threads keep reading the catalog they
+    started with and nobody needs a lock.
+    """
+    section_key: str
     records: Dict[str, MovieRecord]                  # rating_key → record
-    watched_order: List[str]                         # newest-first rating_keys
     genre_index: Dict[str, List[str]]                # genre → [rating_keys]
+    updated_at: int = 0                              # newest addedAt/updatedAt seen (epoch)
+    library_updated_at: int = 0                      # section.updatedAt at last sync (epoch)
+    version: int = 0                                 # bumped by every patched() copy
+    genre_vocab: Vocabulary = field(default_factory=Vocabulary)
+    director_vocab: Vocabulary = field(default_factory=Vocabulary)
+    actor_vocab: Vocabulary = field(default_factory=Vocabulary)
+    # Inverted indexes, like genre_index; lists stay in catalog (seq) order
+    director_index: Dict[int, List[str]] = field(default_factory=dict)  # director id → [rating_keys]
+    actor_index: Dict[int, List[str]] = field(default_factory=dict)     # actor id → [rating_keys]
+    decade_index: Dict[int, List[str]] = field(default_factory=dict)    # decade → [rating_keys]
+    _seq: int = field(default=0, init=False, repr=False, compare=False)
+    _by_seq: Dict[int, MovieRecord] = field(default_factory=dict, init=False, repr=False, compare=False)
+    # rating_keys best-rated first, and the version they were sorted at
+    _top_rated: List[str] = field(default_factory=list, init=False, repr=False, compare=False)
+    _top_rated_version: int = field(default=-1, init=False, repr=False, compare=False)
+    _bitmaps: Optional[BitmapIndex] = field(default=None, init=False, repr=False, compare=False)
+    _bitmaps_version: int = field(default=-1, init=False, repr=False, compare=False)
+    _titles: Optional[TitleIndex] = field(default=None, init=False, repr=False, compare=False)
+    _titles_version: int = field(default=-1, init=False, repr=False, compare=False)
+    # Indexes derived by other modules (recommender.text, recommender.neighbours),
+    # shared with patched copies so they can catch up instead of starting over
+    derived: Dict[str, object] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def add(self, raw: RawRecord) -> MovieRecord:
+        """Intern and insert (or replace) a record, keeping genre_index in sync."""
+        if raw.rating_key in self.records:
+            self.remove(raw.rating_key)
+        genre_mask = 0
+        for genre in raw.genres:
+            genre_mask |= 1 << self.genre_vocab.intern(genre)
+        record = MovieRecord(
+            rating_key=raw.rating_key,
+            title=raw.title,
+            year=raw.year,
+            decade=_decade(raw.year),
+            genre_mask=genre_mask,
+            directors=array("I", map(self.director_vocab.intern, raw.directors)),
+            actors=array("I", map(self.actor_vocab.intern, raw.actors)),
+            rating=raw.rating,
+            audience_rating=raw.audience_rating,
+            summary=raw.summary,
+            thumb=raw.thumb,
+            seq=self._seq,
+        )
+        self._seq += 1
+        key = record.rating_key
+        self.records[key] = record
+        self._by_seq[record.seq] = record
+        for genre in raw.genres:
+            self.genre_index.setdefault(genre, []).append(key)
+        for director in record.directors:
+            self.director_index.setdefault(director, []).append(key)
+        for actor in record.actors:
+            self.actor_index.setdefault(actor, []).append(key)
+        if record.decade is not None:
+            self.decade_index.setdefault(record.decade, []).append(key)
+        return record
+
+    def remove(self, rating_key: str) -> None:
+        record = self.records.pop(rating_key, None)
+        if record is None:
+            return
+        del self._by_seq[record.seq]
+        _unindex(self.genre_index, self.genres_of(record), rating_key)
+        _unindex(self.director_index, record.directors, rating_key)
+        _unindex(self.actor_index, record.actors, rating_key)
+        if record.decade is not None:
+            _unindex(self.decade_index, (record.decade,), rating_key)
+
+    def patched(
+        self, changed: Iterable[Tuple[RawRecord, int]] = (), removed: Iterable[str] = ()
+    ) -> "Catalog":
+        """A copy one version on, with (record, changed_at) pairs added and `removed` dropped.
+
+        This catalog is left as it was. The copy shares every posting list
+        and vocabulary the patch does not touch, so apart from copying the
+        record dicts (O(N), but in C) a patch costs O(titles it changes).
+        Run it on a worker thread all the same.
+        """
+        changed, removed = list(changed), list(removed)
+        # Features whose posting lists the patch edits: those of the records it
+        # drops or replaces, and those of the records it adds
+        genres: Set[str] = set()
+        directors: Set[int] = set()
+        actors: Set[int] = set()
+        decades: Set[Optional[int]] = set()
+        for key in removed + [raw.rating_key for raw, _ in changed]:
+            record = self.records.get(key)
+            if record is not None:
+                genres.update(self.genres_of(record))
+                directors.update(record.directors)
+                actors.update(record.actors)
+                decades.add(record.decade)
+        for raw, _ in changed:
+            genres.update(raw.genres)
+            directors.update(_known_ids(self.director_vocab, raw.directors))
+            actors.update(_known_ids(self.actor_vocab, raw.actors))
+            decades.add(_decade(raw.year))
+
+        catalog = Catalog(
+            section_key=self.section_key,
+            records=dict(self.records),
+            genre_index=_own_lists(self.genre_index, genres),
+            updated_at=self.updated_at,
+            library_updated_at=self.library_updated_at,
+            version=self.version + 1,
+            genre_vocab=_vocab_for(self.genre_vocab, (g for raw, _ in changed for g in raw.genres)),
+            director_vocab=_vocab_for(
+                self.director_vocab, (d for raw, _ in changed for d in raw.directors)
+            ),
+            actor_vocab=_vocab_for(self.actor_vocab, (a for raw, _ in changed for a in raw.actors)),
+            director_index=_own_lists(self.director_index, directors),
+            actor_index=_own_lists(self.actor_index, actors),
+            decade_index=_own_lists(self.decade_index, decades),
+        )
+        catalog._seq = self._seq
+        catalog._by_seq = dict(self._by_seq)
+        # Kept for latest_titles() until the new version's index is built
+        catalog._titles, catalog._titles_version = self._titles, self._titles_version
+        catalog.derived = self.derived
+        _add_page(catalog, changed)
+        for key in removed:
+            catalog.remove(key)
+        return catalog
+
+    def record_at(self, seq: int) -> Optional[MovieRecord]:
+        """The live record with this seq; None once it is removed or replaced."""
+        return self._by_seq.get(seq)
+
+    @property
+    def last_seq(self) -> int:
+        """Highest seq handed out so far (-1 when empty); newer records have higher seqs."""
+        return self._seq - 1
+
+    def genres_of(self, record: MovieRecord) -> List[str]:
+        names = self.genre_vocab.names
+        return [names[i] for i in mask_bits(record.genre_mask)]
+
+    def directors_of(self, record: MovieRecord) -> List[str]:
+        names = self.director_vocab.names
+        return [names[i] for i in record.directors]
+
+    def actors_of(self, record: MovieRecord) -> List[str]:
+        names = self.actor_vocab.names
+        return [names[i] for i in record.actors]
+
+    def top_rated(self) -> List[str]:
+        """rating_keys by audience (else critic) rating, best first; ties keep library order.
+
+        Sorted once per catalog version, so fallbacks only walk the head of it.
+        """
+        if self._top_rated_version != self.version:
+            self._top_rated = sorted(
+                self.records, key=lambda k: _rating_of(self.records[k]), reverse=True
+            )
+            self._top_rated_version = self.version
+        return self._top_rated
+
+    def bitmaps(self) -> BitmapIndex:
+        """Genre, decade and rating bitmaps over record seqs, rebuilt once per version."""
+        if self._bitmaps_version != self.version:
+            self._bitmaps = BitmapIndex(self.records.values(), self.genre_vocab.names)
+            self._bitmaps_version = self.version
+        return self._bitmaps
+
+    def build_titles(self) -> TitleIndex:
+        """A TitleIndex of this catalog; shared catalogs never change, so safe off-loop."""
+        return TitleIndex(
+            (r.seq, r.title, r.rating_key, _rating_of(r)) for r in self.records.values()
+        )
+
+    def titles(self) -> TitleIndex:
+        """Title autocomplete index for the current version, built here if needed."""
+        if self._titles_version != self.version:
+            self.install_titles(self.build_titles(), self.version)
+        return self._titles
+
+    def install_titles(self, titles: TitleIndex, version: int) -> None:
+        """Adopt a TitleIndex built elsewhere from this catalog at `version`."""
+        if version >= self._titles_version:
+            self._titles = titles
+            self._titles_version = version
+
+    def latest_titles(self) -> Optional[TitleIndex]:
+        """The newest TitleIndex built so far, possibly a version behind; never builds."""
+        return self._titles
+
+    def bits_of(self, rating_keys: Iterable[str]) -> int:
+        """Bitmap of the given records' seqs; unknown keys are ignored."""
+        records = self.records
+        return bitmap(records[k].seq for k in rating_keys if k in records)
+
+    def raw(self, record: MovieRecord) -> RawRecord:
+        return RawRecord(
+            rating_key=record.rating_key,
+            title=record.title,
+            year=record.year,
+            genres=tuple(self.genres_of(record)),
+            directors=tuple(self.directors_of(record)),
+            actors=tuple(self.actors_of(record)),
+            rating=record.rating,
+            audience_rating=record.audience_rating,
+            summary=record.summary,
+            thumb=record.thumb,
+        )
+
+
+@dataclass
+class WatchOverlay:
+    """A single user's watch state on top of a shared Catalog."""
+    watched_order: List[str]                         # newest-first rating_keys
+    last_viewed_at: int = 0                          # newest viewedAt seen (epoch)
+    version: int = 0
+    # rating_keys the user's Plex account can open; None if it sees the whole catalog
+    visible: Optional[FrozenSet[str]] = None
+    watched: Set[str] = field(init=False)
+    # (catalog ref, catalog version, version, watched bitmap over catalog seqs);
+    # one tuple so a reader on another thread never pairs a stamp with other bits
+    _bits: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+    # (catalog ref, catalog version, visible bitmap over catalog seqs)
+    _visible_bits: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.watched = set(self.watched_order)
+
+    def prepend(self, newest_first: List[str]) -> None:
+        """Move freshly watched keys to the front of watched_order.
+
+        Replaces watched_order and watched rather than mutating them, so a
+        worker thread reading the old ones is unaffected.
+        """
+        fresh = set(newest_first)
+        self.watched_order = newest_first + [
+            k for k in self.watched_order if k not in fresh
+        ]
+        self.watched = self.watched | fresh
+        self.version += 1
+
+
+@dataclass
+class MovieIndex:
+    """A user's view of the library: shared catalog plus their overlay."""
+    catalog: Catalog
+    overlay: WatchOverlay
+    token: str                                       # user-scoped, for thumbs
+
+    @property
+    def records(self) -> Dict[str, MovieRecord]:
+        return self.catalog.records
+
+    @property
+    def genre_index(self) -> Dict[str, List[str]]:
+        return self.catalog.genre_index
+
+    @property
+    def watched_order(self) -> List[str]:
+        return self.overlay.watched_order
+
+    @property
+    def watched_count(self) -> int:
+        return sum(1 for k in self.overlay.watched if k in self.catalog.records)
+
+    def is_watched(self, rating_key: str) -> bool:
+        return rating_key in self.overlay.watched
+
+    def is_visible(self, rating_key: str) -> bool:
+        """Whether the user's Plex account can open this title."""
+        visible = self.overlay.visible
+        return visible is None or rating_key in visible
+
+    def watched_bits(self) -> int:
+        """Bitmap of watched records over catalog seqs, cached until either side changes."""
+        overlay, catalog = self.overlay, self.catalog
+        cached = overlay._bits
+        # Versions are read before the watched set, so a concurrent prepend()
+        # can only leave the cache stale, never stamped with the wrong bits
+        versions = (catalog.version, overlay.version)
+        if cached is not None and cached[0]() is catalog and cached[1:3] == versions:
+            return cached[3]
+        bits = catalog.bits_of(overlay.watched)
+        overlay._bits = (weakref.ref(catalog), *versions, bits)
+        return bits
+
+    def visible_bits(self) -> int:
+        """Bitmap of the records the user can open, cached per catalog version."""
+        overlay, catalog = self.overlay, self.catalog
+        if overlay.visible is None:
+            return catalog.bitmaps().all
+        cached = overlay._visible_bits
+        version = catalog.version
+        if cached is not None and cached[0]() is catalog and cached[1] == version:
+            return cached[2]
+        bits = catalog.bits_of(overlay.visible)
+        overlay._visible_bits = (weakref.ref(catalog), version, bits)
+        return bits
+
+    def thumb_url(self, record: MovieRecord) -> Optional[str]:
+        return _thumb_url(record.thumb, self.token)
+
+
+class Section(NamedTuple):
+    key: str
+    type: str                     # "movie" / "show"
+    title: str
+    updated_at: int               # epoch
+
+
+class HistoryEntry(NamedTuple):
+    rating_key: str
+    grandparent_rating_key: str   # the show, for episodes
+    viewed_at: int                # epoch
+
+
+RecordBuilder = Callable[[Element], RawRecord]
+HistoryKey = Callable[[HistoryEntry], Optional[str]]
+WatchState = Tuple[str, int, bool]  # (rating_key, lastViewedAt epoch, watched)
+
+WATCH_PAGE_SIZE = 100  # watched items sort first, so one page usually suffices
+HISTORY_PATH = "/status/sessions/history/all"
+
+
+@dataclass(frozen=True)
+class _WatchSource:
+    """How to read one library type's watch state, from listings or history."""
+    libtype: str                                     # "movie" / "show"
+    watch_state: Callable[[Element], WatchState]     # listing element → state
+    history_key: HistoryKey                          # history entry → rating_key
+
+
+def _rating_of(record: MovieRecord) -> float:
+    """Audience rating, else critic rating: what top-rated lists sort by."""
+    return record.audience_rating or record.rating or 0.0
 
 
 def _decade(year: Optional[int]) -> Optional[int]:
     return (year // 10) * 10 if year else None
 
 
-def _build_record(movie, watched_keys: set, token: str) -> MovieRecord:
-    year = getattr(movie, "year", None)
-    genres = frozenset(g.tag.lower() for g in (movie.genres or []))
-    directors = frozenset(d.tag for d in (movie.directors or []))
-    actors = frozenset(r.tag for r in (movie.roles or [])[:10])
-    rating = getattr(movie, "rating", None)
-    audience_rating = getattr(movie, "audienceRating", None)
-    summary = getattr(movie, "summary", "") or ""
-
-    return MovieRecord(
-        rating_key=str(movie.ratingKey),
-        title=movie.title,
-        year=year,
-        decade=_decade(year),
+def _int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value else None
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value else None
+
+
+def _tags(elem: Element, tag: str) -> List[str]:
+    return [child.get("tag", "") for child in elem.findall(tag)]
+
+
+def _unique(names: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(names))
+
+
+def _changed_at(elem: Element) -> int:
+    return max(_int(elem.get("addedAt")) or 0, _int(elem.get("updatedAt")) or 0)
+
+
+def _build_record(elem: Element) -> RawRecord:
+    genres = _unique(g.lower() for g in _tags(elem, "Genre"))
+    directors = _unique(_tags(elem, "Director"))
+    actors = _unique(_tags(elem, "Role"))[:10]
+
+    return RawRecord(
+        rating_key=elem.get("ratingKey"),
+        title=elem.get("title", ""),
+        year=_int(elem.get("year")),
         genres=genres,
         directors=directors,
         actors=actors,
-        rating=rating,
-        audience_rating=audience_rating,
-        watched=str(movie.ratingKey) in watched_keys,
-        summary=summary,
-        thumb_url=_thumb_url(movie, token),
+        rating=_float(elem.get("rating")),
+        audience_rating=_float(elem.get("audienceRating")),
+        summary=elem.get("summary", ""),
+        thumb=elem.get("thumb"),
+    )
+
+
+def _with_changed_at(build_record: RecordBuilder) -> Callable[[Element], Tuple[RawRecord, int]]:
+    def convert(elem: Element) -> Tuple[RawRecord, int]:
+        return build_record(elem), _changed_at(elem)
+    return convert
+
+
+def _movie_history_key(item: HistoryEntry) -> Optional[str]:
+    return item.rating_key
+
+
+def _movie_watch_state(elem: Element) -> WatchState:
+    return (
+        element_rating_key(elem),
+        _int(elem.get("lastViewedAt")) or 0,
+        (_int(elem.get("viewCount")) or 0) > 0,
     )
 
 
-async def build_index(server: PlexServer, library_name: str = "Movies") -> MovieIndex:
-    """Fetch all movies and watch history, return a MovieIndex."""
-    loop = asyncio.get_running_loop()
-    token: str = server._token
+_MOVIE_WATCH = _WatchSource("movie", _movie_watch_state, _movie_history_key)
+
 
-    section = await loop.run_in_executor(
-        None, lambda: server.library.section(library_name)
+def _section_entry(elem: Element) -> Section:
+    return Section(
+        key=elem.get("key", ""),
+        type=elem.get("type", ""),
+        title=elem.get("title", ""),
+        updated_at=_int(elem.get("updatedAt")) or 0,
     )
 
-    movies = await loop.run_in_executor(None, section.all)
 
-    # Fetch history scoped to this library section
-    history = await loop.run_in_executor(
-        None,
-        lambda: server.history(librarySectionID=section.key),
+def _history_entry(elem: Element) -> HistoryEntry:
+    return HistoryEntry(
+        rating_key=element_rating_key(elem),
+        grandparent_rating_key=elem.get("grandparentRatingKey", ""),
+        viewed_at=_int(elem.get("viewedAt")) or 0,
     )
 
-    # Build watched set and ordered list (history is newest-first)
-    seen: set[str] = set()
-    watched_order: List[str] = []
+
+async def _section(server: PlexConnection, library_name: str) -> Section:
+    """The library section titled `library_name` (matched like plexapi's library.section())."""
+    sections, _ = await fetch_container(server, "/library/sections", {}, _section_entry)
+    wanted = library_name.lower().strip()
+    matches = [s for s in sections if s.title.lower().strip() == wanted]
+    if not matches:
+        raise NotFound(f"Invalid library section: {library_name}")
+    return matches[-1]
+
+
+async def _total_size(server: PlexConnection, section_key: str) -> int:
+    """Items in the section, without collections (plexapi's section.totalSize)."""
+    params = {"includeCollections": 0, "X-Plex-Container-Start": 0, "X-Plex-Container-Size": 0}
+    _, total = await fetch_container(server, section_path(section_key), params, element_rating_key)
+    return total
+
+
+def _add_page(catalog: Catalog, page: Iterable[Tuple[RawRecord, int]]) -> None:
+    for record, changed_at in page:
+        catalog.add(record)
+        catalog.updated_at = max(catalog.updated_at, changed_at)
+
+
+async def _fetch_catalog(
+    server: PlexConnection, library_name: str, build_record: RecordBuilder
+) -> Catalog:
+    section = await _section(server, library_name)
+    params = {"type": plexutils.searchType(section.type)}
+
+    catalog = Catalog(
+        section_key=section.key,
+        records={},
+        genre_index={},
+        library_updated_at=section.updated_at,
+    )
+    # Records are built batch by batch as the XML streams in, and added on a
+    # worker thread; nobody else sees this catalog until it is returned
+    convert = _with_changed_at(build_record)
+    async for page in iter_metadata(server, section_path(section.key), params, convert):
+        await run_cpu(_add_page, catalog, page)
+    return catalog
+
+
+async def _refresh_catalog(
+    server: PlexConnection,
+    catalog: Catalog,
+    library_name: str,
+    build_record: RecordBuilder,
+    deletions: bool = False,
+) -> Optional[Catalog]:
+    """A patched copy of catalog with items added or updated since its last build.
+
+    With `deletions`, items gone from the section are removed too. Only pass
+    it for a connection that sees the whole library (the admin's): a
+    restricted user's listing lacks whatever their share hides, which would
+    look deleted. Otherwise removals arrive through Plex alerts and full
+    rebuilds.
+
+    Returns None if nothing changed. The copy is made on a worker thread,
+    after all Plex requests; `catalog` itself is left alone.
+    """
+    section = await _section(server, library_name)
+    path = section_path(section.key)
+    libtype = plexutils.searchType(section.type)
+
+    changed: List[Tuple[RawRecord, int]] = []
+    convert = _with_changed_at(build_record)
+    params = {"type": libtype, "updatedAt>>": catalog.updated_at}
+    async for page in iter_metadata(server, path, params, convert):
+        # The filter is inclusive, so drop items already applied at the high-water mark
+        changed.extend(
+            (record, changed_at) for record, changed_at in page
+            if changed_at > catalog.updated_at or record.rating_key not in catalog.records
+        )
+    live_keys: Optional[Set[str]] = None
+    new_keys = {record.rating_key for record, _ in changed} - catalog.records.keys()
+    if deletions and await _total_size(server, section.key) != len(catalog.records) + len(new_keys):
+        # Something was deleted; collect rating keys only
+        live_keys = set()
+        async for page in iter_pages(
+            server, path, {"type": libtype}, lambda elem: elem.get("ratingKey")
+        ):
+            live_keys.update(page)
+
+    removed = [] if live_keys is None else [k for k in catalog.records if k not in live_keys]
+    if not changed and not removed:
+        catalog.library_updated_at = section.updated_at
+        return None
+    patched = await run_cpu(catalog.patched, changed, removed)
+    patched.library_updated_at = section.updated_at
+    return patched
+
+
+async def visible_keys(server: PlexConnection, catalog: Catalog) -> Optional[FrozenSet[str]]:
+    """The catalog's rating_keys this connection can open; None if it can open them all.
+
+    A friend whose share is limited by labels or content ratings sees fewer
+    items in the section than the catalog holds. Everyone else costs one
+    request.
+    """
+    if await _total_size(server, catalog.section_key) >= len(catalog.records):
+        return None
+    params = {"includeCollections": 0}
+    keys: Set[str] = set()
+    async for page in iter_pages(server, section_path(catalog.section_key), params, element_rating_key):
+        keys.update(page)
+    return frozenset(keys)
+
+
+async def library_stamp(server: PlexConnection, library_name: str) -> Tuple[str, int]:
+    """Return (section_key, section.updatedAt epoch) for validating snapshots."""
+    section = await _section(server, library_name)
+    return section.key, section.updated_at
+
+
+def _keys_newest_first(history: Iterable[HistoryEntry], history_key: HistoryKey) -> List[str]:
+    seen: Set[str] = set()
+    order: List[str] = []
     for item in history:
-        key = str(item.ratingKey)
-        if key not in seen:
+        key = history_key(item)
+        if key and key not in seen:
             seen.add(key)
-            watched_order.append(key)
+            order.append(key)
+    return order
+
 
-    records: Dict[str, MovieRecord] = {}
-    genre_index: Dict[str, List[str]] = {}
+async def _fetch_history(
+    server: PlexConnection, section_key: str, since: int = 0
+) -> List[HistoryEntry]:
+    """The section's watch history newer than `since`, newest first (plexapi's server.history())."""
+    params: Dict[str, object] = {"sort": "viewedAt:desc", "librarySectionID": section_key}
+    if since:
+        params["viewedAt>"] = since
+    history: List[HistoryEntry] = []
+    async for page in iter_pages(server, HISTORY_PATH, params, _history_entry):
+        history.extend(page)
+    return history
 
-    for movie in movies:
-        record = _build_record(movie, seen, token)
-        records[record.rating_key] = record
-        for genre in record.genres:
-            genre_index.setdefault(genre, []).append(record.rating_key)
 
-    return MovieIndex(
-        records=records,
-        watched_order=watched_order,
-        genre_index=genre_index,
+async def _listing_watched(
+    server: PlexConnection, section_key: str, source: _WatchSource, since: int = 0
+) -> Tuple[List[str], int]:
+    """Read watch state from the section listing sorted by lastViewedAt.
+
+    Only the first pages are fetched: the scan stops at the first item not
+    viewed after `since`. Returns (watched keys newest-first, newest lastViewedAt).
+    """
+    params = {
+        "type": plexutils.searchType(source.libtype),
+        "sort": "lastViewedAt:desc",
+    }
+    order: List[str] = []
+    newest = 0
+    async for page in iter_pages(
+        server, section_path(section_key), params, source.watch_state,
+        page_size=WATCH_PAGE_SIZE,
+    ):
+        for key, viewed_at, watched in page:
+            if viewed_at <= since:
+                return order, newest
+            newest = max(newest, viewed_at)
+            if watched:
+                order.append(key)
+    return order, newest
+
+
+async def _build_overlay(
+    server: PlexConnection, section_key: str, source: _WatchSource
+) -> WatchOverlay:
+    if config.PLEX_WATCHED_SOURCE == "listing":
+        try:
+            order, newest = await _listing_watched(server, section_key, source)
+            return WatchOverlay(order, last_viewed_at=newest)
+        except TRANSPORT_ERRORS:
+            log.warning("Watched-state listing failed; falling back to history.", exc_info=True)
+
+    history = await _fetch_history(server, section_key)
+    overlay = WatchOverlay(_keys_newest_first(history, source.history_key))
+    overlay.last_viewed_at = max((h.viewed_at for h in history), default=0)
+    return overlay
+
+
+async def _refresh_overlay(
+    server: PlexConnection,
+    overlay: WatchOverlay,
+    section_key: str,
+    source: _WatchSource,
+) -> bool:
+    """Apply views newer than overlay.last_viewed_at; returns True if anything changed."""
+    if config.PLEX_WATCHED_SOURCE == "listing":
+        try:
+            order, newest = await _listing_watched(
+                server, section_key, source, since=overlay.last_viewed_at
+            )
+            if not newest:
+                return False
+            overlay.prepend(order)
+            overlay.last_viewed_at = newest
+            return True
+        except TRANSPORT_ERRORS:
+            log.warning("Watched-state listing failed; falling back to history.", exc_info=True)
+
+    history = await _fetch_history(server, section_key, since=overlay.last_viewed_at)
+    if not history:
+        return False
+    overlay.prepend(_keys_newest_first(history, source.history_key))
+    overlay.last_viewed_at = max(
+        overlay.last_viewed_at, *(h.viewed_at for h in history)
     )
+    return True
+
+
+async def build_catalog(server: PlexConnection, library_name: str = "Movies") -> Catalog:
+    """Fetch all movies in the section and return the shared Catalog."""
+    return await _fetch_catalog(server, library_name, _build_record)
+
+
+async def refresh_catalog(
+    server: PlexConnection, catalog: Catalog, library_name: str = "Movies", deletions: bool = False
+) -> Optional[Catalog]:
+    return await _refresh_catalog(server, catalog, library_name, _build_record, deletions)
+
+
+async def build_watch_overlay(server: PlexConnection, section_key: str) -> WatchOverlay:
+    """Return this server user's movie watch state."""
+    return await _build_overlay(server, section_key, _MOVIE_WATCH)
+
+
+async def refresh_watch_overlay(
+    server: PlexConnection, overlay: WatchOverlay, section_key: str
+) -> bool:
+    return await _refresh_overlay(server, overlay, section_key, _MOVIE_WATCH)
+
+
+async def build_index(
+    server: PlexConnection,
+    library_name: str = "Movies",
+    catalog: Optional[Catalog] = None,
+) -> MovieIndex:
+    """Fetch watch history (and the catalog unless given), return a MovieIndex."""
+    if catalog is None:
+        catalog = await build_catalog(server, library_name)
+    overlay = await build_watch_overlay(server, catalog.section_key)
+    return MovieIndex(catalog=catalog, overlay=overlay, token=server._token)
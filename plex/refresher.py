@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import List, Optional
+
+from plex.cache import IndexCache
+
+log = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 10  # seconds between scheduling passes
+REFRESH_LEAD = 15      # refresh entries this many seconds before they expire
+
+
+class IndexRefresher:
+    """Background task that keeps recently active users' indexes warm.
+
+    Every REFRESH_INTERVAL seconds it refreshes, at most `concurrency` at a
+    time, the catalog and overlays of users whose entries are about to expire,
+    and forgets users who have not run a command for `idle_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        caches: List[IndexCache],
+        *,
+        concurrency: int,
+        idle_timeout: float,
+        interval: float = REFRESH_INTERVAL,
+        lead: float = REFRESH_LEAD,
+    ):
+        self._caches = caches
+        self._idle_timeout = idle_timeout
+        self._interval = interval
+        self._lead = lead
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="index_refresher")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.tick()
+            except Exception:
+                log.exception("Index refresh pass failed.")
+
+    async def tick(self) -> None:
+        """Run one scheduling pass: evict idle users, refresh the ones due."""
+        jobs = []
+        for cache in self._caches:
+            evicted = cache.evict_idle(self._idle_timeout)
+            if evicted:
+                log.info("Dropped %d idle user(s) from the %s cache.", evicted, cache.library_name)
+            jobs.extend(self._refresh(cache, discord_id) for discord_id in cache.due(self._lead))
+        await asyncio.gather(*jobs)
+
+    async def _refresh(self, cache: IndexCache, discord_id: str) -> None:
+        async with self._semaphore:
+            try:
+                await cache.refresh(discord_id, within=self._lead)
+            except Exception:
+                log.warning("Refreshing %s index for %s failed.",
+                            cache.library_name, discord_id, exc_info=True)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Set, Tuple
+
+_NON_WORD = re.compile(r"[^\w]+")
+_GRAM = 3
+
+# Match quality, best first
+_TITLE_PREFIX, _WORD_PREFIX, _SUBSTRING = range(3)
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip accents and punctuation: "Amélie (2001)!" → "amelie 2001"."""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + _GRAM] for i in range(len(text) - _GRAM + 1)}
+
+
+class TitleIndex:
+    """Prefix and trigram index over record titles, for autocomplete.
+
+    Word prefixes are answered by bisecting a sorted word list; anything
+    else (mid-word fragments) falls back to intersecting trigram postings.
+    It also holds the rating_keys best-rated first, for an empty query.
+    Built from plain (seq, title, rating_key, rating) rows off the event
+    loop; see Catalog.titles() and IndexCache, which keeps one per catalog
+    version. Lookups never touch Plex.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, str, str, float]]):
+        self._titles: Dict[int, str] = {}     # seq → normalized title
+        self._keys: Dict[int, str] = {}       # seq → rating_key
+        words: List[Tuple[str, int]] = []
+        grams: Dict[str, array] = {}
+        ratings: List[Tuple[float, int]] = []
+        for seq, title, rating_key, rating in rows:
+            title = normalize(title)
+            self._titles[seq] = title
+            self._keys[seq] = rating_key
+            for word in set(title.split()):
+                words.append((word, seq))
+            for gram in _grams(title):
+                grams.setdefault(gram, array("I")).append(seq)
+            ratings.append((-rating, seq))
+        words.sort()
+        self._words = [w for w, _ in words]
+        self._word_seqs = array("I", (s for _, s in words))
+        self._grams = grams
+        # Best first, ties in catalog order, like Catalog.top_rated()
+        ratings.sort()
+        self.top_rated: List[str] = [self._keys[seq] for _, seq in ratings]
+
+    def _word_prefix(self, prefix: str) -> Set[int]:
+        start = bisect_left(self._words, prefix)
+        end = bisect_left(self._words, prefix + "\U0010ffff", start)
+        return set(self._word_seqs[start:end])
+
+    def search(self, query: str, limit: int = 25) -> List[str]:
+        """rating_keys of titles matching `query`, best matches first."""
+        query = normalize(query)
+        if not query:
+            return []
+        tokens = query.split()
+        titles = self._titles
+        found: Dict[int, int] = {}
+
+        # Every query word must prefix some title word (order-free)
+        seqs = self._word_prefix(tokens[-1])
+        for token in tokens[:-1]:
+            if not seqs:
+                break
+            seqs &= self._word_prefix(token)
+        for seq in seqs:
+            found[seq] = _TITLE_PREFIX if titles[seq].startswith(query) else _WORD_PREFIX
+
+        if len(found) < limit and len(query) >= _GRAM:
+            postings = sorted((self._grams.get(g, ()) for g in _grams(query)), key=len)
+            if postings and postings[0]:
+                candidates = set(postings[0])
+                for posting in postings[1:]:
+                    candidates.intersection_update(posting)
+                    if not candidates:
+                        break
+                for seq in candidates:
+                    if seq not in found and query in titles[seq]:
+                        found[seq] = _SUBSTRING
+
+        ranked = sorted(found, key=lambda s: (found[s], len(titles[s]), titles[s]))
+        return [self._keys[seq] for seq in ranked[:limit]]
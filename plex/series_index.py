@@ -1,73 +1,92 @@
 from __future__ import annotations
 
-import asyncio
-from typing import Dict, List, Set
+from typing import Optional
+from xml.etree.ElementTree import Element
 
-from plexapi.server import PlexServer
+from plex.index import (
+    Catalog,
+    HistoryEntry,
+    MovieIndex,
+    RawRecord,
+    WatchOverlay,
+    WatchState,
+    _WatchSource,
+    _build_overlay,
+    _fetch_catalog,
+    _float,
+    _int,
+    _refresh_catalog,
+    _refresh_overlay,
+    _tags,
+    _unique,
+)
+from plex.stream import PlexConnection, element_rating_key
 
-from plex.index import MovieIndex, MovieRecord, _decade, _thumb_url
 
+def _build_series_record(elem: Element) -> RawRecord:
+    genres = _unique(g.lower() for g in _tags(elem, "Genre"))
+    actors = _unique(_tags(elem, "Role"))[:10]
 
-def _build_series_record(show, watched_keys: Set[str], token: str) -> MovieRecord:
-    year = getattr(show, "year", None)
-    genres = frozenset(g.tag.lower() for g in (show.genres or []))
-    actors = frozenset(r.tag for r in (show.roles or [])[:10])
-    rating = getattr(show, "rating", None)
-    audience_rating = getattr(show, "audienceRating", None)
-    summary = getattr(show, "summary", "") or ""
-
-    return MovieRecord(
-        rating_key=str(show.ratingKey),
-        title=show.title,
-        year=year,
-        decade=_decade(year),
+    return RawRecord(
+        rating_key=elem.get("ratingKey"),
+        title=elem.get("title", ""),
+        year=_int(elem.get("year")),
         genres=genres,
-        directors=frozenset(),  # not meaningful at show level
+        directors=(),  # not meaningful at show level
         actors=actors,
-        rating=rating,
-        audience_rating=audience_rating,
-        watched=str(show.ratingKey) in watched_keys,
-        summary=summary,
-        thumb_url=_thumb_url(show, token),
+        rating=_float(elem.get("rating")),
+        audience_rating=_float(elem.get("audienceRating")),
+        summary=elem.get("summary", ""),
+        thumb=elem.get("thumb"),
     )
 
 
-async def build_series_index(server: PlexServer, library_name: str = "TV Shows") -> MovieIndex:
-    """Fetch all shows and watch history, return a MovieIndex."""
-    loop = asyncio.get_running_loop()
-    token: str = server._token
+def _series_history_key(item: HistoryEntry) -> Optional[str]:
+    # History returns episodes; grandparentRatingKey is the show's ratingKey
+    return item.grandparent_rating_key
+
 
-    section = await loop.run_in_executor(
-        None, lambda: server.library.section(library_name)
+def _series_watch_state(elem: Element) -> WatchState:
+    # Any watched episode counts; shows carry no viewCount of their own
+    return (
+        element_rating_key(elem),
+        _int(elem.get("lastViewedAt")) or 0,
+        (_int(elem.get("viewedLeafCount")) or 0) > 0,
     )
 
-    shows = await loop.run_in_executor(None, section.all)
 
-    # History returns episodes; grandparentRatingKey is the show's ratingKey
-    history = await loop.run_in_executor(
-        None,
-        lambda: server.history(librarySectionID=section.key),
-    )
+_SHOW_WATCH = _WatchSource("show", _series_watch_state, _series_history_key)
 
-    seen: Set[str] = set()
-    watched_order: List[str] = []
-    for item in history:
-        key = str(getattr(item, "grandparentRatingKey", None) or "")
-        if key and key not in seen:
-            seen.add(key)
-            watched_order.append(key)
-
-    records: Dict[str, MovieRecord] = {}
-    genre_index: Dict[str, List[str]] = {}
-
-    for show in shows:
-        record = _build_series_record(show, seen, token)
-        records[record.rating_key] = record
-        for genre in record.genres:
-            genre_index.setdefault(genre, []).append(record.rating_key)
-
-    return MovieIndex(
-        records=records,
-        watched_order=watched_order,
-        genre_index=genre_index,
-    )
+
+async def build_series_catalog(server: PlexConnection, library_name: str = "TV Shows") -> Catalog:
+    """Fetch all shows in the section and return the shared Catalog."""
+    return await _fetch_catalog(server, library_name, _build_series_record)
+
+
+async def refresh_series_catalog(
+    server: PlexConnection, catalog: Catalog, library_name: str = "TV Shows", deletions: bool = False
+) -> Optional[Catalog]:
+    return await _refresh_catalog(server, catalog, library_name, _build_series_record, deletions)
+
+
+async def build_series_watch_overlay(server: PlexConnection, section_key: str) -> WatchOverlay:
+    """Return this server user's show watch state."""
+    return await _build_overlay(server, section_key, _SHOW_WATCH)
+
+
+async def refresh_series_watch_overlay(
+    server: PlexConnection, overlay: WatchOverlay, section_key: str
+) -> bool:
+    return await _refresh_overlay(server, overlay, section_key, _SHOW_WATCH)
+
+
+async def build_series_index(
+    server: PlexConnection,
+    library_name: str = "TV Shows",
+    catalog: Optional[Catalog] = None,
+) -> MovieIndex:
+    """Fetch watch history (and the catalog unless given), return a MovieIndex."""
+    if catalog is None:
+        catalog = await build_series_catalog(server, library_name)
+    overlay = await build_series_watch_overlay(server, catalog.section_key)
+    return MovieIndex(catalog=catalog, overlay=overlay, token=server._token)
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Optional
+
+from plex.index import Catalog, RawRecord, WatchOverlay
+
+# Bump whenever the encoded layout changes; older snapshots are then ignored
+SNAPSHOT_FORMAT = 3
+
+
+def _pack(obj) -> bytes:
+    return zlib.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def encode_catalog(catalog: Catalog) -> bytes:
+    rows = [list(catalog.raw(r)) for r in catalog.records.values()]
+    return _pack({
+        "format": SNAPSHOT_FORMAT,
+        "section_key": catalog.section_key,
+        "updated_at": catalog.updated_at,
+        "library_updated_at": catalog.library_updated_at,
+        "records": rows,
+    })
+
+
+def decode_catalog(blob: bytes) -> Optional[Catalog]:
+    """Rebuild a Catalog from encode_catalog() output, or None if the format is stale."""
+    data = _unpack(blob)
+    if data.get("format") != SNAPSHOT_FORMAT:
+        return None
+    catalog = Catalog(
+        section_key=data["section_key"],
+        records={},
+        genre_index={},
+        updated_at=data["updated_at"],
+        library_updated_at=data["library_updated_at"],
+    )
+    for key, title, year, genres, directors, actors, rating, audience, summary, thumb in data["records"]:
+        catalog.add(RawRecord(
+            rating_key=key,
+            title=title,
+            year=year,
+            genres=tuple(genres),
+            directors=tuple(directors),
+            actors=tuple(actors),
+            rating=rating,
+            audience_rating=audience,
+            summary=summary,
+            thumb=thumb,
+        ))
+    return catalog
+
+
+def encode_overlay(overlay: WatchOverlay) -> bytes:
+    return _pack({
+        "format": SNAPSHOT_FORMAT,
+        "watched_order": overlay.watched_order,
+        "last_viewed_at": overlay.last_viewed_at,
+        "visible": sorted(overlay.visible) if overlay.visible is not None else None,
+    })
+
+
+def decode_overlay(blob: bytes) -> Optional[WatchOverlay]:
+    data = _unpack(blob)
+    if data.get("format") != SNAPSHOT_FORMAT:
+        return None
+    visible = data["visible"]
+    return WatchOverlay(
+        data["watched_order"],
+        last_viewed_at=data["last_viewed_at"],
+        visible=frozenset(visible) if visible is not None else None,
+    )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, BinaryIO, Callable, Dict, List, Tuple, TypeVar, Union
+from xml.etree.ElementTree import Element, iterparse
+
+import aiohttp
+import requests
+from plexapi.exceptions import Unauthorized
+from plexapi.server import PlexServer
+
+from plex import http
+
+if TYPE_CHECKING:
+    from plex.aioplex import AioPlexServer
+
+PAGE_SIZE = 500       # items per container page
+METADATA_BATCH = 200  # rating keys per bulk /library/metadata request
+
+_ITEM_TAGS = frozenset({"Video", "Directory"})
+
+T = TypeVar("T")
+Converter = Callable[[Element], T]
+
+# A user's server connection: plexapi's (PLEX_TRANSPORT=plexapi) or plex.aioplex's
+PlexConnection = Union[PlexServer, "AioPlexServer"]
+
+# What either transport raises when Plex can't be reached or answers with an error
+TRANSPORT_ERRORS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError)
+
+
+def section_path(section_key: str) -> str:
+    return f"/library/sections/{section_key}/all"
+
+
+def parse_container(source: BinaryIO, convert: Converter) -> Tuple[List[T], int]:
+    """Convert a container's items while its XML streams in from `source`.
+
+    Each top-level item element is handed to convert() as soon as it is
+    complete and then discarded, so no plexapi objects (and no full DOM) are
+    ever built. Returns (converted items, container totalSize).
+    """
+    items: List[T] = []
+    total = 0
+    depth = 0
+    root = None
+    for event, elem in iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = elem
+                total = int(elem.get("totalSize") or elem.get("size") or 0)
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag in _ITEM_TAGS:
+            items.append(convert(elem))
+            root.clear()
+    return items, total
+
+
+def _fetch_container(
+    server: PlexServer,
+    path: str,
+    params: Dict[str, object],
+    convert: Converter,
+) -> Tuple[List[T], int]:
+    """Fetch one container through plexapi's session, parsing as it streams in."""
+    resp = server._session.get(
+        server.url(path),
+        params=params,
+        headers=server._headers(),
+        stream=True,
+        timeout=http.TIMEOUT,
+    )
+    with resp:
+        if resp.status_code == 401:
+            raise Unauthorized(f"({resp.status_code}) unauthorized; {resp.url}")
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        return parse_container(resp.raw, convert)
+
+
+async def fetch_container(
+    server: PlexConnection,
+    path: str,
+    params: Dict[str, object],
+    convert: Converter,
+) -> Tuple[List[T], int]:
+    """(converted items, container totalSize) of one container, over either transport."""
+    if isinstance(server, PlexServer):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _fetch_container, server, path, params, convert)
+    return await server.fetch_container(path, params, convert)
+
+
+async def _fetch_page(
+    server: PlexConnection,
+    path: str,
+    params: Dict[str, object],
+    start: int,
+    size: int,
+    convert: Converter,
+) -> Tuple[List[T], int]:
+    query = {**params, "X-Plex-Container-Start": start, "X-Plex-Container-Size": size}
+    return await fetch_container(server, path, query, convert)
+
+
+def element_rating_key(elem: Element) -> str:
+    return elem.get("ratingKey", "")
+
+
+async def iter_pages(
+    server: PlexConnection,
+    path: str,
+    params: Dict[str, object],
+    convert: Converter,
+    page_size: int = PAGE_SIZE,
+) -> AsyncIterator[List[T]]:
+    """Yield converted items from a Plex container endpoint one page at a time."""
+    start = 0
+    while True:
+        items, total = await _fetch_page(server, path, params, start, page_size, convert)
+        if items:
+            yield items
+        start += page_size
+        if len(items) < page_size or (total and start >= total):
+            break
+
+
+async def iter_metadata(
+    server: PlexConnection,
+    path: str,
+    params: Dict[str, object],
+    convert: Converter,
+    batch_size: int = METADATA_BATCH,
+) -> AsyncIterator[List[T]]:
+    """Yield fully populated items for a container endpoint, one batch at a time.
+
+    Section listings only carry a truncated cast and genre list, and touching
+    the missing fields on plexapi objects reloads each item individually. Here
+    each listing page contributes only its rating keys, which are then fetched
+    in a single /library/metadata/<k1,k2,...> request: two requests per
+    batch, regardless of how many items the batch holds.
+    """
+    def keyed(elem: Element) -> Tuple[str, T]:
+        return element_rating_key(elem), convert(elem)
+
+    async for keys in iter_pages(server, path, params, element_rating_key, page_size=batch_size):
+        items, _ = await fetch_container(
+            server, f"/library/metadata/{','.join(keys)}", {}, keyed
+        )
+        # Keep the listing's order rather than whatever order Plex returns
+        position = {key: i for i, key in enumerate(keys)}
+        items.sort(key=lambda item: position.get(item[0], len(position)))
+        yield [item for _, item in items]
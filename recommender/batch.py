@@ -0,0 +1,63 @@
+"""Recommendations for many linked users in one run.
+
+Indexes are loaded with bounded concurrency (mostly from the shared catalog
+and overlay snapshots) and scored together by engine.recommend_many. The
+weekly digest (cogs/digest.py) is built on this.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import config
+from plex.cache import IndexCache
+from plex.index import MovieIndex
+from recommender.engine import Recommendation, batch_size, recommend_many
+from utils.workers import run_cpu
+
+log = logging.getLogger(__name__)
+
+
+async def recommend_users(
+    cache: IndexCache,
+    users: List[dict],
+    n: int = 5,
+    seed_count: int = 5,
+    concurrency: int = config.INDEX_REFRESH_CONCURRENCY,
+) -> Dict[str, List[Recommendation]]:
+    """recommend_from_history() for each user, keyed by discord_id.
+
+    Users whose index cannot be loaded (Plex unreachable, revoked token) are
+    logged and left out.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(user: dict) -> Tuple[str, Optional[MovieIndex]]:
+        discord_id = user["discord_id"]
+        async with semaphore:
+            try:
+                return discord_id, await cache.get_index(
+                    discord_id, user["plex_token"], background=True
+                )
+            except Exception:
+                log.warning("Batch: loading %s index for %s failed.",
+                            cache.library_name, discord_id, exc_info=True)
+                return discord_id, None
+
+    loaded = [(d, index) for d, index in await asyncio.gather(*map(load, users)) if index]
+    results: Dict[str, List[Recommendation]] = {}
+    if not loaded:
+        return results
+
+    # One worker call per chunk, so a long batch doesn't tie up a worker thread
+    step = batch_size(loaded[0][1].catalog)
+    for start in range(0, len(loaded), step):
+        chunk = loaded[start:start + step]
+        many = await run_cpu(recommend_many, [index for _, index in chunk], n, seed_count)
+        for (discord_id, _), recs in zip(chunk, many):
+            results[discord_id] = recs
+
+    log.info("Batch: computed %s recommendations for %d of %d user(s).",
+             cache.library_name, len(results), len(users))
+    return results
@@ -0,0 +1,157 @@
+"""Candidate generation from the catalog's inverted indexes.
+
+Only titles sharing at least one feature with the seed profile can score
+above zero, so candidates are drawn from the posting lists of the seed's
+genres, directors, actors and neighbouring decades (plus, for summary or
+co-watch similarity, the titles those scored above zero). Lists are visited
+term-at-a-time with MaxScore-style pruning: each term carries an upper bound
+on what it can add to a score (its WEIGHTS share), and once the current k-th
+best score beats the combined bound of the terms still unvisited, no unseen
+title can make the top k and the walk stops.
+"""
+from __future__ import annotations
+
+import heapq
+from typing import Dict, FrozenSet, List, Mapping, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+from plex.bitmaps import Bitset, mask_bits
+from plex.index import Catalog, MovieRecord
+from recommender.scorer import WEIGHTS, ScoreBreakdown, score_movie
+
+Scored = Tuple[float, MovieRecord, ScoreBreakdown]
+
+# Slack for float rounding in summed bounds; an equal score could still win on pool order
+_EPS = 1e-9
+
+
+def _scored_seqs(scores: Sequence[float]) -> List[int]:
+    """Seqs with a score above zero, without a Python pass over every title."""
+    if isinstance(scores, Mapping):
+        return [seq for seq, score in scores.items() if score > 0]
+    if np is not None:
+        return np.flatnonzero(np.asarray(scores) > 0).tolist()
+    return [seq for seq, score in enumerate(scores) if score > 0]
+
+
+def _terms(
+    catalog: Catalog,
+    seed_genres: int,
+    seed_directors: FrozenSet[int],
+    seed_actors: FrozenSet[int],
+    seed_decade: Optional[int],
+    extra: Dict[str, Sequence[float]],
+) -> List[Tuple[float, List[List[str]]]]:
+    """(score upper bound, posting lists) per term, cheapest-per-bound first."""
+    terms: List[Tuple[float, List[List[str]]]] = []
+
+    # Genre score is additive over seed genres: each shared one adds 1/|G|
+    genre_ids = list(mask_bits(seed_genres))
+    names = catalog.genre_vocab.names
+    for genre_id in genre_ids:
+        keys = catalog.genre_index.get(names[genre_id])
+        if keys:
+            terms.append((WEIGHTS["genre"] / len(genre_ids), [keys]))
+
+    # Director and actor scores saturate, so each is one term over all its lists
+    directors = [catalog.director_index[d] for d in seed_directors if d in catalog.director_index]
+    if directors:
+        terms.append((WEIGHTS["director"], directors))
+    actors = [catalog.actor_index[a] for a in seed_actors if a in catalog.actor_index]
+    if actors:
+        terms.append((WEIGHTS["actor"], actors))
+
+    if seed_decade is not None:
+        # Same cut-off as score_decade: three or more decades apart scores nothing
+        decades = [
+            keys for decade, keys in catalog.decade_index.items()
+            if abs(decade - seed_decade) // 10 < 3
+        ]
+        if decades:
+            terms.append((WEIGHTS["decade"], decades))
+
+    keys = catalog.bitmaps().keys
+    for name, scores in extra.items():
+        if not WEIGHTS[name]:
+            continue
+        # Scores may cover seqs the catalog no longer holds
+        seqs = [seq for seq in _scored_seqs(scores) if seq in keys]
+        if seqs:
+            # Bounded by the best score on offer rather than by 1
+            best = max(scores[seq] for seq in seqs)
+            terms.append((float(best) * WEIGHTS[name], [[keys[seq] for seq in seqs]]))
+
+    terms.sort(key=lambda t: t[0] / sum(map(len, t[1])), reverse=True)
+    return terms
+
+
+def top_candidates(
+    catalog: Catalog,
+    pool: Bitset,
+    seed_genres: int,
+    seed_directors: FrozenSet[int],
+    seed_actors: FrozenSet[int],
+    seed_decade: Optional[int],
+    n: int,
+    extra: Optional[Dict[str, Sequence[float]]] = None,
+) -> List[Scored]:
+    """The n best titles whose seq is in `pool`, best first.
+
+    `extra` maps EXTRA_COMPONENTS names to each title's score for that
+    component, indexed by seq (see recommender.text and recommender.cowatch).
+
+    Returns exactly what scoring every pool title and stable-sorting would:
+    ties keep catalog order, and if fewer than n titles share a feature the
+    rest are filled with zero-score titles in catalog order.
+    """
+    if n <= 0:
+        return []
+    records = catalog.records
+
+    # Min-heap of (score, -seq, record, breakdown); seq is unique, so the
+    # tuple comparison never reaches the record
+    heap: list = []
+    seen: Set[str] = set()
+    extra = extra or {}
+    terms = _terms(catalog, seed_genres, seed_directors, seed_actors, seed_decade, extra)
+    remaining = sum(bound for bound, _ in terms)
+    exhausted = True
+    for bound, lists in terms:
+        if len(heap) == n and remaining + _EPS < heap[0][0]:
+            exhausted = False
+            break
+        for keys in lists:
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                record = records[key]
+                if record.seq not in pool:
+                    continue
+                bd = score_movie(record, seed_genres, seed_directors, seed_actors, seed_decade)
+                for name, scores in extra.items():
+                    setattr(bd, name, float(scores[record.seq]))
+                entry = (bd.total, -record.seq, record, bd)
+                if len(heap) < n:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+        remaining -= bound
+
+    if exhausted and len(heap) < n:
+        keys = catalog.bitmaps().keys
+        for seq in pool:
+            if len(heap) == n:
+                break
+            key = keys[seq]
+            if key in seen:
+                continue
+            record = records[key]
+            heapq.heappush(heap, (0.0, -record.seq, record, ScoreBreakdown()))
+
+    heap.sort(key=lambda e: (-e[0], -e[1]))
+    return [(score, record, bd) for score, _, record, bd in heap]
@@ -0,0 +1,317 @@
+"""Co-watch (item-to-item collaborative) similarity across linked users.
+
+Every linked user's watch history is a row of a sparse user × title matrix,
+read from the overlay_snapshots table so users need not be active. Two
+titles' similarity is the cosine of their columns: how many users watched
+both, over the geometric mean of how many watched each. Pairs fewer than
+_MIN_SUPPORT users watched together are dropped as noise, and each title
+keeps only its COWATCH_K most similar titles, so memory stays at titles × K
+plus the histories, which are capped at each user's _MAX_HISTORY latest
+watches.
+
+Training runs in a worker process (CoWatchTrainer, via utils.workers). Each pass reads only
+the snapshots saved since the previous one and recomputes just the lists
+that can have changed: those of titles in a changed user's old or new
+history, and of titles co-watched with one whose watcher count changed.
+Those lists are counted from the users who watched them, but against every
+title's watcher count over all users (kept up to date pass by pass), so the
+result is the same as retraining from scratch. Lists are keyed by
+rating_key, so catalog rebuilds don't touch them.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from array import array
+from collections import Counter
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency; training falls back to pure Python
+    np = None
+    sparse = None
+
+from db.snapshots import get_overlay_snapshot_ids, load_overlay_snapshots
+from plex.cache import IndexCache, registered_caches
+from plex.index import Catalog, MovieRecord
+from plex.snapshot import decode_overlay
+from utils.workers import run_process
+
+log = logging.getLogger(__name__)
+
+_MAX_HISTORY = 500      # most recent watches per user that count
+_MIN_SUPPORT = 2        # users who must have watched both titles
+_BLOCK_CELLS = 1 << 21  # title × title co-counts held at once by a training block
+
+# (neighbour item ids, similarities), best first
+CoWatchList = Tuple[array, array]
+
+
+def _train_lists(
+    histories: List[array], items: List[int], watchers: array, k: int
+) -> Dict[int, CoWatchList]:
+    """The co-watch lists of `items`; runs in the worker process.
+
+    `histories` must include every user who watched any of `items`, and
+    `watchers` holds each item's watcher count over all users (so a subset of
+    histories scores the same as all of them); item ids are below
+    len(watchers). Items with nothing co-watched often enough are left out.
+    """
+    if not histories or not items:
+        return {}
+    if sparse is None:
+        return _train_lists_python(histories, items, watchers, k)
+    size = len(watchers)
+
+    lengths = [len(h) for h in histories]
+    indptr = np.zeros(len(histories) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter(chain.from_iterable(histories), dtype=np.int64, count=sum(lengths))
+    watches = sparse.csr_matrix(
+        (np.ones(len(indices)), indices, indptr), shape=(len(histories), size)
+    )
+    watchers = np.asarray(watchers, dtype=np.float64)
+    by_item = watches.T.tocsr()
+
+    lists: Dict[int, CoWatchList] = {}
+    items = np.asarray(sorted(items), dtype=np.int64)
+    step = max(1, _BLOCK_CELLS // size)
+    for start in range(0, len(items), step):
+        block = items[start:start + step]
+        together = (by_item[block] @ watches).tocsr()
+        for r, item in enumerate(block.tolist()):
+            lo, hi = together.indptr[r], together.indptr[r + 1]
+            cols, counts = together.indices[lo:hi], together.data[lo:hi]
+            keep = (counts >= _MIN_SUPPORT) & (cols != item)
+            if not keep.any():
+                continue
+            cols, counts = cols[keep], counts[keep]
+            similarity = counts / np.sqrt(watchers[item] * watchers[cols])
+            order = np.lexsort((cols, -similarity))[:k]
+            lists[item] = (array("I", cols[order].tolist()), array("d", similarity[order].tolist()))
+    return lists
+
+
+def _train_lists_python(
+    histories: List[array], items: List[int], watchers: array, k: int
+) -> Dict[int, CoWatchList]:
+    """_train_lists() without numpy/scipy; same results, slower."""
+    watched = [set(h) for h in histories]
+    users: Dict[int, List[int]] = {}
+    for user, titles in enumerate(watched):
+        for item in titles:
+            users.setdefault(item, []).append(user)
+
+    lists: Dict[int, CoWatchList] = {}
+    for item in sorted(items):
+        counts: Counter = Counter()
+        for user in users.get(item, ()):
+            counts.update(watched[user])
+        scored = [
+            (count / math.sqrt(float(watchers[item]) * watchers[other]), other)
+            for other, count in counts.items()
+            if other != item and count >= _MIN_SUPPORT
+        ]
+        if not scored:
+            continue
+        scored.sort(key=lambda t: (-t[0], t[1]))
+        del scored[k:]
+        lists[item] = (array("I", [o for _, o in scored]), array("d", [s for s, _ in scored]))
+    return lists
+
+
+class CoWatchModel:
+    """Co-watch lists for one library, plus the histories they were trained on."""
+
+    def __init__(self) -> None:
+        self.keys: List[str] = []                    # item id → rating_key
+        self._ids: Dict[str, int] = {}
+        self._histories: Dict[str, array] = {}       # discord_id → item ids, newest first
+        self._watchers = array("I")                  # item id → users whose history has it
+        self._lists: Dict[int, CoWatchList] = {}
+        self.since = ""                              # newest snapshot saved_at trained on
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+    def _id(self, rating_key: str) -> int:
+        item = self._ids.get(rating_key)
+        if item is None:
+            item = self._ids[rating_key] = len(self.keys)
+            self.keys.append(rating_key)
+        return item
+
+    def neighbours(self, rating_key: str) -> List[Tuple[str, float]]:
+        """(rating_key, similarity) pairs most often co-watched with `rating_key`, best first."""
+        item = self._ids.get(rating_key)
+        current = self._lists.get(item) if item is not None else None
+        if current is None:
+            return []
+        items, similarities = current
+        return [(self.keys[i], s) for i, s in zip(items, similarities)]
+
+    def plan(
+        self, linked: Set[str], rows: List[Tuple[str, bytes, str]]
+    ) -> Tuple[Dict[str, array], Set[int], str, array]:
+        """(histories after this pass, item ids to retrain, new `since`, watcher counts).
+
+        Changes nothing but ids. `linked` is every user with a snapshot;
+        `rows` the snapshots saved since the last pass.
+        """
+        histories = {d: h for d, h in self._histories.items() if d in linked}
+        affected: Set[int] = set()
+        recounted: Set[int] = set()  # items whose watcher count may have changed
+        unwatched: List[int] = []    # one entry per user an item lost
+        watched: List[int] = []      # one entry per user an item gained
+        for discord_id in self._histories.keys() - histories.keys():
+            affected.update(self._histories[discord_id])
+            recounted.update(self._histories[discord_id])
+            unwatched.extend(set(self._histories[discord_id]))
+        since = self.since
+        for discord_id, payload, saved_at in rows:
+            since = max(since, saved_at)
+            overlay = decode_overlay(payload)
+            if overlay is None or discord_id not in linked:
+                continue
+            history = array("I", map(self._id, overlay.watched_order[:_MAX_HISTORY]))
+            old = histories.get(discord_id, array("I"))
+            histories[discord_id] = history
+            changed = set(history).symmetric_difference(old)
+            if changed:
+                affected.update(history)
+                affected.update(old)
+                recounted.update(changed)
+                unwatched.extend(changed.difference(history))
+                watched.extend(changed.difference(old))
+        # A changed count moves that item's similarity in every list it can be in
+        if recounted:
+            for history in histories.values():
+                if not recounted.isdisjoint(history):
+                    affected.update(history)
+
+        watchers = array("I", self._watchers)
+        watchers.extend([0] * (len(self.keys) - len(watchers)))
+        for item in unwatched:
+            watchers[item] -= 1
+        for item in watched:
+            watchers[item] += 1
+        return histories, affected, since, watchers
+
+    def apply(
+        self,
+        histories: Dict[str, array],
+        affected: Set[int],
+        since: str,
+        watchers: array,
+        lists: Dict[int, CoWatchList],
+    ) -> None:
+        """Commit a pass planned by plan() and trained by _train_lists()."""
+        for item in affected:
+            if item in lists:
+                self._lists[item] = lists[item]
+            else:
+                self._lists.pop(item, None)
+        self._histories = histories
+        self._watchers = watchers
+        self.since = since
+
+
+# library_name → model
+_models: Dict[str, CoWatchModel] = {}
+
+
+def cowatch_model(catalog: Catalog) -> Optional[CoWatchModel]:
+    """The trained model for the library `catalog` belongs to, if any."""
+    for cache in registered_caches():
+        if cache.section_key == catalog.section_key:
+            return _models.get(cache.library_name)
+    return None
+
+
+class SparseScores(dict):
+    """seq → score for the few titles that have one; every other seq reads as 0."""
+
+    def __missing__(self, seq: int) -> float:
+        return 0.0
+
+
+def cowatch_scores(catalog: Catalog, seeds: List[MovieRecord]) -> Optional[Sequence[float]]:
+    """Mean co-watch similarity to the seeds, indexed by seq; None if nothing scores.
+
+    Scores stay in 0..1. A numpy array when numpy is installed, else SparseScores.
+    """
+    model = cowatch_model(catalog)
+    if model is None or not seeds:
+        return None
+    scores = np.zeros(catalog.last_seq + 1) if np is not None else SparseScores()
+    found = False
+    for seed in seeds:
+        for key, similarity in model.neighbours(seed.rating_key):
+            record = catalog.records.get(key)
+            if record is not None:
+                scores[record.seq] += similarity / len(seeds)
+                found = True
+    return scores if found else None
+
+
+class CoWatchTrainer:
+    """Background task that retrains every library's co-watch model.
+
+    Runs a pass at startup and then every `interval` seconds; the counting
+    itself happens in a worker process, so the bot's event loop and threads
+    stay free.
+    """
+
+    def __init__(self, caches: List[IndexCache], *, interval: float, k: int):
+        self._caches = caches
+        self._interval = interval
+        self._k = k
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="cowatch_trainer")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                log.exception("Co-watch training pass failed.")
+            await asyncio.sleep(self._interval)
+
+    async def tick(self) -> None:
+        """Run one training pass over every library."""
+        for cache in self._caches:
+            await self.train(cache.library_name)
+
+    async def train(self, library_name: str) -> None:
+        model = _models.setdefault(library_name, CoWatchModel())
+        linked = set(await get_overlay_snapshot_ids(library_name))
+        rows = await load_overlay_snapshots(library_name, model.since)
+        histories, affected, since, watchers = model.plan(linked, rows)
+        if not affected:
+            model.apply(histories, affected, since, watchers, {})
+            return
+
+        # Only users who watched an affected title co-watched anything with it;
+        # watcher counts come from everyone
+        relevant = [h for h in histories.values() if not affected.isdisjoint(h)]
+        lists = await run_process(_train_lists, relevant, list(affected), watchers, self._k)
+        model.apply(histories, affected, since, watchers, lists)
+        log.info("Co-watch %s: retrained %d title(s) from %d user(s); %d lists.",
+                 library_name, len(affected), len(relevant), len(model))
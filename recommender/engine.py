@@ -1,124 +1,393 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 
-from plex.index import MovieIndex, MovieRecord
+import config
+from plex.bitmaps import Bitset
+from plex.index import Catalog, MovieIndex, MovieRecord
+from recommender import text, vectorized
+from recommender.candidates import top_candidates
+from recommender.cowatch import cowatch_scores
+from recommender.filters import Filters, match_genre
+from recommender.neighbours import neighbour_index, warm_neighbours
 from recommender.scorer import (
+    EXTRA_COMPONENTS,
+    WEIGHTS,
     ScoreBreakdown,
     build_seed_profile,
     score_movie,
 )
 
 
+# Rows × users scored at once by recommend_many (16 MiB per component)
+_BATCH_CELLS = 1 << 21
+
+
+def _use_vectorized(engine: str) -> bool:
+    if engine == "numpy":
+        if not vectorized.AVAILABLE:
+            raise RuntimeError("RECOMMENDER_ENGINE=numpy requires numpy and scipy to be installed.")
+        return True
+    return engine == "auto" and vectorized.AVAILABLE
+
+
+async def warm_indexes(catalog: Catalog) -> None:
+    """IndexCache on_catalog_change hook: rebuild the recommender's derived indexes."""
+    if WEIGHTS["summary"]:
+        await text.warm_text_index(catalog)
+    await warm_neighbours(catalog)
+
+
 @dataclass
 class Recommendation:
     movie: MovieRecord
     score: float
     breakdown: ScoreBreakdown
     explanation: List[str]
+    thumb_url: Optional[str] = None
+    # Feature names resolved from the catalog's vocabularies, for display
+    genres: List[str] = field(default_factory=list)
+    directors: List[str] = field(default_factory=list)
+    actors: List[str] = field(default_factory=list)
 
 
 class Recommender:
-    def __init__(self, index: MovieIndex):
+    def __init__(self, index: MovieIndex, engine: Optional[str] = None):
         self.index = index
+        self._vectorized = _use_vectorized(engine or config.RECOMMENDER_ENGINE)
 
-    def _fallback_top_rated(self, n: int, pool: Optional[List[str]] = None) -> List[Recommendation]:
-        """Return top-rated unwatched movies when no history is available."""
-        keys = pool if pool is not None else list(self.index.records.keys())
-        candidates = [
-            self.index.records[k]
-            for k in keys
-            if k in self.index.records and not self.index.records[k].watched
-        ]
-        candidates.sort(
-            key=lambda m: m.audience_rating or m.rating or 0.0,
-            reverse=True,
+    def _recommendation(
+        self,
+        record: MovieRecord,
+        score: float,
+        breakdown: ScoreBreakdown,
+        explanation: List[str],
+    ) -> Recommendation:
+        catalog = self.index.catalog
+        return Recommendation(
+            movie=record,
+            score=score,
+            breakdown=breakdown,
+            explanation=explanation,
+            thumb_url=self.index.thumb_url(record),
+            genres=catalog.genres_of(record),
+            directors=catalog.directors_of(record),
+            actors=catalog.actors_of(record),
         )
+
+    def _pool(self, bits: int) -> Bitset:
+        """The unwatched part of a catalog bitmap the user can open, as the candidate pool."""
+        return Bitset(bits & self.index.visible_bits() & ~self.index.watched_bits())
+
+    def _fallback_top_rated(self, n: int, pool: Bitset) -> List[Recommendation]:
+        """Return the top-rated movies in the pool when no history is available."""
+        picks: List[MovieRecord] = []
+        records = self.index.records
+        # Walk the catalog's pre-sorted list; stops as soon as n are found
+        for key in self.index.catalog.top_rated():
+            record = records[key]
+            if record.seq not in pool:
+                continue
+            picks.append(record)
+            if len(picks) == n:
+                break
         return [
-            Recommendation(
-                movie=m,
-                score=m.audience_rating or m.rating or 0.0,
-                breakdown=ScoreBreakdown(),
-                explanation=["Top rated in library"],
+            self._recommendation(
+                m,
+                m.audience_rating or m.rating or 0.0,
+                ScoreBreakdown(),
+                ["Top rated in library"],
             )
-            for m in candidates[:n]
+            for m in picks
         ]
 
+    def _summary_scores(self, seeds: List[MovieRecord]):
+        """Text similarity to the seeds by seq, or None when off or not built yet."""
+        if not WEIGHTS["summary"]:
+            return None
+        catalog = self.index.catalog
+        index = text.latest_text_index(catalog)
+        if index is None:
+            return None
+        return index.similarity((s.seq for s in seeds), catalog.last_seq + 1)
+
+    def _extra_scores(self, seeds: List[MovieRecord]) -> Dict[str, object]:
+        """Per-seq scores for the EXTRA_COMPONENTS that are on and available."""
+        extra = {"summary": self._summary_scores(seeds)}
+        if WEIGHTS["cowatch"]:
+            extra["cowatch"] = cowatch_scores(self.index.catalog, seeds)
+        return {name: scores for name, scores in extra.items() if scores is not None}
+
     def _rank(
         self,
-        pool_keys: List[str],
+        pool: Bitset,
+        seed_genres,
+        seed_directors,
+        seed_actors,
+        seed_decade,
+        n: int,
+        extra=None,
+    ) -> List[Recommendation]:
+        if self._vectorized:
+            return self._rank_vectorized(
+                pool, seed_genres, seed_directors, seed_actors, seed_decade, n, extra or {}
+            )
+        top = top_candidates(
+            self.index.catalog,
+            pool,
+            seed_genres,
+            seed_directors,
+            seed_actors,
+            seed_decade,
+            n,
+            extra,
+        )
+        return [
+            self._recommendation(record, score, bd, bd.explanations() or ["Library pick"])
+            for score, record, bd in top
+        ]
+
+    def _rank_vectorized(
+        self,
+        pool: Bitset,
         seed_genres,
         seed_directors,
         seed_actors,
         seed_decade,
         n: int,
+        extra,
     ) -> List[Recommendation]:
+        """Same ranking as the scorer loop, from batched matrix scores."""
+        matrix = vectorized.feature_matrix(self.index.catalog)
+        rows = matrix.rows_in(pool)
+        total, genre, director, actor, decade = matrix.score(
+            rows, seed_genres, seed_directors, seed_actors, seed_decade
+        )
+        seqs = matrix.seqs[rows]
+        extra = {name: scores[seqs] for name, scores in extra.items()}
+        return self._top_scored(matrix, rows, total, genre, director, actor, decade, extra, n)
+
+    def _top_scored(
+        self, matrix, rows, total, genre, director, actor, decade, extra, n: int
+    ) -> List[Recommendation]:
+        """The n best of per-row component scores already gathered down to `rows`.
+
+        `extra` holds EXTRA_COMPONENTS scores, also per row.
+        """
+        # Added last and in order, as in ScoreBreakdown.total
+        for name in EXTRA_COMPONENTS:
+            if name in extra:
+                total = total + extra[name] * WEIGHTS[name]
         results: List[Recommendation] = []
-        for key in pool_keys:
-            record = self.index.records.get(key)
-            if record is None or record.watched:
-                continue
-            bd = score_movie(record, seed_genres, seed_directors, seed_actors, seed_decade)
+        for i in vectorized.top_k(total, n):
+            bd = ScoreBreakdown(
+                genre=float(genre[i]),
+                director=float(director[i]),
+                actor=float(actor[i]),
+                decade=float(decade[i]),
+                **{name: float(scores[i]) for name, scores in extra.items()},
+            )
+            record = self.index.records[matrix.keys[rows[i]]]
             results.append(
-                Recommendation(
-                    movie=record,
-                    score=bd.total,
-                    breakdown=bd,
-                    explanation=bd.explanations() or ["Library pick"],
-                )
+                self._recommendation(record, bd.total, bd, bd.explanations() or ["Library pick"])
             )
-        results.sort(key=lambda r: r.score, reverse=True)
-        return results[:n]
+        return results
 
-    def recommend_from_history(self, n: int = 10, seed_count: int = 5) -> List[Recommendation]:
-        # Seeds = last seed_count watched movies that exist in the index
-        seed_keys = [
-            k for k in self.index.watched_order if k in self.index.records
-        ][:seed_count]
+    def _rank_neighbours(
+        self, seeds: List[MovieRecord], pool: Bitset, n: int
+    ) -> List[Recommendation]:
+        """Sum each seed's precomputed neighbour scores; averaged so scores stay in 0..1."""
+        catalog = self.index.catalog
+        neighbours = neighbour_index(catalog)
+        totals: Dict[int, float] = {}
+        because: Dict[int, List[str]] = {}
+        found: Dict[int, MovieRecord] = {}
+        for seed in seeds:
+            for score, record in neighbours.neighbours(catalog, seed):
+                if record.seq not in pool:
+                    continue
+                totals[record.seq] = totals.get(record.seq, 0.0) + score
+                because.setdefault(record.seq, []).append(seed.title)
+                found[record.seq] = record
+        best = sorted(totals, key=lambda seq: (-totals[seq], seq))[:n]
+        return [
+            self._recommendation(
+                found[seq],
+                totals[seq] / len(seeds),
+                ScoreBreakdown(),
+                ["Similar to " + ", ".join(because[seq])],
+            )
+            for seq in best
+        ]
 
-        if not seed_keys:
-            return self._fallback_top_rated(n)
+    def _history_seeds(self, seed_count: int) -> List[MovieRecord]:
+        """The last seed_count watched movies that exist in the index."""
+        records = self.index.records
+        return [
+            records[k]
+            for k in islice((k for k in self.index.watched_order if k in records), seed_count)
+        ]
 
-        seeds = [self.index.records[k] for k in seed_keys]
-        seed_genres, seed_directors, seed_actors, seed_decade = build_seed_profile(seeds)
+    def recommend_from_history(
+        self, n: int = 10, seed_count: int = 5, filters: Optional[Filters] = None
+    ) -> List[Recommendation]:
+        catalog = self.index.catalog
+        bits = filters.bits(catalog) if filters else catalog.bitmaps().all
+        pool = self._pool(bits)
 
-        pool = [k for k in self.index.records if k not in set(self.index.watched_order)]
-        recs = self._rank(pool, seed_genres, seed_directors, seed_actors, seed_decade, n)
+        seeds = self._history_seeds(seed_count)
+        if not seeds:
+            return self._fallback_top_rated(n, pool)
+
+        if config.RECOMMEND_HISTORY_MODE == "neighbours":
+            recs = self._rank_neighbours(seeds, pool, n)
+        else:
+            seed_genres, seed_directors, seed_actors, seed_decade = build_seed_profile(seeds)
+            recs = self._rank(
+                pool, seed_genres, seed_directors, seed_actors, seed_decade, n,
+                self._extra_scores(seeds),
+            )
 
         if not recs:
-            return self._fallback_top_rated(n)
+            return self._fallback_top_rated(n, pool)
         return recs
 
-    def recommend_by_genre(self, genre: str, n: int = 10) -> List[Recommendation]:
-        genre_lower = genre.lower()
-        pool_keys = self.index.genre_index.get(genre_lower, [])
-
-        if not pool_keys:
-            # Try partial match
-            for g, keys in self.index.genre_index.items():
-                if genre_lower in g:
-                    pool_keys = keys
-                    break
-
-        if not pool_keys:
+    def recommend_by_genre(
+        self, genre: str, n: int = 10, filters: Optional[Filters] = None
+    ) -> List[Recommendation]:
+        catalog = self.index.catalog
+        matched = match_genre(genre, self.index.genre_index)
+        if matched is None:
             return []
 
+        bitmaps = catalog.bitmaps()
+        genre_bits = bitmaps.genre(matched)
+        watched = self.index.watched_bits()
+        bits = genre_bits & filters.bits(catalog) if filters else genre_bits
+        pool = self._pool(bits)
+
         # Build seed profile from watched movies in this genre
-        watched_in_genre = [
-            self.index.records[k]
-            for k in pool_keys
-            if k in self.index.records and self.index.records[k].watched
-        ]
+        watched_in_genre = bitmaps.rating_keys(genre_bits & watched, limit=5)
 
         if watched_in_genre:
-            seed_genres, seed_directors, seed_actors, seed_decade = build_seed_profile(
-                watched_in_genre[:5]
-            )
+            seeds = [self.index.records[k] for k in watched_in_genre]
+            seed_genres, seed_directors, seed_actors, seed_decade = build_seed_profile(seeds)
             recs = self._rank(
-                pool_keys, seed_genres, seed_directors, seed_actors, seed_decade, n
+                pool, seed_genres, seed_directors, seed_actors, seed_decade, n,
+                self._extra_scores(seeds),
             )
         else:
-            recs = self._fallback_top_rated(n, pool=pool_keys)
+            recs = self._fallback_top_rated(n, pool)
 
         return recs
+
+    def find_title(self, text: str) -> Optional[MovieRecord]:
+        """Resolve a command argument: a rating_key picked from autocomplete, else the best title match.
+
+        Searches the newest TitleIndex built so far, like autocomplete; only
+        builds one if none exists yet.
+        """
+        index = self.index
+        record = index.records.get(text)
+        if record is not None:
+            return record if index.is_visible(text) else None
+        catalog = index.catalog
+        titles = catalog.latest_titles() or catalog.titles()
+        # A title index a version behind may name titles deleted since
+        for key in titles.search(text, limit=5):
+            if key in index.records and index.is_visible(key):
+                return index.records[key]
+        return None
+
+    def recommend_like(
+        self, record: MovieRecord, n: int = 10, filters: Optional[Filters] = None
+    ) -> List[Recommendation]:
+        """Titles most similar to `record`, scored with it as the only seed.
+
+        Read from the precomputed neighbour list when enough of it survives
+        the watched and filter pool; otherwise (or when summary or co-watch
+        similarity is on, which the lists leave out) ranked from scratch.
+        """
+        catalog = self.index.catalog
+        bits = filters.bits(catalog) if filters else catalog.bitmaps().all
+        pool = self._pool(bits & ~(1 << record.seq))
+        profile = build_seed_profile([record])
+        extra = self._extra_scores([record])
+        if extra:
+            return self._rank(pool, *profile, n, extra)
+
+        picks = [
+            found
+            for _, found in neighbour_index(catalog).neighbours(catalog, record)
+            if found.seq in pool
+        ][:n]
+        if len(picks) < n:
+            return self._rank(pool, *profile, n)
+        results: List[Recommendation] = []
+        for found in picks:
+            bd = score_movie(found, *profile)
+            results.append(
+                self._recommendation(found, bd.total, bd, bd.explanations() or ["Library pick"])
+            )
+        return results
+
+
+def batch_size(catalog: Catalog) -> int:
+    """How many users recommend_many() scores per pass over this catalog."""
+    return max(1, _BATCH_CELLS // max(len(catalog.records), 1))
+
+
+def recommend_many(
+    indexes: List[MovieIndex], n: int = 10, seed_count: int = 5
+) -> List[List[Recommendation]]:
+    """recommend_from_history() for many users at once, in the same order.
+
+    With the vectorized engine, users sharing a catalog have their seed
+    profiles stacked and scored in one pass (FeatureMatrix.score_many); the
+    results are the same as calling recommend_from_history() per user.
+    Users without history, or in neighbours mode, are served one by one.
+    """
+    results: List[Optional[List[Recommendation]]] = [None] * len(indexes)
+    stacked: Dict[int, List[Tuple[int, Recommender, List[MovieRecord]]]] = {}
+    for i, index in enumerate(indexes):
+        recommender = Recommender(index)
+        seeds = recommender._history_seeds(seed_count)
+        if recommender._vectorized and seeds and config.RECOMMEND_HISTORY_MODE == "profile":
+            stacked.setdefault(id(index.catalog), []).append((i, recommender, seeds))
+        else:
+            results[i] = recommender.recommend_from_history(n, seed_count)
+
+    for group in stacked.values():
+        catalog = group[0][1].index.catalog
+        matrix = vectorized.feature_matrix(catalog)
+        step = batch_size(catalog)
+        for start in range(0, len(group), step):
+            block = group[start:start + step]
+            total, genre, director, actor, decade = matrix.score_many(
+                [build_seed_profile(seeds) for _, _, seeds in block]
+            )
+            for j, (i, recommender, seeds) in enumerate(block):
+                pool = recommender._pool(catalog.bitmaps().all)
+                rows = matrix.rows_in(pool)
+                scores = total[j][rows]
+                seqs = matrix.seqs[rows]
+                extra = {
+                    name: values[seqs]
+                    for name, values in recommender._extra_scores(seeds).items()
+                }
+                for name in EXTRA_COMPONENTS:
+                    if name in extra:
+                        scores = scores + extra[name] * WEIGHTS[name]
+                # Select on totals first; gather the components for the winners only
+                top = vectorized.top_k(scores, n)
+                picked = rows[top]
+                recs = recommender._top_scored(
+                    matrix, picked,
+                    total[j][picked], genre[j][picked], director[j][picked],
+                    actor[j][picked], decade[j][picked],
+                    {name: values[top] for name, values in extra.items()}, n,
+                )
+                results[i] = recs or recommender._fallback_top_rated(n, pool)
+    return results
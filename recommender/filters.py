@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from plex.index import Catalog
+
+
+def match_genre(name: str, genres: Iterable[str]) -> Optional[str]:
+    """The catalog genre called `name`, else the first one containing it."""
+    name = name.lower()
+    genres = list(genres)
+    if name in genres:
+        return name
+    for genre in genres:
+        if name in genre:
+            return genre
+    return None
+
+
+def suggest_genres(text: str, genres: Iterable[str], limit: int = 25) -> List[str]:
+    """Genres starting with `text`, then genres containing it, each alphabetical."""
+    text = text.strip().lower()
+    prefix = sorted(g for g in genres if g.startswith(text))
+    inner = sorted(g for g in genres if text in g and not g.startswith(text))
+    return (prefix + inner)[:limit]
+
+
+def parse_decades(text: str) -> Optional[Tuple[int, ...]]:
+    """Parse "1990s", "90s" or "1995" (comma-separated) into decades; None if malformed."""
+    decades = []
+    for part in text.split(","):
+        part = part.strip().lower().removesuffix("s").lstrip("'")
+        if not part.isdigit():
+            return None
+        year = int(part)
+        if len(part) == 2:
+            year += 1900 if year >= 30 else 2000
+        elif len(part) != 4:
+            return None
+        decades.append(year // 10 * 10)
+    return tuple(decades)
+
+
+def split_genres(text: Optional[str]) -> Tuple[str, ...]:
+    return tuple(g.strip() for g in (text or "").split(",") if g.strip())
+
+
+@dataclass(frozen=True)
+class Filters:
+    """Optional constraints on the candidate pool, applied as bitmap ops."""
+    genres: Tuple[str, ...] = ()          # must have every one of these
+    exclude_genres: Tuple[str, ...] = ()  # must have none of these
+    decades: Tuple[int, ...] = ()         # any of these (e.g. 1990)
+    min_rating: Optional[int] = None      # whole points, audience rating else critic
+
+    def __bool__(self) -> bool:
+        return bool(self.genres or self.exclude_genres or self.decades or self.min_rating is not None)
+
+    def describe(self) -> str:
+        """Short human-readable summary, e.g. "comedy, 1990s, rated 7+, without horror"."""
+        parts = list(self.genres) + [f"{d}s" for d in self.decades]
+        if self.min_rating is not None:
+            parts.append(f"rated {self.min_rating}+")
+        parts += [f"without {g}" for g in self.exclude_genres]
+        return ", ".join(parts)
+
+    def bits(self, catalog: Catalog) -> int:
+        """Bitmap of the catalog records that pass every filter."""
+        bitmaps = catalog.bitmaps()
+        bits = bitmaps.all
+        for name in self.genres:
+            genre = match_genre(name, catalog.genre_index)
+            bits &= bitmaps.genre(genre) if genre else 0
+        for name in self.exclude_genres:
+            genre = match_genre(name, catalog.genre_index)
+            if genre:
+                bits &= ~bitmaps.genre(genre)
+        if self.decades:
+            any_decade = 0
+            for decade in self.decades:
+                any_decade |= bitmaps.decade(decade // 10 * 10)
+            bits &= any_decade
+        if self.min_rating is not None:
+            bits &= bitmaps.min_rating(self.min_rating)
+        return bits
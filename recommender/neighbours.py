@@ -0,0 +1,289 @@
+"""Precomputed item-to-item neighbour lists.
+
+For every title, the K titles that score highest against it under the
+scorer (with that title as the only seed), best first, ties in catalog
+order. Only titles sharing a feature (score > 0) are listed, so a list
+shorter than K holds every title that scores at all.
+
+Lists are user-independent: callers drop watched or filtered titles
+themselves. With numpy available (and up to _EAGER_LIMIT titles) the whole
+catalog is computed in blocks on a worker thread after each build, and again
+once deltas have left more than _MAX_PATCH titles to catch up on; otherwise
+each list is computed on first use. Titles added by delta refreshes are merged into existing lists, and a
+list naming a removed or replaced title is recomputed when next read.
+
+One NeighbourIndex serves a catalog and its patched copies (Catalog.derived).
+Rankings read it from several worker threads at once, so its lists are
+only touched under its lock, and a ranking still on an older copy reads
+them without changing them.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from array import array
+from typing import Dict, List, Set, Tuple
+
+import config
+from plex.bitmaps import Bitset, mask_bits
+from plex.index import Catalog, MovieRecord
+from recommender import vectorized
+from recommender.candidates import top_candidates
+from recommender.scorer import WEIGHTS, build_seed_profile, score_movie
+from utils.workers import run_cpu
+
+log = logging.getLogger(__name__)
+
+# The bulk build is quadratic: ~4s at 10k titles, ~13s at 20k. Larger
+# libraries compute lists lazily instead (a few ms each).
+_EAGER_LIMIT = 20_000
+_BLOCK_CELLS = 1 << 21  # seed × title scores held at once by the bulk build (16 MiB of floats)
+# More new titles than this in one sync and the lists are rebuilt instead of patched
+_MAX_PATCH = 64
+
+# (neighbour seqs, scores), best first
+NeighbourList = Tuple[array, array]
+
+
+def _use_numpy() -> bool:
+    return vectorized.AVAILABLE and config.RECOMMENDER_ENGINE != "python"
+
+
+def _compute_one(catalog: Catalog, record: MovieRecord, k: int) -> NeighbourList:
+    profile = build_seed_profile([record])
+    pool = Bitset(catalog.bitmaps().all & ~(1 << record.seq))
+    seqs, scores = array("I"), array("d")
+    if _use_numpy():
+        matrix = vectorized.feature_matrix(catalog)
+        rows = matrix.rows_in(pool)
+        total = matrix.score(rows, *profile)[0]
+        for i in vectorized.top_k(total, k):
+            if total[i] > 0:
+                seqs.append(int(matrix.seqs[rows[i]]))
+                scores.append(float(total[i]))
+    else:
+        for score, found, _ in top_candidates(catalog, pool, *profile, k):
+            if score > 0:
+                seqs.append(found.seq)
+                scores.append(score)
+    return seqs, scores
+
+
+def _compute_all(matrix: "vectorized.FeatureMatrix", k: int) -> Dict[int, NeighbourList]:
+    """Every row's neighbour list, a block of seed rows at a time; runs on a worker thread.
+
+    Genre and decade scores are dense products over the block; director and
+    actor scores are sparse, so they are only worked out where a seed shares
+    crew or cast. Same formulas and operation order as FeatureMatrix.score()
+    (adding a zero is exact), so the scores equal score_movie()'s exactly.
+    """
+    np = vectorized.np
+    n = len(matrix.keys)
+    genres_t = matrix.genres.T
+    genre_counts = matrix.genres.sum(axis=1)
+    directors_t = matrix.directors.T.tocsr()
+    actors_t = matrix.actors.T.tocsr()
+    actor_counts = matrix.actor_counts
+
+    # Decade score by (seed decade, candidate decade), looked up rather than recomputed
+    levels, level_of = np.unique(matrix.decades, return_inverse=True)
+    level_of = level_of.ravel()
+    diff = np.abs(levels[:, None] - levels[None, :]) // 10
+    dated = levels != vectorized.NO_DECADE
+    near = dated[:, None] & dated[None, :] & (diff < 3)
+    decade_table = np.where(near, 1.0 - diff / 3.0, 0.0)
+
+    lists: Dict[int, NeighbourList] = {}
+    step = max(1, _BLOCK_CELLS // max(n, 1))
+    for start in range(0, n, step):
+        block = np.arange(start, min(n, start + step))
+        size = len(block)
+
+        counts = genre_counts[block][:, None]
+        genre = np.divide(
+            matrix.genres[block] @ genres_t, counts,
+            out=np.zeros((size, n)), where=counts > 0,
+        )
+        decade = decade_table[level_of[block]][:, level_of]
+        total = genre * WEIGHTS["genre"] + decade * WEIGHTS["decade"]
+
+        # Cells where the seed shares a director or an actor get the full formula
+        directors = (matrix.directors[block] @ directors_t).tocoo()
+        actors = (matrix.actors[block] @ actors_t).tocoo()
+        director_cells = directors.row.astype(np.int64) * n + directors.col
+        actor_cells = actors.row.astype(np.int64) * n + actors.col
+        cells = np.union1d(director_cells, actor_cells)
+        if len(cells):
+            r, c = np.divmod(cells, n)
+            director = np.zeros(len(cells))
+            director[np.searchsorted(cells, director_cells)] = 1.0
+            shared = np.zeros(len(cells))
+            shared[np.searchsorted(cells, actor_cells)] = actors.data
+            smaller = np.minimum(actor_counts[c], actor_counts[block[r]])
+            actor = np.divide(shared, smaller, out=np.zeros(len(cells)), where=smaller > 0)
+            total[r, c] = (
+                genre[r, c] * WEIGHTS["genre"]
+                + director * WEIGHTS["director"]
+                + actor * WEIGHTS["actor"]
+                + decade[r, c] * WEIGHTS["decade"]
+            )
+        total[np.arange(size), block] = 0.0  # a title is not its own neighbour
+
+        # Per row: everything at or above the k-th best score, then an exact
+        # (score desc, catalog order) sort of just those
+        if k < n:
+            kth = np.partition(total, n - k, axis=1)[:, n - k]
+        else:
+            kth = np.zeros(size)
+        r, c = np.nonzero((total >= kth[:, None]) & (total > 0))
+        scores = total[r, c]
+        order = np.lexsort((c, -scores, r))
+        r, c, scores = r[order], c[order], scores[order]
+        rank = np.arange(len(r)) - np.searchsorted(r, r)
+        keep = rank < k
+        r, c, scores = r[keep], c[keep], scores[keep]
+        bounds = np.searchsorted(r, np.arange(size + 1))
+        for i, row in enumerate(block):
+            lo, hi = bounds[i], bounds[i + 1]
+            lists[int(matrix.seqs[row])] = (
+                array("I", matrix.seqs[c[lo:hi]].tolist()),
+                array("d", scores[lo:hi].tolist()),
+            )
+    return lists
+
+
+class NeighbourIndex:
+    """Top-k neighbour lists for one catalog, keyed by record seq."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._lists: Dict[int, NeighbourList] = {}
+        self._synced_seq = -1  # every record up to this seq is reflected in _lists
+        self._synced_version = -1
+        self._synced_count = 0  # titles in the catalog at the last sync
+        # Catalog version the lists were bulk-built at (-1: never, or since dropped),
+        # and titles removed or replaced since, whose lists are recomputed lazily
+        self._built_version = -1
+        self._dropped = 0
+        self._warming = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+    def _insert(self, catalog: Catalog, record: MovieRecord) -> None:
+        """Merge a newly added title into the lists it now belongs in."""
+        # Only titles sharing a feature with it can score it above zero
+        sharing: Set[str] = set()
+        names = catalog.genre_vocab.names
+        for genre_id in mask_bits(record.genre_mask):
+            sharing.update(catalog.genre_index.get(names[genre_id], ()))
+        for director in record.directors:
+            sharing.update(catalog.director_index.get(director, ()))
+        for actor in record.actors:
+            sharing.update(catalog.actor_index.get(actor, ()))
+        if record.decade is not None:
+            for decade, keys in catalog.decade_index.items():
+                if abs(decade - record.decade) // 10 < 3:
+                    sharing.update(keys)
+        sharing.discard(record.rating_key)
+
+        for key in sharing:
+            other = catalog.records[key]
+            current = self._lists.get(other.seq)
+            if current is None:
+                continue
+            seqs, scores = current
+            score = score_movie(record, *build_seed_profile([other])).total
+            full = len(seqs) >= self.k
+            # The newest title has the highest seq, so it loses every tie
+            if score <= 0 or (full and score <= scores[-1]):
+                continue
+            at = next((i for i, s in enumerate(scores) if score > s), len(scores))
+            seqs.insert(at, record.seq)
+            scores.insert(at, score)
+            if full:
+                seqs.pop()
+                scores.pop()
+
+    def sync(self, catalog: Catalog) -> None:
+        """Fold in titles added since the last sync; call with the lock held."""
+        if catalog.version <= self._synced_version:
+            return
+        fresh: List[MovieRecord] = []
+        # Records are in seq order, so the new ones are at the end
+        for record in reversed(catalog.records.values()):
+            if record.seq <= self._synced_seq:
+                break
+            fresh.append(record)
+        if len(fresh) > _MAX_PATCH:
+            self._lists.clear()  # cheaper to recompute (lazily, or by the next warm)
+            self._built_version = -1
+        elif self._lists:
+            for record in reversed(fresh):
+                self._insert(catalog, record)
+        self._dropped += max(0, self._synced_count + len(fresh) - len(catalog.records))
+        self._synced_seq = catalog.last_seq
+        self._synced_version = catalog.version
+        self._synced_count = len(catalog.records)
+
+    def neighbours(self, catalog: Catalog, record: MovieRecord) -> List[Tuple[float, MovieRecord]]:
+        """(score, record) pairs most similar to `record`, best first."""
+        with self._lock:
+            self.sync(catalog)
+            current = self._lists.get(record.seq)
+            if current is not None:
+                seqs, scores = current
+                found = [catalog.record_at(seq) for seq in seqs]
+                if None not in found:
+                    return list(zip(scores, found))
+        # Never computed, or names a title that has since gone (or is newer than `catalog`)
+        seqs, scores = computed = _compute_one(catalog, record, self.k)
+        with self._lock:
+            # A list computed from an older copy may lack titles already folded in
+            if catalog.version == self._synced_version:
+                self._lists[record.seq] = computed
+        return [(score, catalog.record_at(seq)) for seq, score in zip(seqs, scores)]
+
+    async def warm(self, catalog: Catalog) -> None:
+        """Compute every list on a worker thread; otherwise lists stay lazy.
+
+        Runs after the first build, and again once a big delta dropped the
+        lists or more than _MAX_PATCH titles were removed or replaced since
+        (each of those leaves lists to recompute one by one).
+        """
+        if not _use_numpy() or len(catalog.records) > _EAGER_LIMIT or self._warming:
+            return
+        with self._lock:
+            self.sync(catalog)
+            if self._built_version >= 0 and self._dropped <= _MAX_PATCH:
+                return
+        self._warming = True
+        try:
+            matrix = vectorized.feature_matrix(catalog)
+            # numpy releases the GIL, so a thread keeps the loop as free as a process would
+            lists = await run_cpu(_compute_all, matrix, self.k)
+        finally:
+            self._warming = False
+        with self._lock:
+            # Copies patched in meanwhile are folded in by the next sync()
+            self._lists = lists
+            self._synced_seq = catalog.last_seq
+            self._synced_version = catalog.version
+            self._synced_count = len(catalog.records)
+            self._built_version = catalog.version
+            self._dropped = 0
+        log.info("Computed neighbour lists for %d titles.", len(lists))
+
+
+def neighbour_index(catalog: Catalog) -> NeighbourIndex:
+    index = catalog.derived.get("neighbours")
+    if index is None:
+        # setdefault, so two threads racing here end up with the same index
+        index = catalog.derived.setdefault("neighbours", NeighbourIndex(config.NEIGHBOURS_K))
+    return index
+
+
+async def warm_neighbours(catalog: Catalog) -> None:
+    """Precompute the catalog's neighbour lists (see recommender.engine.warm_indexes)."""
+    await neighbour_index(catalog).warm(catalog)
@@ -2,8 +2,9 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from statistics import median
-from typing import FrozenSet, List, Optional
+from typing import FrozenSet, List, Optional, Sequence
 
+import config
 from plex.index import MovieRecord
 
 WEIGHTS = {
@@ -11,8 +12,16 @@ WEIGHTS = {
     "director": 0.25,
     "actor": 0.20,
     "decade": 0.15,
+    # Optional TF-IDF title/summary similarity (recommender.text); 0 turns it off
+    "summary": config.SUMMARY_WEIGHT,
+    # Optional co-watch similarity from other users' histories (recommender.cowatch)
+    "cowatch": config.COWATCH_WEIGHT,
 }
 
+# Components scored outside score_movie(), passed around as per-seq score
+# arrays; added to totals last and in this order
+EXTRA_COMPONENTS = ("summary", "cowatch")
+
 
 @dataclass
 class ScoreBreakdown:
@@ -20,6 +29,8 @@ class ScoreBreakdown:
     director: float = 0.0
     actor: float = 0.0
     decade: float = 0.0
+    summary: float = 0.0
+    cowatch: float = 0.0
 
     @property
     def total(self) -> float:
@@ -28,6 +39,8 @@ class ScoreBreakdown:
             + self.director * WEIGHTS["director"]
             + self.actor * WEIGHTS["actor"]
             + self.decade * WEIGHTS["decade"]
+            + self.summary * WEIGHTS["summary"]
+            + self.cowatch * WEIGHTS["cowatch"]
         )
 
     def explanations(self) -> List[str]:
@@ -40,32 +53,34 @@ class ScoreBreakdown:
             parts.append(f"Cast overlap: {self.actor:.0%}")
         if self.decade > 0:
             parts.append(f"Era similarity: {self.decade:.0%}")
+        if self.summary > 0:
+            parts.append(f"Similar plot: {self.summary:.0%}")
+        if self.cowatch > 0:
+            parts.append(f"Often watched together: {self.cowatch:.0%}")
         return parts
 
 
-def score_genre(
-    candidate_genres: FrozenSet[str], seed_genres: FrozenSet[str]
-) -> float:
-    if not seed_genres:
+def score_genre(candidate_mask: int, seed_mask: int) -> float:
+    if not seed_mask:
         return 0.0
-    intersection = len(candidate_genres & seed_genres)
-    return intersection / len(seed_genres)
+    intersection = (candidate_mask & seed_mask).bit_count()
+    return intersection / seed_mask.bit_count()
 
 
 def score_director(
-    candidate_directors: FrozenSet[str], seed_directors: FrozenSet[str]
+    candidate_directors: Sequence[int], seed_directors: FrozenSet[int]
 ) -> float:
     if not seed_directors:
         return 0.0
-    return 1.0 if candidate_directors & seed_directors else 0.0
+    return 0.0 if seed_directors.isdisjoint(candidate_directors) else 1.0
 
 
 def score_actor(
-    candidate_actors: FrozenSet[str], seed_actors: FrozenSet[str]
+    candidate_actors: Sequence[int], seed_actors: FrozenSet[int]
 ) -> float:
     if not seed_actors or not candidate_actors:
         return 0.0
-    intersection = len(candidate_actors & seed_actors)
+    intersection = len(seed_actors.intersection(candidate_actors))
     min_size = min(len(candidate_actors), len(seed_actors))
     return intersection / min_size
 
@@ -82,24 +97,26 @@ def score_decade(
 
 
 def build_seed_profile(seeds: List[MovieRecord]):
-    """Merge seed fields into union sets and median decade."""
-    genres: FrozenSet[str] = frozenset().union(*(s.genres for s in seeds))
-    directors: FrozenSet[str] = frozenset().union(*(s.directors for s in seeds))
-    actors: FrozenSet[str] = frozenset().union(*(s.actors for s in seeds))
+    """Merge seed fields into a genre mask, id union sets and median decade."""
+    genre_mask = 0
+    for s in seeds:
+        genre_mask |= s.genre_mask
+    directors: FrozenSet[int] = frozenset().union(*(s.directors for s in seeds))
+    actors: FrozenSet[int] = frozenset().union(*(s.actors for s in seeds))
     decades = [s.decade for s in seeds if s.decade is not None]
     seed_decade: Optional[int] = int(median(decades)) if decades else None
-    return genres, directors, actors, seed_decade
+    return genre_mask, directors, actors, seed_decade
 
 
 def score_movie(
     candidate: MovieRecord,
-    seed_genres: FrozenSet[str],
-    seed_directors: FrozenSet[str],
-    seed_actors: FrozenSet[str],
+    seed_genres: int,
+    seed_directors: FrozenSet[int],
+    seed_actors: FrozenSet[int],
     seed_decade: Optional[int],
 ) -> ScoreBreakdown:
     return ScoreBreakdown(
-        genre=score_genre(candidate.genres, seed_genres),
+        genre=score_genre(candidate.genre_mask, seed_genres),
         director=score_director(candidate.directors, seed_directors),
         actor=score_actor(candidate.actors, seed_actors),
         decade=score_decade(candidate.decade, seed_decade),
@@ -0,0 +1,130 @@
+"""TF-IDF similarity over titles and summaries.
+
+Each record's title and summary become one L2-normalized TF-IDF row of a
+sparse matrix; a seed profile is the normalized sum of its seeds' rows, and
+its cosine similarity to every record is one sparse matrix-vector product.
+Everything is computed locally from catalog text. Requires numpy and scipy;
+AVAILABLE is False without them and the summary score stays at zero.
+"""
+from __future__ import annotations
+
+import logging
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+except ImportError:  # optional dependency
+    np = None
+    csr_matrix = None
+
+from plex.index import Catalog
+from plex.search import normalize
+from utils.workers import run_process
+
+log = logging.getLogger(__name__)
+
+AVAILABLE = np is not None
+
+_MIN_LENGTH = 3
+_STOP_WORDS = frozenset("""
+    about after again against all also among and another any are around away back
+    because been before being between both but can cannot could did does doing down
+    during each even ever every for from get gets had has have having her here hers
+    herself him himself his how into its itself just more most much must not now off
+    once one only other others our out over own same she should since some still such
+    than that the their them themselves then there these they this those through too
+    two under until very was way were what when where which while who whom whose why
+    will with within without would yet you your
+""".split())
+
+
+def _tokens(text: str) -> List[str]:
+    return [
+        word for word in normalize(text).split()
+        if len(word) >= _MIN_LENGTH and not word.isdigit() and word not in _STOP_WORDS
+    ]
+
+
+class TextIndex:
+    """Sparse TF-IDF rows for (seq, title, summary) rows; built in a worker process."""
+
+    def __init__(self, rows: Iterable[Tuple[int, str, str]], version: int):
+        self.version = version
+        seqs: List[int] = []
+        docs: List[Counter] = []
+        df: Counter = Counter()
+        for seq, title, summary in rows:
+            counts = Counter(_tokens(title))
+            counts.update(_tokens(summary))
+            seqs.append(seq)
+            docs.append(counts)
+            df.update(counts.keys())
+
+        # A term only one record uses cannot make two records similar
+        n = len(docs)
+        vocab = {term: i for i, term in enumerate(t for t, count in df.items() if count > 1)}
+        idf = [0.0] * len(vocab)
+        for term, i in vocab.items():
+            idf[i] = math.log((1 + n) / (1 + df[term])) + 1.0
+
+        indptr, indices, data = [0], [], []
+        for counts in docs:
+            row = [(vocab[t], (1.0 + math.log(c)) * idf[vocab[t]]) for t, c in counts.items() if t in vocab]
+            norm = math.sqrt(sum(w * w for _, w in row)) or 1.0
+            row.sort()
+            indices.extend(i for i, _ in row)
+            data.extend(w / norm for _, w in row)
+            indptr.append(len(indices))
+
+        self.seqs = np.asarray(seqs, dtype=np.int64)
+        self._rows: Dict[int, int] = {seq: row for row, seq in enumerate(seqs)}
+        self.matrix = csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+            shape=(n, len(vocab)),
+        )
+
+    def similarity(self, seed_seqs: Iterable[int], size: int) -> Optional["np.ndarray"]:
+        """Cosine similarity of every record to the seeds' combined text, indexed by seq.
+
+        `size` is the length of the result (catalog.last_seq + 1); records
+        the index does not know score zero. None if no seed has any text.
+        """
+        rows = [self._rows[seq] for seq in seed_seqs if seq in self._rows]
+        if not rows:
+            return None
+        query = np.asarray(self.matrix[rows].sum(axis=0)).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        scores = np.zeros(size)
+        known = self.seqs < size
+        scores[self.seqs[known]] = (self.matrix @ (query / norm))[known]
+        return scores
+
+
+def latest_text_index(catalog: Catalog) -> Optional[TextIndex]:
+    """The newest TextIndex built for `catalog` or its patched copies; never builds.
+
+    It may be a version behind (or ahead of) `catalog`; scores are by seq.
+    """
+    return catalog.derived.get("text")
+
+
+async def warm_text_index(catalog: Catalog) -> None:
+    """Build the catalog's TextIndex for its current version in a worker process."""
+    if not AVAILABLE:
+        return
+    current = latest_text_index(catalog)
+    if current is not None and current.version == catalog.version:
+        return
+    version = catalog.version
+    rows = [(r.seq, r.title, r.summary) for r in catalog.records.values()]
+    index = await run_process(TextIndex, rows, version)
+    current = latest_text_index(catalog)
+    if current is not None and current.version >= version:
+        return
+    catalog.derived["text"] = index
+    log.info("Built summary index: %d titles, %d terms.", len(rows), index.matrix.shape[1])
@@ -0,0 +1,230 @@
+"""Batched scoring over a sparse item×feature matrix.
+
+Computes exactly what recommender.scorer.score_movie computes, for every
+candidate at once. Requires numpy and scipy; AVAILABLE is False without them
+and the Recommender falls back to the per-record scorer.
+"""
+from __future__ import annotations
+
+import weakref
+from array import array
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+except ImportError:  # optional dependency
+    np = None
+    csr_matrix = None
+
+from plex.bitmaps import Bitset, mask_bits
+from plex.index import Catalog
+from recommender.scorer import WEIGHTS
+
+AVAILABLE = np is not None
+
+NO_DECADE = -1  # decades are non-negative years
+
+
+class FeatureMatrix:
+    """Catalog records as rows of genre, director, actor and decade features."""
+
+    def __init__(self, catalog: Catalog):
+        self.version = catalog.version
+        self.keys: List[str] = list(catalog.records)
+        n = len(self.keys)
+        records = catalog.records.values()
+
+        genre_rows, genre_cols = array("I"), array("I")
+        director_ptr, director_cols = array("q", [0]), array("I")
+        actor_ptr, actor_cols = array("q", [0]), array("I")
+        decades, seqs = array("q"), array("q")
+        for row, record in enumerate(records):
+            for bit in mask_bits(record.genre_mask):
+                genre_rows.append(row)
+                genre_cols.append(bit)
+            director_cols.extend(record.directors)
+            director_ptr.append(len(director_cols))
+            actor_cols.extend(record.actors)
+            actor_ptr.append(len(actor_cols))
+            decades.append(NO_DECADE if record.decade is None else record.decade)
+            seqs.append(record.seq)
+
+        def csr(ptr: array, cols: array, width: int):
+            cols = np.frombuffer(cols, dtype=np.uint32) if cols else np.zeros(0, np.uint32)
+            data = np.ones(len(cols), dtype=np.float64)
+            return csr_matrix((data, cols, np.frombuffer(ptr, dtype=np.int64)), shape=(n, width))
+
+        genres = np.zeros((n, len(catalog.genre_vocab)), dtype=np.float64)
+        if genre_rows:
+            genres[np.frombuffer(genre_rows, np.uint32), np.frombuffer(genre_cols, np.uint32)] = 1.0
+        self.genres = genres
+        self.directors = csr(director_ptr, director_cols, len(catalog.director_vocab))
+        self.actors = csr(actor_ptr, actor_cols, len(catalog.actor_vocab))
+        self.actor_counts = np.diff(self.actors.indptr).astype(np.float64)
+        self.decades = np.frombuffer(decades, dtype=np.int64) if decades else np.zeros(0, np.int64)
+        self.seqs = np.frombuffer(seqs, dtype=np.int64) if seqs else np.zeros(0, np.int64)
+
+    def rows_in(self, pool: Bitset) -> "np.ndarray":
+        """Row numbers (ascending, i.e. catalog order) of records whose seq is in `pool`."""
+        bits = np.unpackbits(np.frombuffer(pool.to_bytes(), dtype=np.uint8), bitorder="little")
+        inside = self.seqs < len(bits)
+        selected = np.zeros(len(self.seqs), dtype=bool)
+        selected[inside] = bits[self.seqs[inside]].astype(bool)
+        return np.flatnonzero(selected)
+
+    def score(
+        self,
+        rows: "np.ndarray",
+        seed_genres: int,
+        seed_directors: FrozenSet[int],
+        seed_actors: FrozenSet[int],
+        seed_decade: Optional[int],
+    ) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """(total, genre, director, actor, decade) score arrays for `rows`.
+
+        Each component is one product against a seed indicator vector over the
+        whole matrix, gathered down to `rows` afterwards.
+        """
+        m = len(rows)
+
+        seed_genre_count = seed_genres.bit_count()
+        if seed_genre_count:
+            seed = np.zeros(self.genres.shape[1])
+            seed[list(mask_bits(seed_genres))] = 1.0
+            genre = (self.genres @ seed)[rows] / seed_genre_count
+        else:
+            genre = np.zeros(m)
+
+        if seed_directors:
+            shared = (self.directors @ _indicator(seed_directors, self.directors.shape[1]))[rows]
+            director = (shared > 0).astype(np.float64)
+        else:
+            director = np.zeros(m)
+
+        actor = np.zeros(m)
+        if seed_actors:
+            shared = (self.actors @ _indicator(seed_actors, self.actors.shape[1]))[rows]
+            counts = self.actor_counts[rows]
+            cast = counts > 0
+            actor[cast] = shared[cast] / np.minimum(counts[cast], len(seed_actors))
+
+        decade = np.zeros(m)
+        if seed_decade is not None:
+            candidate = self.decades[rows]
+            diff = np.abs(candidate - seed_decade) // 10
+            near = (candidate != NO_DECADE) & (diff < 3)
+            decade[near] = 1.0 - diff[near] / 3.0
+
+        # Same operation order as ScoreBreakdown.total, so the floats match exactly
+        total = (
+            genre * WEIGHTS["genre"]
+            + director * WEIGHTS["director"]
+            + actor * WEIGHTS["actor"]
+            + decade * WEIGHTS["decade"]
+        )
+        return total, genre, director, actor, decade
+
+
+    def score_many(
+        self, profiles: List[Tuple[int, FrozenSet[int], FrozenSet[int], Optional[int]]]
+    ) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """score() for several seed profiles at once, over every row.
+
+        Returns (total, genre, director, actor, decade), each profiles × rows,
+        so one profile's scores are contiguous. Seeds are stacked into
+        indicator matrices, so each component is one matrix product; the
+        per-profile arithmetic is unchanged, so every row of the result equals
+        what score() gives for that profile.
+        """
+        n, m = len(self.keys), len(profiles)
+        genre_seeds = np.zeros((m, self.genres.shape[1]))
+        genre_counts = np.zeros(m)
+        actor_sizes = np.zeros(m)
+        seed_decades = np.full(m, NO_DECADE, dtype=np.int64)
+        director_ptr, director_cols = [0], []
+        actor_ptr, actor_cols = [0], []
+        for j, (seed_genres, seed_directors, seed_actors, seed_decade) in enumerate(profiles):
+            genre_seeds[j, list(mask_bits(seed_genres))] = 1.0
+            genre_counts[j] = seed_genres.bit_count()
+            director_cols.extend(seed_directors)
+            director_ptr.append(len(director_cols))
+            actor_cols.extend(seed_actors)
+            actor_ptr.append(len(actor_cols))
+            actor_sizes[j] = len(seed_actors)
+            if seed_decade is not None:
+                seed_decades[j] = seed_decade
+
+        def seeds(ptr, cols, width):
+            return csr_matrix((np.ones(len(cols)), cols, ptr), shape=(m, width))
+
+        counts = genre_counts[:, None]
+        genre = np.divide(
+            genre_seeds @ self.genres.T, counts,
+            out=np.zeros((m, n)), where=counts > 0,
+        )
+        # Decade score per (seed decade, row decade level), gathered out to rows
+        levels, level_of = np.unique(self.decades, return_inverse=True)
+        diff = np.abs(levels[None, :] - seed_decades[:, None]) // 10
+        near = (levels[None, :] != NO_DECADE) & (seed_decades[:, None] != NO_DECADE) & (diff < 3)
+        decade = np.where(near, 1.0 - diff / 3.0, 0.0)[:, level_of.ravel()]
+        # With no shared director or actor those terms add exact zeros
+        total = genre * WEIGHTS["genre"] + decade * WEIGHTS["decade"]
+
+        # Director and actor overlap is sparse: fill in just those cells
+        director = np.zeros((m, n))
+        directors = (seeds(director_ptr, director_cols, self.directors.shape[1]) @ self.directors.T).tocoo()
+        director[directors.row, directors.col] = 1.0
+        actor = np.zeros((m, n))
+        actors = (seeds(actor_ptr, actor_cols, self.actors.shape[1]) @ self.actors.T).tocoo()
+        smaller = np.minimum(self.actor_counts[actors.col], actor_sizes[actors.row])
+        actor[actors.row, actors.col] = actors.data / smaller
+        r = np.concatenate((directors.row, actors.row))
+        c = np.concatenate((directors.col, actors.col))
+        total[r, c] = (
+            genre[r, c] * WEIGHTS["genre"]
+            + director[r, c] * WEIGHTS["director"]
+            + actor[r, c] * WEIGHTS["actor"]
+            + decade[r, c] * WEIGHTS["decade"]
+        )
+        return total, genre, director, actor, decade
+
+
+def top_k(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """Indices of the k highest scores, best first; equal scores keep index order.
+
+    Selects with a partition rather than sorting everything, then orders only
+    the k winners. Ties at the cut-off go to the lowest indices, so the result
+    matches a stable full sort truncated to k.
+    """
+    n = len(scores)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[: k - len(above)]
+    picked = np.concatenate((above, tied))
+    return picked[np.argsort(-scores[picked], kind="stable")]
+
+
+def _indicator(ids: FrozenSet[int], width: int) -> "np.ndarray":
+    # Seed ids are interned in the same catalog, so they are all < width
+    vec = np.zeros(width, dtype=np.float64)
+    vec[np.fromiter(ids, dtype=np.int64, count=len(ids))] = 1.0
+    return vec
+
+
+# id(catalog) → (catalog ref, matrix); rebuilt whenever catalog.version moves
+_matrices: Dict[int, Tuple[weakref.ref, FeatureMatrix]] = {}
+
+
+def feature_matrix(catalog: Catalog) -> FeatureMatrix:
+    cached = _matrices.get(id(catalog))
+    if cached is not None and cached[0]() is catalog and cached[1].version == catalog.version:
+        return cached[1]
+    matrix = FeatureMatrix(catalog)
+    key = id(catalog)
+    _matrices[key] = (weakref.ref(catalog, lambda _: _matrices.pop(key, None)), matrix)
+    return matrix
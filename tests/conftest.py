@@ -0,0 +1,8 @@
+import os
+import sys
+
+# config.py refuses to import without these; tests never reach Discord or Plex
+os.environ.setdefault("DISCORD_TOKEN", "test")
+os.environ.setdefault("PLEX_URL", "http://plex.invalid:32400")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,95 @@
+"""IndexCache syncs through the right connection and blames the right token."""
+import asyncio
+
+from plexapi.exceptions import Unauthorized
+
+import plex.cache as cache_module
+from plex.cache import IndexCache
+from plex.index import Catalog, WatchOverlay
+
+
+class FakeConnection:
+    def __init__(self, token: str):
+        self._token = token
+
+
+ADMIN = FakeConnection("admin")
+USER = FakeConnection("user")
+
+
+def _patch(monkeypatch, forgotten):
+    async def get_admin_server():
+        return ADMIN
+
+    async def get_server(discord_id, plex_token):
+        return USER
+
+    async def forget_server(discord_id):
+        forgotten.append(discord_id)
+
+    async def nothing(*args):
+        return None
+
+    monkeypatch.setattr(cache_module, "get_admin_server", get_admin_server)
+    monkeypatch.setattr(cache_module, "get_server", get_server)
+    monkeypatch.setattr(cache_module, "forget_server", forget_server)
+    monkeypatch.setattr(cache_module, "load_overlay_snapshot", nothing)
+    monkeypatch.setattr(cache_module, "visible_keys", nothing)
+
+
+async def _build_catalog(server, library_name):
+    if server is ADMIN:
+        raise Unauthorized("401")
+    return Catalog(section_key="1", records={}, genre_index={})
+
+
+async def _build_overlay(server, section_key):
+    return WatchOverlay([])
+
+
+async def _never(*args):
+    raise AssertionError("no refresh expected")
+
+
+def test_rejected_admin_token_falls_back_to_user(monkeypatch):
+    forgotten = []
+    _patch(monkeypatch, forgotten)
+    cache = IndexCache(
+        "Movies",
+        build_catalog=_build_catalog, refresh_catalog=_never,
+        build_overlay=_build_overlay, refresh_overlay=_never,
+    )
+
+    index = asyncio.run(cache.get_index("42", "token"))
+
+    assert index.catalog.section_key == "1"
+    assert forgotten == []
+
+
+def test_library_changes_coalesce_into_one_refresh(monkeypatch):
+    monkeypatch.setattr(cache_module, "_CHANGE_QUIET", 0.05)
+    cache = IndexCache(
+        "Movies",
+        build_catalog=_never, refresh_catalog=_never,
+        build_overlay=_never, refresh_overlay=_never,
+    )
+    refreshed = []
+
+    async def refresh(discord_id, within=0.0):
+        refreshed.append(discord_id)
+
+    cache.refresh = refresh
+
+    async def run():
+        cache._catalog = cache_module._CatalogEntry(
+            built=0.0, checked=0.0, catalog=Catalog(section_key="1", records={}, genre_index={})
+        )
+        cache._active = {"1": ("t", 0.0), "2": ("t", 0.0)}
+        for _ in range(50):
+            cache.apply_changed()
+            await asyncio.sleep(0.001)
+        assert refreshed == []
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert refreshed == ["1"]
@@ -0,0 +1,65 @@
+"""Pruned candidate generation returns what scoring every title would."""
+import random
+
+import pytest
+
+from plex.bitmaps import Bitset
+from plex.index import Catalog, RawRecord
+from recommender import candidates
+from recommender.candidates import top_candidates
+from recommender.cowatch import SparseScores
+from recommender.scorer import WEIGHTS, build_seed_profile, score_movie
+
+
+def _catalog(rng: random.Random, n: int) -> Catalog:
+    catalog = Catalog(section_key="1", records={}, genre_index={})
+    for i in range(n):
+        catalog.add(RawRecord(
+            rating_key=str(i), title=f"Movie {i}", year=rng.randrange(1950, 2020),
+            genres=tuple(rng.sample(["drama", "comedy", "horror", "action", "war"], 2)),
+            directors=(f"d{rng.randrange(20)}",),
+            actors=tuple(f"a{rng.randrange(60)}" for _ in range(3)),
+            rating=None, audience_rating=None,
+        ))
+    return catalog
+
+
+def _brute_force(catalog, pool, profile, extra, n):
+    scored = []
+    for record in catalog.records.values():
+        if record.seq not in pool:
+            continue
+        bd = score_movie(record, *profile)
+        for name, scores in extra.items():
+            setattr(bd, name, float(scores[record.seq]))
+        scored.append((bd.total, record.rating_key))
+    scored.sort(key=lambda s: -s[0])  # stable: ties keep catalog order
+    return scored[:n]
+
+
+@pytest.mark.parametrize("kind", ["numpy", "list", "sparse"])
+def test_extra_scores_match_brute_force(monkeypatch, kind):
+    monkeypatch.setitem(WEIGHTS, "cowatch", 0.3)
+    rng = random.Random(3)
+    catalog = _catalog(rng, 300)
+    catalog = catalog.patched(removed=["5", "6"])  # scores may name removed seqs
+    if kind == "numpy" and candidates.np is None:
+        pytest.skip("numpy not installed")
+    if kind != "numpy":
+        monkeypatch.setattr(candidates, "np", None)
+    for _ in range(20):
+        seeds = [catalog.records[k] for k in rng.sample(sorted(catalog.records), 2)]
+        profile = build_seed_profile(seeds)
+        scores = SparseScores() if kind == "sparse" else [0.0] * (catalog.last_seq + 1)
+        for seq in rng.sample(range(catalog.last_seq + 1), 15):
+            scores[seq] = rng.random()
+        if kind == "numpy":
+            scores = candidates.np.array(scores)
+        pool = Bitset(catalog.bitmaps().all & ~sum(1 << s.seq for s in seeds))
+        extra = {"cowatch": scores}
+
+        top = top_candidates(catalog, pool, *profile, 10, extra)
+        got = [(score, record.rating_key) for score, record, _ in top]
+        expected = _brute_force(catalog, pool, profile, extra, 10)
+        assert [k for _, k in got] == [k for _, k in expected]
+        assert [s for s, _ in got] == pytest.approx([s for s, _ in expected])
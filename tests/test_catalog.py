@@ -0,0 +1,137 @@
+"""Catalog patches build a copy; rankings on the old catalog never see them."""
+import asyncio
+import time
+
+import pytest
+
+import plex.cache as cache_module
+from plex.cache import IndexCache, _CatalogEntry
+from plex.index import Catalog, RawRecord
+from recommender import vectorized
+from recommender.neighbours import _MAX_PATCH, neighbour_index
+
+
+def _raw(key: str, genre: str = "drama", actor: str = "A") -> RawRecord:
+    return RawRecord(
+        rating_key=key, title=f"Movie {key}", year=1999,
+        genres=(genre,), directors=(), actors=(actor,), rating=None, audience_rating=None,
+    )
+
+
+def _catalog(n: int) -> Catalog:
+    catalog = Catalog(section_key="1", records={}, genre_index={})
+    for i in range(n):
+        catalog.add(_raw(str(i)))
+    return catalog
+
+
+def test_patched_leaves_original_alone():
+    catalog = _catalog(5)
+    patched = catalog.patched([(_raw("9", genre="comedy", actor="B"), 100)], removed=["2"])
+
+    assert list(catalog.records) == ["0", "1", "2", "3", "4"]
+    assert catalog.genre_index == {"drama": ["0", "1", "2", "3", "4"]}
+    assert "B" not in catalog.actor_vocab.ids
+    assert catalog.version == 0
+
+    assert list(patched.records) == ["0", "1", "3", "4", "9"]
+    assert patched.genre_index == {"drama": ["0", "1", "3", "4"], "comedy": ["9"]}
+    assert patched.records["9"].seq == catalog.last_seq + 1
+    assert patched.updated_at == 100
+    assert patched.version == 1
+    assert patched.derived is catalog.derived
+
+
+def test_patched_shares_untouched_structures():
+    catalog = Catalog(section_key="1", records={}, genre_index={})
+    for key, genre, actor in [("1", "drama", "A"), ("2", "comedy", "B"), ("3", "drama", "C")]:
+        catalog.add(_raw(key, genre, actor))
+    patched = catalog.patched(removed=["1"])
+
+    assert patched.genre_index["comedy"] is catalog.genre_index["comedy"]
+    assert patched.genre_index["drama"] is not catalog.genre_index["drama"]
+    assert catalog.genre_index["drama"] == ["1", "3"]
+    assert patched.actor_vocab is catalog.actor_vocab  # no new names to intern
+    assert catalog.patched([(_raw("4", actor="D"), 1)]).actor_vocab is not catalog.actor_vocab
+
+
+def test_title_index_ranks_like_catalog():
+    catalog = Catalog(section_key="1", records={}, genre_index={})
+    for key, rating, audience in [("1", 6.0, None), ("2", None, 8.5), ("3", 9.0, 7.0), ("4", None, None)]:
+        catalog.add(RawRecord(
+            rating_key=key, title=f"Movie {key}", year=1999, genres=(), directors=(), actors=(),
+            rating=rating, audience_rating=audience,
+        ))
+    patched = catalog.patched(removed=["2"])
+
+    assert catalog.build_titles().top_rated == catalog.top_rated() == ["2", "3", "1", "4"]
+    assert patched.build_titles().top_rated == patched.top_rated() == ["3", "1", "4"]
+
+
+def test_neighbours_follow_patched_copies():
+    catalog = _catalog(4)
+    old = catalog.records["0"]
+    assert [r.rating_key for _, r in neighbour_index(catalog).neighbours(catalog, old)] == ["1", "2", "3"]
+
+    patched = catalog.patched([(_raw("4"), 1)], removed=["1"])
+    index = neighbour_index(patched)
+    assert index is neighbour_index(catalog)
+    assert [r.rating_key for _, r in index.neighbours(patched, old)] == ["2", "3", "4"]
+    # A ranking still holding the old catalog gets its own titles back
+    assert [r.rating_key for _, r in index.neighbours(catalog, old)] == ["1", "2", "3"]
+
+
+@pytest.mark.skipif(not vectorized.AVAILABLE, reason="numpy/scipy not installed")
+def test_neighbours_rebuilt_after_many_removals():
+    catalog = _catalog(3 * _MAX_PATCH)
+    index = neighbour_index(catalog)
+    asyncio.run(index.warm(catalog))
+    assert len(index) == len(catalog.records)
+
+    few = catalog.patched(removed=["0"])
+    asyncio.run(index.warm(few))
+    assert index._built_version == catalog.version  # one removal is left to lazy reads
+
+    many = few.patched(removed=[str(i) for i in range(1, _MAX_PATCH + 2)])
+    asyncio.run(index.warm(many))
+    assert index._built_version == many.version
+    assert len(index) == len(many.records)
+
+
+async def _never(*args):
+    raise AssertionError("no Plex requests expected")
+
+
+def test_apply_deleted_swaps_in_a_copy(monkeypatch):
+    monkeypatch.setattr(cache_module, "_SNAPSHOT_DELAY", 0.05)
+    saved = []
+
+    async def run():
+        cache = IndexCache(
+            "Movies",
+            build_catalog=_never, refresh_catalog=_never,
+            build_overlay=_never, refresh_overlay=_never,
+        )
+
+        async def save_catalog(catalog):
+            saved.append(catalog)
+
+        cache._save_catalog = save_catalog
+        catalog = _catalog(3)
+        now = time.monotonic()
+        cache._catalog = _CatalogEntry(built=now, checked=now, catalog=catalog)
+        await cache.apply_deleted("1")
+        after_one = cache.peek_catalog()
+        # A burst: all but the first wait for the lock, and one patch applies them
+        await asyncio.gather(*(cache.apply_deleted(key) for key in ["0", "2", "1"]))
+        await asyncio.gather(*cache._tasks)
+        return catalog, after_one, cache.peek_catalog()
+
+    old, after_one, current = asyncio.run(run())
+    assert list(old.records) == ["0", "1", "2"]
+    assert list(after_one.records) == ["0", "2"]
+    assert after_one.version == old.version + 1
+    assert current.records == {}
+    assert current.version == after_one.version + 2
+    # Three patches, one snapshot of the newest catalog
+    assert len(saved) == 1 and saved[0] is current
@@ -0,0 +1,72 @@
+"""Incremental co-watch passes give the same lists as training from scratch."""
+import random
+from typing import Dict, List
+
+import pytest
+
+from plex.index import WatchOverlay
+from plex.snapshot import encode_overlay
+from recommender import cowatch
+from recommender.cowatch import CoWatchModel, _train_lists
+
+K = 50  # longer than any list, so ties broken by item id never truncate differently
+
+
+def _train(model: CoWatchModel, snapshots: Dict[str, List[str]], linked) -> None:
+    """One CoWatchTrainer.train() pass, minus the database and worker process."""
+    rows = [(d, encode_overlay(WatchOverlay(order)), "t") for d, order in snapshots.items()]
+    histories, affected, since, watchers = model.plan(linked, rows)
+    relevant = [h for h in histories.values() if not affected.isdisjoint(h)]
+    lists = _train_lists(relevant, list(affected), watchers, K)
+    model.apply(histories, affected, since, watchers, lists)
+
+
+def _lists(model: CoWatchModel) -> Dict[str, Dict[str, float]]:
+    # Item ids differ between models, and so does the order of tied titles
+    return {key: dict(model.neighbours(key)) for key in model.keys if model.neighbours(key)}
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(cowatch, "sparse", None)
+    elif cowatch.sparse is None:
+        pytest.skip("numpy/scipy not installed")
+    return request.param
+
+
+def test_incremental_counts_watchers_over_all_users(engine):
+    users = {"u1": ["X"], "u5": ["X", "Y"], "u6": ["X", "Y"], "w": ["Y"]}
+    model = CoWatchModel()
+    _train(model, users, set(users))
+    _train(model, {"u1": ["Z", "X"]}, set(users))
+
+    fresh = CoWatchModel()
+    _train(fresh, {**users, "u1": ["Z", "X"]}, set(users))
+    got, expected = _lists(model), _lists(fresh)
+    assert got.keys() == expected.keys()
+    for key, neighbours in expected.items():
+        assert got[key] == pytest.approx(neighbours)
+    # X and Y have three watchers each, two of them shared
+    assert _lists(model)["X"]["Y"] == pytest.approx(2 / 3)
+
+
+def test_incremental_matches_full_retrain(engine):
+    rng = random.Random(7)
+    titles = [f"t{i}" for i in range(30)]
+    users = {f"u{i}": rng.sample(titles, rng.randint(1, 12)) for i in range(25)}
+    model = CoWatchModel()
+    _train(model, users, set(users))
+    for _ in range(10):
+        changed = {d: rng.sample(titles, rng.randint(1, 12)) for d in rng.sample(sorted(users), 3)}
+        users.update(changed)
+        gone = rng.choice(sorted(users))
+        del users[gone]
+        _train(model, changed, set(users))
+
+        fresh = CoWatchModel()
+        _train(fresh, users, set(users))
+        got, expected = _lists(model), _lists(fresh)
+        assert got.keys() == expected.keys()
+        for key, neighbours in expected.items():
+            assert got[key] == pytest.approx(neighbours)
@@ -0,0 +1,70 @@
+"""A catalog build costs O(pages) Plex requests, never one per item."""
+import asyncio
+import math
+from typing import Dict, List, Tuple
+from xml.etree.ElementTree import Element, SubElement
+
+import pytest
+
+from plex.index import build_catalog
+from plex.stream import METADATA_BATCH, section_path
+
+SECTION = "1"
+
+
+def _item(key: int, full: bool) -> Element:
+    elem = Element("Video", ratingKey=str(key), title=f"Movie {key}", year="1999", type="movie")
+    SubElement(elem, "Genre", tag="Drama")
+    # Listings carry a truncated cast; only /library/metadata has all of it
+    for n in range(8 if full else 3):
+        SubElement(elem, "Role", tag=f"Actor {key}-{n}")
+    if full:
+        SubElement(elem, "Director", tag=f"Director {key}")
+    return elem
+
+
+class FakeServer:
+    """Stands in for a Plex connection; serves a movie section and counts requests."""
+
+    def __init__(self, size: int):
+        self._token = "token"
+        self.keys = list(range(1, size + 1))
+        self.requests: List[str] = []
+
+    async def fetch_container(self, path: str, params: Dict[str, object], convert) -> Tuple[list, int]:
+        self.requests.append(path)
+        if path == "/library/sections":
+            section = Element("Directory", key=SECTION, type="movie", title="Movies", updatedAt="1")
+            return [convert(section)], 1
+        if path == section_path(SECTION):
+            start = int(params["X-Plex-Container-Start"])
+            size = int(params["X-Plex-Container-Size"])
+            page = self.keys[start:start + size]
+            return [convert(_item(key, full=False)) for key in page], len(self.keys)
+        if path.startswith("/library/metadata/"):
+            keys = [int(k) for k in path.rsplit("/", 1)[1].split(",")]
+            return [convert(_item(key, full=True)) for key in keys], len(keys)
+        raise AssertionError(f"unexpected request {path}")
+
+
+@pytest.mark.parametrize("size", [1, METADATA_BATCH, 5 * METADATA_BATCH + 7])
+def test_build_requests_scale_with_pages(size):
+    server = FakeServer(size)
+    catalog = asyncio.run(build_catalog(server, "Movies"))
+
+    assert len(catalog.records) == size
+    batches = math.ceil(size / METADATA_BATCH)
+    # The section lookup, then one listing page and one metadata request per batch
+    assert len(server.requests) == 1 + 2 * batches
+    assert sum(p.startswith("/library/metadata/") for p in server.requests) == batches
+
+
+def test_build_reads_full_metadata():
+    server = FakeServer(3)
+    catalog = asyncio.run(build_catalog(server, "Movies"))
+
+    record = catalog.records["2"]
+    assert len(catalog.actors_of(record)) == 8
+    assert catalog.directors_of(record) == ["Director 2"]
+    assert catalog.genres_of(record) == ["drama"]
+    assert list(catalog.records) == ["1", "2", "3"]
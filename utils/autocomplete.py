@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from typing import AbstractSet, List, Optional
+
+from discord import app_commands
+
+from plex.index import Catalog
+from recommender.filters import suggest_genres
+
+# Discord's limits for autocomplete responses
+MAX_CHOICES = 25
+_MAX_LENGTH = 100
+
+
+def genre_choices(catalog: Optional[Catalog], current: str) -> List[app_commands.Choice[str]]:
+    """Complete the last comma-separated genre in `current`."""
+    if catalog is None:
+        return []
+    head, comma, tail = current.rpartition(",")
+    prefix = f"{head}{comma} " if comma else ""
+    choices = []
+    for genre in suggest_genres(tail, catalog.genre_index, MAX_CHOICES):
+        value = (prefix + genre).strip()
+        if len(value) <= _MAX_LENGTH:
+            choices.append(app_commands.Choice(name=value, value=value))
+    return choices
+
+
+def title_choices(
+    catalog: Optional[Catalog], current: str, visible: Optional[AbstractSet[str]] = None
+) -> List[app_commands.Choice[str]]:
+    """Titles matching `current`, valued by rating_key; top rated when empty.
+
+    With `visible`, only those rating_keys are offered (a user whose share
+    hides part of the library).
+    """
+    if catalog is None:
+        return []
+    # Built off-loop; sorting or searching the catalog here would stall the loop
+    titles = catalog.latest_titles()
+    if titles is None:
+        return []
+    keys = titles.search(current, 4 * MAX_CHOICES) if current.strip() else titles.top_rated
+    choices = []
+    for key in keys:
+        if len(choices) == MAX_CHOICES:
+            break
+        record = catalog.records.get(key)
+        if record is None:  # deleted since the title index was built
+            continue
+        if visible is not None and key not in visible:
+            continue
+        name = f"{record.title} ({record.year})" if record.year else record.title
+        choices.append(app_commands.Choice(name=name[:_MAX_LENGTH], value=key))
+    return choices
@@ -31,8 +31,8 @@ def build_series_embed(rec: Recommendation, rank: int) -> discord.Embed:
     elif show.rating:
         rating_str = f"⭐ {show.rating:.1f}/10"
 
-    genres_str = ", ".join(sorted(show.genres)).title() if show.genres else "Unknown"
-    top_cast = list(show.actors)[:3]
+    genres_str = ", ".join(sorted(rec.genres)).title() if rec.genres else "Unknown"
+    top_cast = rec.actors[:3]
     cast_str = ", ".join(top_cast) if top_cast else "Unknown"
 
     embed = discord.Embed(
@@ -50,8 +50,8 @@ def build_series_embed(rec: Recommendation, rank: int) -> discord.Embed:
         why = "\n".join(f"• {e}" for e in rec.explanation)
         embed.add_field(name="Why recommended", value=why, inline=False)
 
-    if show.thumb_url:
-        embed.set_thumbnail(url=show.thumb_url)
+    if rec.thumb_url:
+        embed.set_thumbnail(url=rec.thumb_url)
 
     embed.set_footer(text=f"Score: {rec.score:.2f}")
     return embed
@@ -70,9 +70,9 @@ def build_movie_embed(rec: Recommendation, rank: int) -> discord.Embed:
     elif movie.rating:
         rating_str = f"⭐ {movie.rating:.1f}/10"
 
-    genres_str = ", ".join(sorted(movie.genres)).title() if movie.genres else "Unknown"
-    directors_str = ", ".join(sorted(movie.directors)) if movie.directors else "Unknown"
-    top_cast = list(movie.actors)[:3]
+    genres_str = ", ".join(sorted(rec.genres)).title() if rec.genres else "Unknown"
+    directors_str = ", ".join(sorted(rec.directors)) if rec.directors else "Unknown"
+    top_cast = rec.actors[:3]
     cast_str = ", ".join(top_cast) if top_cast else "Unknown"
 
     embed = discord.Embed(
@@ -91,8 +91,8 @@ def build_movie_embed(rec: Recommendation, rank: int) -> discord.Embed:
         why = "\n".join(f"• {e}" for e in rec.explanation)
         embed.add_field(name="Why recommended", value=why, inline=False)
 
-    if movie.thumb_url:
-        embed.set_thumbnail(url=movie.thumb_url)
+    if rec.thumb_url:
+        embed.set_thumbnail(url=rec.thumb_url)
 
     embed.set_footer(text=f"Score: {rec.score:.2f}")
     return embed
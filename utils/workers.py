@@ -0,0 +1,156 @@
+"""Worker pools that keep CPU-bound work off the Discord event loop.
+
+Three pools, each sized from config:
+
+- run_cpu(): CPU_WORKERS threads, for work on shared in-memory state such
+  as a Catalog (ranking, catalog builds and patched copies, snapshot
+  coding), numpy-heavy work such as the neighbour lists (numpy and scipy
+  release the GIL) and jobs whose results are too large to pickle cheaply,
+  such as the title index.
+- run_process(): PROCESS_WORKERS spawned processes, for long pure-Python
+  jobs with compact picklable inputs and outputs (the TF-IDF index,
+  co-watch training). On a thread these would compete with the loop for
+  the GIL for seconds. Arguments and results are pickled on the calling
+  process's threads, and the loop stalls while that happens, so large
+  payloads belong on run_cpu().
+- the loop's default executor, IO_WORKERS threads, for blocking Plex and
+  HTTP calls (install_io_executor()).
+
+LoopLagMonitor measures how late the loop wakes a sleeping task, which is
+how long on-loop work kept everything else (heartbeats included) waiting.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+import config
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_cpu: Optional[ThreadPoolExecutor] = None
+_processes: Optional[ProcessPoolExecutor] = None
+
+
+def install_io_executor(loop: asyncio.AbstractEventLoop) -> None:
+    """Size the loop's default executor (blocking Plex calls) to IO_WORKERS threads."""
+    loop.set_default_executor(
+        ThreadPoolExecutor(max_workers=config.IO_WORKERS, thread_name_prefix="io")
+    )
+
+
+def _cpu_pool() -> ThreadPoolExecutor:
+    global _cpu
+    if _cpu is None:
+        _cpu = ThreadPoolExecutor(max_workers=config.CPU_WORKERS, thread_name_prefix="cpu")
+    return _cpu
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _processes
+    if _processes is None:
+        # spawn: forking a process with a running event loop and threads is unsafe
+        _processes = ProcessPoolExecutor(
+            max_workers=config.PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _processes
+
+
+async def run_cpu(fn: Callable[..., T], *args, **kwargs) -> T:
+    """fn(*args, **kwargs) on the CPU thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_pool(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_process(fn: Callable[..., T], *args) -> T:
+    """fn(*args) in a worker process; fn must be a module-level function or class."""
+    global _processes
+    loop = asyncio.get_running_loop()
+    pool = _process_pool()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start fresh ones next time
+        if _processes is pool:
+            _processes = None
+        raise
+
+
+def shutdown() -> None:
+    """Stop both pools without waiting for queued work."""
+    global _cpu, _processes
+    if _processes is not None:
+        _processes.shutdown(wait=False, cancel_futures=True)
+        _processes = None
+    if _cpu is not None:
+        _cpu.shutdown(wait=False, cancel_futures=True)
+        _cpu = None
+
+
+class LoopLagMonitor:
+    """Background task that samples event-loop lag and logs a summary.
+
+    Every `interval` seconds it sleeps and records how much later than asked
+    it woke. Every `report_every` seconds it logs the median, 95th
+    percentile and worst lag since the last report (at INFO if the worst
+    reached `warn_above` seconds, else DEBUG).
+    """
+
+    def __init__(self, *, interval: float = 0.1, report_every: float, warn_above: float = 0.1):
+        self._interval = interval
+        self._report_every = report_every
+        self._warn_above = warn_above
+        self._samples: Deque[float] = collections.deque(maxlen=max(1, int(report_every / interval)))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop_lag_monitor")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        reported = time.monotonic()
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            self._samples.append(max(0.0, now - started - self._interval))
+            if now - reported >= self._report_every:
+                self._report()
+                self._samples.clear()
+                reported = now
+
+    def stats(self) -> Dict[str, float]:
+        """p50, p95 and max lag in seconds over the samples since the last report."""
+        lags = sorted(self._samples)
+        if not lags:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "p50": lags[len(lags) // 2],
+            "p95": lags[min(len(lags) - 1, int(len(lags) * 0.95))],
+            "max": lags[-1],
+        }
+
+    def _report(self) -> None:
+        stats = self.stats()
+        level = logging.INFO if stats["max"] >= self._warn_above else logging.DEBUG
+        log.log(level, "Event loop lag over %d sample(s): p50 %.1fms, p95 %.1fms, max %.1fms.",
+                len(self._samples), stats["p50"] * 1e3, stats["p95"] * 1e3, stats["max"] * 1e3)